@@ -0,0 +1,237 @@
+# bench/run_bench.py
+# Storage/search benchmark suite. Writes one JSON result file per run so
+# numbers can be compared between commits on the same machine.
+#
+#   python3 bench/run_bench.py --sizes 1000,10000,100000 --out results.json
+#   python3 bench/run_bench.py --compare old.json new.json
+#   python3 bench/run_bench.py --codecs --sizes 1000,100000   (at-rest size and load time)
+import argparse, datetime, json, os, platform, random, shutil, statistics, subprocess, sys, tempfile, time
+from typing import Any, Callable, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from storage import Storage
+from search import matches, sort_entries
+import vaultgen
+
+SORT_MODES = ["A→Z", "Recently Added", "Recently Updated", "Most Used"]
+# (field, term) pairs: Any / base / custom field, with a common hit and a miss
+SEARCHES = [("Any", "git"), ("Any", "zzqx"), ("name", "prod"), ("website", ".io"),
+            ("username", "admin"), ("Category", "dev")]
+
+def _time(fn: Callable[[], Any], repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+def _result(size: int, name: str, times: List[float], ops: int = 1, **params) -> Dict[str, Any]:
+    med = statistics.median(times)
+    return {
+        "size": size, "name": name, "params": params, "ops": ops,
+        "times": times, "min": min(times), "median": med,
+        "per_op_us": med / ops * 1e6,
+    }
+
+def bench_size(n: int, workdir: str, repeat: int, seed: int, mutations: int,
+               storage_cfg: Dict[str, Any] | None = None) -> List[Dict[str, Any]]:
+    vault = os.path.join(workdir, f"vault_{n}.json")
+    config = os.path.join(workdir, "config.json")
+    # Long commit delay: measure in-memory mutation cost and the group commit separately
+    with open(config, "w", encoding="utf-8") as f:
+        json.dump({"storage": dict(storage_cfg or {}, write_behind=True, commit_delay_ms=3_600_000)}, f)
+    vaultgen.write_vault(vault, n, seed)
+    # Open once so a non-default layout is migrated before anything is timed
+    Storage(data_path=vault, config_path=config).close()
+
+    out: List[Dict[str, Any]] = []
+    def log(r):
+        out.append(r)
+        print(f"  {r['name']:<18} {json.dumps(r['params'], ensure_ascii=False):<42} "
+              f"median {r['median']*1e3:10.3f} ms  ({r['per_op_us']:.1f} µs/op)", file=sys.stderr)
+
+    store = Storage(data_path=vault, config_path=config)
+    log(_result(n, "load", _time(store._load, repeat)))
+    log(_result(n, "save", _time(lambda: store.save(full=True), repeat)))
+    if store.all_entries():
+        one = store.all_entries()[0].id
+        def edit_and_save():
+            store.record_access(one)
+            store.save()
+        log(_result(n, "save_after_edit", _time(edit_and_save, repeat)))
+
+    rng = random.Random(seed)
+    k = max(1, min(mutations, n or mutations))
+    new = list(vaultgen.generate(k, seed + 1))
+    ids = [e.id for e in store.all_entries()]
+
+    it = iter(new)
+    log(_result(n, "add_entry", _time(lambda: [store.add_entry(e, e["custom"]) for e in new[:k]], 1), ops=k))
+    log(_result(n, "flush", _time(store.flush, 1), op="add_entry"))
+    if ids:
+        targets = [rng.choice(ids) for _ in range(k)]
+        log(_result(n, "update_entry", _time(lambda: [store.update_entry(i, next(it, new[0]), {"Category": "Dev"}) for i in targets], 1), ops=k))
+        log(_result(n, "flush", _time(store.flush, 1), op="update_entry"))
+        log(_result(n, "record_access", _time(lambda: [store.record_access(i) for i in targets], 1), ops=k))
+        log(_result(n, "flush", _time(store.flush, 1), op="record_access"))
+        log(_result(n, "read_password", _time(lambda: [store.get_entry(i).password for i in targets], repeat), ops=k))
+
+    entries = store.all_entries()
+    for field, term in SEARCHES:
+        f = None if field == "Any" else field
+        with store.body_scan():
+            log(_result(n, "matches", _time(lambda: [e for e in entries if matches(e, term, f)], repeat),
+                        ops=len(entries), field=field, term=term))
+    for mode in SORT_MODES:
+        log(_result(n, "sort_entries", _time(lambda: sort_entries(entries, mode), repeat),
+                    ops=len(entries), mode=mode))
+    memory = store.memory_stats()
+    if memory is not None:
+        print(f"  memory             {json.dumps(memory)}", file=sys.stderr)
+    store.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir, exist_ok=True)
+    return out
+
+# storage settings per at-rest encoding compared by --codecs
+CODEC_VARIANTS = {
+    "json": {"codec": "json"},
+    "zlib": {"codec": "zlib", "codec_dictionary": False},
+    "zlib+dict": {"codec": "zlib", "codec_dictionary": True},
+    "lzma": {"codec": "lzma"},
+}
+
+def _disk_bytes(workdir: str) -> int:
+    total = 0
+    for root, _, files in os.walk(workdir):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files if f != "config.json")
+    return total
+
+def bench_codecs(n: int, workdir: str, repeat: int, seed: int,
+                 storage_cfg: Dict[str, Any] | None = None) -> List[Dict[str, Any]]:
+    """File size, load and full save time of the same vault in each encoding."""
+    out: List[Dict[str, Any]] = []
+    for name, cfg in CODEC_VARIANTS.items():
+        vault = os.path.join(workdir, f"vault_{n}.json")
+        with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as f:
+            json.dump({"storage": dict(storage_cfg or {}, write_behind=False, **cfg)}, f)
+        vaultgen.write_vault(vault, n, seed)
+        Storage(data_path=vault, config_path=os.path.join(workdir, "config.json")).close()  # migrate
+        for left in os.listdir(workdir):
+            if ".pre-shard." in left:  # vault.json as generated, moved aside by a sharded layout
+                os.remove(os.path.join(workdir, left))
+        size = _disk_bytes(workdir)
+        store = Storage(data_path=vault, config_path=os.path.join(workdir, "config.json"))
+        for r in (_result(n, "codec_load", _time(store._load, repeat), codec=name),
+                  _result(n, "codec_save", _time(lambda: store.save(full=True), repeat), codec=name)):
+            r["bytes"] = size
+            out.append(r)
+            print(f"  {r['name']:<12} {name:<10} {size / 1024:10.1f} KB  median {r['median']*1e3:10.3f} ms",
+                  file=sys.stderr)
+        store.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir, exist_ok=True)
+    return out
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes: List[int], repeat: int, seed: int, mutations: int,
+        storage_cfg: Dict[str, Any] | None = None, codecs: bool = False) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="pixie-bench-")
+    results = []
+    try:
+        for n in sizes:
+            print(f"[{n} entries]", file=sys.stderr)
+            if codecs:
+                results.extend(bench_codecs(n, workdir, repeat, seed, storage_cfg))
+            else:
+                results.extend(bench_size(n, workdir, repeat, seed, mutations, storage_cfg))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "seed": seed, "repeat": repeat, "sizes": sizes, "storage": storage_cfg or {},
+        },
+        "results": results,
+    }
+
+def _key(r: Dict[str, Any]) -> str:
+    return f"{r['size']}:{r['name']}:{json.dumps(r['params'], sort_keys=True, ensure_ascii=False)}"
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """Print median ratios new/old. Returns the number of regressions above `threshold`."""
+    with open(old_path, encoding="utf-8") as f:
+        old = {_key(r): r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)["results"]
+    regressions = 0
+    for r in new:
+        o = old.get(_key(r))
+        if not o or not o["median"]:
+            continue
+        ratio = r["median"] / o["median"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{r['size']:>8} {r['name']:<18} {json.dumps(r['params'], ensure_ascii=False):<42} "
+              f"{o['median']*1e3:10.3f} -> {r['median']*1e3:10.3f} ms  x{ratio:.2f}{flag}")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Pixie Vault storage/search benchmarks")
+    ap.add_argument("--sizes", default="1000,10000,100000",
+                    help="comma separated vault sizes, e.g. 1000,10000,100000,1000000")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--mutations", type=int, default=1000, help="ops per mutation benchmark")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--layout", choices=("json", "sharded"), default="json")
+    ap.add_argument("--shards", type=int, default=16)
+    ap.add_argument("--load-workers", type=int, default=0, help="processes for sharded load (0 = one per CPU)")
+    ap.add_argument("--codec", choices=("json", "zlib", "lzma"), default="json", help="at-rest encoding")
+    ap.add_argument("--codecs", action="store_true",
+                    help="compare file size and load/save time of each encoding instead of the full suite")
+    ap.add_argument("--body-cache-kb", type=int, default=0,
+                    help="run in bounded-memory mode with this body cache budget (0 = off)")
+    ap.add_argument("--out", help="result file (default: bench/results/<commit>-<time>.json)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    ap.add_argument("--threshold", type=float, default=0.10, help="regression threshold for --compare")
+    args = ap.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    storage_cfg = {"layout": args.layout}
+    if args.layout == "sharded":
+        storage_cfg.update(shards=args.shards, load_workers=args.load_workers)
+    if args.codec != "json" and not args.codecs:
+        storage_cfg["codec"] = args.codec
+    if args.body_cache_kb:
+        storage_cfg.update(bounded_memory=True, body_cache_kb=args.body_cache_kb)
+    report = run([int(s) for s in args.sizes.split(",") if s], args.repeat, args.seed, args.mutations,
+                 storage_cfg, args.codecs)
+    out = args.out or os.path.join(HERE, "results", "{}-{}.json".format(
+        report["meta"]["commit"] or "nogit", datetime.datetime.now().strftime("%Y%m%d-%H%M%S")))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"wrote {out}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
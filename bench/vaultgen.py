@@ -0,0 +1,77 @@
+# bench/vaultgen.py
+# Deterministic synthetic vault generator for benchmarks.
+#
+#   python3 bench/vaultgen.py 100000 /tmp/vault_100k.json --seed 42
+import json, os, random, sys, uuid
+from typing import Dict, Any, Iterator
+
+SERVICES = ["GitHub", "GitLab", "AWS", "Azure", "Gmail", "Proton", "Router", "NAS",
+            "Jenkins", "Grafana", "Postgres", "Redis", "Bank", "Steam", "Slack", "Jira",
+            "Café Wi-Fi", "Zürich Office", "東京 VPN", "Москва SSH", "São Paulo CRM",
+            "Kraków Printer", "Ελληνικά Mail", "🧚 Pixie Lab"]
+QUALIFIERS = ["Work", "Personal", "Prod", "Staging", "Dev", "Backup", "Admin", "Test", "Legacy", "Home"]
+PROTOCOLS = ["https", "https", "https", "ssh", "ftp", "imap", "smb", "rdp", "vnc", ""]
+TLDS = ["com", "org", "net", "io", "de", "jp", "local", "co.uk"]
+USERS = ["johnny", "admin", "root", "pi", "jane.doe", "ops", "müller", "søren", "李雷", "backup-svc"]
+CUSTOM_KEYS = ["Category", "Environment", "Owner", "Team", "2FA", "Recovery Email", "Port",
+               "Region", "Expires", "PIN", "Account #", "Security Question", "Tags", "Kategorie"]
+CUSTOM_VALUES = ["Dev", "Prod", "Staging", "John", "Alice", "Finance", "Ops", "yes", "no",
+                 "eu-west-1", "us-east-1", "2026-12-31", "22", "8443", "höchst geheim", "🔑"]
+WORDS = ["rotate", "quarterly", "shared", "with", "team", "legacy", "do", "not", "use", "2FA",
+         "in", "Authy", "recovery", "codes", "in", "safe", "Schlüssel", "鍵", "ключ"]
+
+# Fixed reference time so two runs with the same seed produce identical vaults
+EPOCH = 1735822800
+
+def make_entry(rng: random.Random) -> Dict[str, Any]:
+    service = rng.choice(SERVICES)
+    name = f"{service} – {rng.choice(QUALIFIERS)}" if rng.random() < 0.7 else service
+    host = "".join(c for c in service.lower() if c.isalnum()) or "host"
+    website = f"{host}.{rng.choice(TLDS)}"
+    if rng.random() < 0.3:
+        website = f"https://www.{website}/login"
+    custom = {k: rng.choice(CUSTOM_VALUES) for k in rng.sample(CUSTOM_KEYS, rng.choice((0, 0, 1, 2, 3, 5)))}
+    created = EPOCH - rng.randrange(0, 5 * 365 * 86400)
+    updated = created + (rng.randrange(0, EPOCH - created + 1) if rng.random() < 0.5 else 0)
+    # Heavy-tailed access history: most entries are rarely opened, a few constantly
+    access_count = int(rng.paretovariate(1.2)) - 1
+    last_access = updated + rng.randrange(0, EPOCH - updated + 1) if access_count else None
+    notes = " ".join(rng.choice(WORDS) for _ in range(rng.choice((0, 0, 3, 8, 25))))
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "name": name,
+        "protocol": rng.choice(PROTOCOLS),
+        "website": website,
+        "username": rng.choice(USERS),
+        "password": "".join(rng.choice("abcdefghijkmnpqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789!@#$%")
+                            for _ in range(rng.randrange(8, 33))),
+        "notes": notes,
+        "custom": custom,
+        "created_at": created,
+        "updated_at": updated,
+        "access_count": access_count,
+        "last_access_at": last_access,
+    }
+
+def generate(n: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for _ in range(n):
+        yield make_entry(rng)
+
+def write_vault(path: str, n: int, seed: int = 42):
+    """Stream a vault of `n` entries to `path` in the same layout Storage.save()
+    produces, without holding all entries in memory."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{\n  "entries": [')
+        for i, e in enumerate(generate(n, seed)):
+            body = json.dumps(e, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+            f.write(("," if i else "") + "\n    " + body)
+        f.write("\n  ]\n}" if n else "]\n}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: vaultgen.py COUNT OUT.json [--seed N]")
+        sys.exit(2)
+    seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else 42
+    write_vault(sys.argv[2], int(sys.argv[1]), seed)
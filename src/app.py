@@ -1,11 +1,13 @@
 # src/app.py
 import datetime
 import tkinter as tk
-from tkinter import ttk, messagebox
-from typing import Dict, Any, List, Tuple
-import os
-from storage import Storage
-from search import matches, all_field_labels, sort_entries
+from tkinter import ttk, messagebox, simpledialog, filedialog
+from typing import Callable, Dict, Any, List, Tuple
+import os, sys, threading, time
+from storage import ConflictError, Storage
+from model import BASE_FIELDS, Entry
+from vaultclient import DaemonError, open_store, load_config
+import metrics, crypto, rekey
 
 # Try to import PIL, but continue without it if not available
 try:
@@ -14,12 +16,22 @@ try:
 except ImportError:
     PIL_AVAILABLE = False
 
+# Values listed per custom key in the filter sidebar (most common first)
+FACET_VALUES_SHOWN = 25
+REFRESH_MS = 3000  # how often to look for changes saved by other processes
+BACKUP_CHECK_MS = 60000  # how often to check whether a snapshot is due (see backup.py)
+
 class PixieVaultApp:
-    def __init__(self, root: tk.Tk):
+    def __init__(self, root: tk.Tk, store: Storage | None = None, defer_store: bool = False):
+        """With `defer_store`, only the window is built; attach_store() fills
+        it once the vault is loaded (see warm_start)."""
         self.root = root
         self.root.title("✨ Pixie Vault")
         self.root.geometry("1024x640")
-        self.store = Storage()
+        self.store = store if store is not None or defer_store else open_store()
+        self.rotation: rekey.Rotation | None = None
+        self.facet_filter: Dict[str, str] = {}  # custom key -> value picked in the sidebar
+        self._facet_rows: Dict[str, Tuple[str, str | None]] = {}  # sidebar row -> (key, value or None)
         
         # Touch-first sizing
         self.root.tk.call('tk', 'scaling', 1.3)
@@ -31,9 +43,6 @@ class PixieVaultApp:
         # Build UI first
         self._build_ui()
 
-        self._load_entries()
-        self._refresh_field_labels()
-        
         # Cleanup video on window close
         self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
         
@@ -42,6 +51,26 @@ class PixieVaultApp:
         self.root.bind("<Control-e>", lambda e: self._edit_entry_dialog())
         self.root.bind("<Delete>", lambda e: self._delete_selected())
         self.root.bind("<F5>", lambda e: self._load_entries())
+
+        # Optional instrumentation (PIXIE_METRICS=1 or "metrics" in config.json)
+        self.watchdog = None
+        if metrics.state.enabled:
+            self.watchdog = metrics.Watchdog(self.root)
+            self.watchdog.start()
+            self.root.after(10000, self._metrics_tick)
+
+        if self.store is not None:
+            self.attach_store(self.store)
+
+    def attach_store(self, store: Storage):
+        """Show `store` in the window and start the periodic checks on it."""
+        self.store = store
+        self._load_entries()
+        self._refresh_field_labels()
+        self.root.after(300, self._check_encryption_state)
+        self.root.after(REFRESH_MS, self._refresh_tick)
+        if isinstance(self.store, Storage):  # with the daemon, it takes the snapshots
+            self.root.after(BACKUP_CHECK_MS, self._backup_tick)
     
     def _setup_theme(self):
         style = ttk.Style(self.root)
@@ -60,6 +89,8 @@ class PixieVaultApp:
         ttk.Button(top, text="Edit Entry", command=self._edit_entry_dialog).pack(side="left", padx=2)
         ttk.Button(top, text="Delete", command=self._delete_selected).pack(side="left", padx=2)
         ttk.Button(top, text="Refresh", command=self._load_entries).pack(side="left", padx=2)
+        ttk.Button(top, text="Security", command=self._security_dialog).pack(side="left", padx=2)
+        ttk.Button(top, text="Duplicates", command=self._duplicates_dialog).pack(side="left", padx=2)
         
         # Separator
         ttk.Separator(top, orient="vertical").pack(side="left", fill="y", padx=8)
@@ -85,6 +116,18 @@ class PixieVaultApp:
         center = ttk.Frame(self.root)
         center.pack(side="top", fill="x", padx=10, pady=6)
 
+        # Left: custom field values with counts for the current result
+        facet_frame = ttk.Frame(center, width=200)
+        facet_frame.pack(side="left", fill="y", padx=(0, 10))
+        facet_head = ttk.Frame(facet_frame)
+        facet_head.pack(fill="x")
+        ttk.Label(facet_head, text="Filters", font=("DejaVu Sans", 12, "bold")).pack(side="left")
+        ttk.Button(facet_head, text="Clear", command=self._clear_facets).pack(side="right")
+        self.facet_tree = ttk.Treeview(facet_frame, show="tree", selectmode="browse", height=12)
+        self.facet_tree.column("#0", width=200)
+        self.facet_tree.pack(fill="both", expand=True)
+        self.facet_tree.bind("<<TreeviewSelect>>", self._on_facet_click)
+
         self.tree = ttk.Treeview(center, columns=("name","protocol","website","username","id","created","last_access"), show="headings", height=12)
         for col, label, width in [("name","Name",140), ("protocol","Protocol",80), ("website","Website",180), ("username","UN",120), ("id","ID",80), ("created","Created",120), ("last_access","Last Access",120)]:
             self.tree.heading(col, text=label)
@@ -106,10 +149,23 @@ class PixieVaultApp:
         self.show_passwords = tk.BooleanVar(value=False)
         ttk.Checkbutton(pwd_frame, text="Show Passwords", variable=self.show_passwords, 
                        command=self._refresh_detail_display).pack(side="left")
+        ttk.Button(pwd_frame, text="History", command=self._history_dialog).pack(side="right")
         ttk.Label(detail, text="Entry Details", font=("DejaVu Sans", 12, "bold")).pack(anchor="w", pady=(0,6))
         
         self.detail_text = tk.Text(detail, height=12, wrap="word", font=("DejaVu Sans", 10))
         self.detail_text.pack(fill="both", expand=True)
+
+        # Files attached to the selected entry
+        att_frame = ttk.Frame(detail)
+        att_frame.pack(fill="x", pady=(6, 0))
+        ttk.Label(att_frame, text="Attachments").pack(anchor="w")
+        self.attachment_list = tk.Listbox(att_frame, height=3, font=("DejaVu Sans", 10))
+        self.attachment_list.pack(fill="x")
+        att_buttons = ttk.Frame(att_frame)
+        att_buttons.pack(fill="x", pady=2)
+        ttk.Button(att_buttons, text="Attach…", command=self._attach_file).pack(side="left", padx=2)
+        ttk.Button(att_buttons, text="Save As…", command=self._save_attachment).pack(side="left", padx=2)
+        ttk.Button(att_buttons, text="Remove", command=self._remove_attachment).pack(side="left", padx=2)
         
         # Bottom image area
         self._add_pixie_image(detail)
@@ -130,7 +186,7 @@ class PixieVaultApp:
         self.status_right.pack(side="right")
 
     def _refresh_field_labels(self):
-        labels = ["Any"] + all_field_labels(self.store.all_entries())
+        labels = ["Any"] + self.store.field_labels()
         self.field_combo["values"] = labels
         if self.field_var.get() not in labels:
             self.field_var.set("Any")
@@ -140,51 +196,124 @@ class PixieVaultApp:
         field = self.field_var.get()
         sort_mode = self.sort_var.get()
 
-        entries = self.store.all_entries()
-        if term:
-            entries = [e for e in entries if matches(e, term, None if field == "Any" else field)]
-        entries = sort_entries(entries, sort_mode)
+        entries = self.store.query(term, field, sort_mode, facets=self.facet_filter or None)
+
+        with metrics.span("render"):
+            self._render_entries(entries, term)
+            # Counts over the shown entries; the whole vault when nothing narrows it
+            self._render_facets([e.id for e in entries] if term or self.facet_filter else None)
+
+    def _render_facets(self, ids: List[str] | None):
+        tree = self.facet_tree
+        was_open = {self._facet_rows[i][0] for i in tree.get_children() if tree.item(i, "open")}
+        tree.delete(*tree.get_children())
+        self._facet_rows = {}
+        counts = self.store.facet_counts(ids, FACET_VALUES_SHOWN)
+        for key in self.facet_filter:
+            counts.setdefault(key, [])
+        for key in sorted(counts, key=str.lower):
+            values = counts[key]
+            picked = self.facet_filter.get(key)
+            if picked is not None and picked not in (v for v, _ in values):
+                values = [(picked, 0)] + values
+            label = f"{key} = {picked}" if picked is not None else key
+            key_row = tree.insert("", "end", text=label, open=key in was_open or picked is not None)
+            self._facet_rows[key_row] = (key, None)
+            for value, n in values:
+                mark = "✓ " if value == picked else ""
+                row = tree.insert(key_row, "end", text=f"{mark}{value} ({n})")
+                self._facet_rows[row] = (key, value)
+
+    def _on_facet_click(self, _evt=None):
+        sel = self.facet_tree.selection()
+        if not sel or sel[0] not in self._facet_rows:
+            return
+        key, value = self._facet_rows[sel[0]]
+        if value is None:
+            return  # key rows just expand/collapse
+        if self.facet_filter.get(key) == value:
+            del self.facet_filter[key]  # clicking the picked value again drops it
+        else:
+            self.facet_filter[key] = value
+        self._load_entries()
 
+    def _clear_facets(self):
+        if self.facet_filter:
+            self.facet_filter.clear()
+            self._load_entries()
+
+    def _render_entries(self, entries: List[Dict[str, Any]], term: str):
         self.tree.delete(*self.tree.get_children())
         
-        if not entries and term:
+        if not entries and (term or self.facet_filter):
             # Empty state message
             self.status_left.config(text="No matches found ✨ — try 'Any' field or clear filters")
         else:
             # Update status bar
             count = len(entries)
-            filter_text = f" (filtered)" if term else ""
+            filter_text = f" (filtered)" if term or self.facet_filter else ""
             self.status_left.config(text=f"{count} entries{filter_text}")
         
-        # Update time
-        current_time = datetime.datetime.now().strftime("%H:%M")
-        self.status_right.config(text=current_time)
+        self._update_status_right()
         
         for e in entries:
-            created_short = datetime.datetime.fromtimestamp(e.get('created_at', 0)).strftime('%m/%d/%y') if e.get('created_at') else 'N/A'
-            last_access_short = datetime.datetime.fromtimestamp(e.get('last_access_at', 0)).strftime('%m/%d/%y') if e.get('last_access_at') else 'Never'
+            created_short = datetime.datetime.fromtimestamp(e.created_at).strftime('%m/%d/%y') if e.created_at else 'N/A'
+            last_access_short = datetime.datetime.fromtimestamp(e.last_access_at).strftime('%m/%d/%y') if e.last_access_at else 'Never'
             
-            self.tree.insert("", "end", iid=e["id"], values=(
-                e.get("name",""),
-                e.get("protocol",""),
-                e.get("website",""),
-                e.get("username",""),
-                e.get("id","")[:8] + "...",  # Truncated ID
+            self.tree.insert("", "end", iid=e.id, values=(
+                e.name,
+                e.protocol,
+                e.website,
+                e.username,
+                e.id[:8] + "...",  # Truncated ID
                 created_short,
                 last_access_short
             ))
         self.detail_text.delete("1.0", "end")
+        self.attachment_list.delete(0, "end")
+
+    def _update_status_right(self):
+        current_time = datetime.datetime.now().strftime("%H:%M")
+        if metrics.state.enabled and metrics.state.status_bar:
+            summary = metrics.summary()
+            if summary:
+                current_time = f"{summary}  {current_time}"
+        self.status_right.config(text=current_time)
+
+    def _metrics_tick(self):
+        metrics.dump()
+        self._update_status_right()
+        self.root.after(10000, self._metrics_tick)
+
+    def _refresh_tick(self):
+        # Show what other processes saved to the vault in the meantime
+        try:
+            if self.store.refresh(wait=False):
+                self._refresh_field_labels()
+                self._load_entries()
+        except (OSError, ValueError, crypto.CryptoError, ConflictError, DaemonError):
+            pass  # try again next tick
+        self.root.after(REFRESH_MS, self._refresh_tick)
+
+    def _backup_tick(self):
+        def run():
+            try:
+                self.store.snapshot_if_due()
+            except Exception:
+                pass  # a failed backup must not take the app down; retried next tick
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(BACKUP_CHECK_MS, self._backup_tick)
 
     def _on_select(self, _evt=None):
         sel = self.tree.selection()
         if not sel: return
         entry_id = sel[0]
-        entry = next((x for x in self.store.all_entries() if x["id"] == entry_id), None)
+        entry = self.store.get_entry(entry_id)
         if not entry: return
         self.store.record_access(entry_id)
         self._show_details(entry)
 
-    def _show_details(self, e: Dict[str,Any]):
+    def _show_details(self, e: Entry):
         self.current_entry = e  # Store for refresh
         self._refresh_detail_display()
     
@@ -197,60 +326,272 @@ class PixieVaultApp:
         self.detail_text.delete("1.0", "end")
         
         # Format timestamps
-        created_date = datetime.datetime.fromtimestamp(e.get('created_at', 0)).strftime('%Y-%m-%d %H:%M:%S') if e.get('created_at') else 'N/A'
-        last_access = datetime.datetime.fromtimestamp(e.get('last_access_at', 0)).strftime('%Y-%m-%d %H:%M:%S') if e.get('last_access_at') else 'Never'
+        created_date = datetime.datetime.fromtimestamp(e.created_at).strftime('%Y-%m-%d %H:%M:%S') if e.created_at else 'N/A'
+        last_access = datetime.datetime.fromtimestamp(e.last_access_at).strftime('%Y-%m-%d %H:%M:%S') if e.last_access_at else 'Never'
         
         # Show or hide password based on toggle
-        password_display = e.get('password','') if self.show_passwords.get() else '•' * len(e.get('password',''))
+        password_display = e.password if self.show_passwords.get() else '•' * len(e.password)
         
         base = (
-            f"Name: {e.get('name','')}\n"
-            f"Protocol: {e.get('protocol','')}\n"
-            f"Website: {e.get('website','')}\n"
-            f"Username: {e.get('username','')}\n"
+            f"Name: {e.name}\n"
+            f"Protocol: {e.protocol}\n"
+            f"Website: {e.website}\n"
+            f"Username: {e.username}\n"
             f"Password: {password_display}\n"
-            f"Notes: {e.get('notes','')}\n"
-            f"ID: {e.get('id','')}\n"
+            f"Notes: {e.notes}\n"
+            f"ID: {e.id}\n"
             f"Created: {created_date}\n"
             f"Last Accessed: {last_access}\n"
         )
         self.detail_text.config(state="normal")
         self.detail_text.insert("end", base)
-        if e.get("custom"):
+        if e.custom:
             self.detail_text.insert("end", "\nCustom Fields:\n")
-            for k, v in e["custom"].items():
+            for k, v in e.custom.items():
                 self.detail_text.insert("end", f"  - {k}: {v}\n")
         self.detail_text.config(state="disabled")
+        self.attachment_list.delete(0, "end")
+        for a in e.attachments or []:
+            self.attachment_list.insert("end", f"📎 {a['name']} ({_format_size(a['size'])})")
+
+    # --- History ---
+    def _history_dialog(self):
+        e = getattr(self, "current_entry", None)
+        if not e:
+            messagebox.showinfo("History", "Select an entry first.")
+            return
+        try:
+            versions = self.store.entry_history(e.id)
+        except Exception as err:
+            messagebox.showerror("History", f"Couldn't read the history:\n{err}")
+            return
+        if not versions:
+            messagebox.showinfo("History", f"{e.name} hasn't been changed since it was added.")
+            return
+        versions.reverse()  # newest first
+        current = e.to_dict()
+
+        dlg = tk.Toplevel(self.root)
+        dlg.title(f"History – {e.name}")
+        dlg.geometry("640x360")
+        listbox = tk.Listbox(dlg, width=34, font=("DejaVu Sans", 10))
+        listbox.pack(side="left", fill="y", padx=6, pady=6)
+        right = ttk.Frame(dlg)
+        right.pack(side="left", fill="both", expand=True, padx=6, pady=6)
+        text = tk.Text(right, wrap="word", font=("DejaVu Sans", 10))
+        text.pack(fill="both", expand=True)
+
+        newer = current
+        for v in versions:
+            when = datetime.datetime.fromtimestamp(v["at"]).strftime('%Y-%m-%d %H:%M') if v["at"] else "?"
+            changed = [k for k in ("name", "protocol", "website", "username", "password", "notes", "custom",
+                                   "attachments") if v["entry"].get(k) != newer.get(k)]
+            listbox.insert("end", f"{when}  ({', '.join(changed) or 'no field changes'})")
+            newer = v["entry"]
+
+        def show(_evt=None):
+            sel = listbox.curselection()
+            if not sel:
+                return
+            v = versions[sel[0]]["entry"]
+            pw = v.get("password", "")
+            lines = [f"{label}: {v.get(k, '')}" for k, label in (("name", "Name"), ("protocol", "Protocol"),
+                     ("website", "Website"), ("username", "Username"))]
+            lines.append(f"Password: {pw if self.show_passwords.get() else '•' * len(pw)}")
+            lines.append(f"Notes: {v.get('notes', '')}")
+            for k, val in (v.get("custom") or {}).items():
+                lines.append(f"  - {k}: {val}")
+            text.config(state="normal")
+            text.delete("1.0", "end")
+            text.insert("end", "\n".join(lines))
+            text.config(state="disabled")
+
+        def restore():
+            sel = listbox.curselection()
+            if not sel or not messagebox.askyesno("History", "Restore this version? The current one "
+                                                  "stays in the history.", parent=dlg):
+                return
+            v = versions[sel[0]]["entry"]
+            self.store.update_entry(e.id, {k: v.get(k, "") for k in BASE_FIELDS}, v.get("custom") or {})
+            dlg.destroy()
+            self._refresh_field_labels()
+            self._load_entries()
+            self.current_entry = self.store.get_entry(e.id)
+            self._refresh_detail_display()
+
+        listbox.bind("<<ListboxSelect>>", show)
+        buttons = ttk.Frame(right)
+        buttons.pack(fill="x", pady=(6, 0))
+        ttk.Button(buttons, text="Restore", command=restore).pack(side="left")
+        ttk.Button(buttons, text="Close", command=dlg.destroy).pack(side="right")
+        listbox.selection_set(0)
+        show()
+
+    def _duplicates_dialog(self):
+        try:
+            groups = self.store.find_duplicates()
+        except Exception as err:
+            messagebox.showerror("Duplicates", f"Couldn't look for duplicates:\n{err}")
+            return
+        if not groups:
+            messagebox.showinfo("Duplicates", "No likely duplicates found ✨")
+            return
+
+        dlg = tk.Toplevel(self.root)
+        dlg.title("Possible Duplicates")
+        dlg.geometry("760x420")
+        listbox = tk.Listbox(dlg, width=34, font=("DejaVu Sans", 10))
+        listbox.pack(side="left", fill="y", padx=6, pady=6)
+        right = ttk.Frame(dlg)
+        right.pack(side="left", fill="both", expand=True, padx=6, pady=6)
+        text = tk.Text(right, wrap="word", font=("DejaVu Sans", 10), height=12)
+        text.pack(fill="both", expand=True)
+        keep_frame = ttk.Frame(right)
+        keep_frame.pack(fill="x", pady=(6, 0))
+        keep_var = tk.StringVar()
+
+        def fill():
+            # A merge may have emptied other groups that shared its entries
+            groups[:] = [g for g in groups if sum(1 for i in g["ids"] if self.store.get_entry(i)) > 1]
+            listbox.delete(0, "end")
+            for g in groups:
+                names = " / ".join(x.name for x in (self.store.get_entry(i) for i in g["ids"]) if x)
+                listbox.insert("end", f"{g['score']:.0%}  {names}")
+
+        def show(_evt=None):
+            sel = listbox.curselection()
+            text.config(state="normal")
+            text.delete("1.0", "end")
+            for w in keep_frame.winfo_children():
+                w.destroy()
+            if not sel:
+                text.config(state="disabled")
+                return
+            entries = [x for x in (self.store.get_entry(i) for i in groups[sel[0]]["ids"]) if x]
+            ttk.Label(keep_frame, text="Keep:").pack(side="left")
+            for x in entries:
+                pw = x.password
+                text.insert("end", f"{x.name}  [{x.id[:8]}]\n")
+                for label, val in (("Website", x.website), ("Username", x.username),
+                                   ("Password", pw if self.show_passwords.get() else "•" * len(pw)),
+                                   ("Used", f"{x.access_count}×")):
+                    text.insert("end", f"  {label}: {val}\n")
+                for k, val in x.custom.items():
+                    text.insert("end", f"  - {k}: {val}\n")
+                text.insert("end", "\n")
+                ttk.Radiobutton(keep_frame, text=f"{x.name} [{x.id[:8]}]", variable=keep_var,
+                                value=x.id).pack(side="left", padx=4)
+            # Default to the most used copy
+            keep_var.set(max(entries, key=lambda x: (x.access_count, x.updated_at or 0)).id)
+            text.config(state="disabled")
+
+        def drop_current():
+            sel = listbox.curselection()
+            if sel:
+                del groups[sel[0]]
+            fill()
+            if not groups:
+                dlg.destroy()
+                return
+            listbox.selection_set(min(sel[0] if sel else 0, len(groups) - 1))
+            show()
+
+        def merge():
+            sel = listbox.curselection()
+            if not sel or not keep_var.get():
+                return
+            keep_id = keep_var.get()
+            others = [i for i in groups[sel[0]]["ids"] if i != keep_id]
+            if not messagebox.askyesno("Duplicates", f"Merge {len(others)} entr{'y' if len(others) == 1 else 'ies'} "
+                                       "into the selected one and delete them? Usage counts, dates and "
+                                       "custom fields are combined; the kept password wins.", parent=dlg):
+                return
+            self.store.merge_entries(keep_id, others)
+            self._refresh_field_labels()
+            self._load_entries()
+            drop_current()
+
+        listbox.bind("<<ListboxSelect>>", show)
+        buttons = ttk.Frame(right)
+        buttons.pack(fill="x", pady=(6, 0))
+        ttk.Button(buttons, text="Merge", command=merge).pack(side="left")
+        ttk.Button(buttons, text="Not Duplicates", command=drop_current).pack(side="left", padx=6)
+        ttk.Button(buttons, text="Close", command=dlg.destroy).pack(side="right")
+        fill()
+        listbox.selection_set(0)
+        show()
+
+    # --- Attachments ---
+    def _selected_attachment(self) -> Dict[str, Any] | None:
+        sel = self.attachment_list.curselection()
+        e = getattr(self, "current_entry", None)
+        if not e or not sel or sel[0] >= len(e.attachments or []):
+            messagebox.showinfo("Attachments", "Select an attachment first.")
+            return None
+        return e.attachments[sel[0]]
+
+    def _reload_current_entry(self):
+        self.current_entry = self.store.get_entry(self.current_entry.id)
+        self._refresh_detail_display()
+
+    def _attach_file(self):
+        e = getattr(self, "current_entry", None)
+        if not e:
+            messagebox.showinfo("Attachments", "Select an entry first.")
+            return
+        path = filedialog.askopenfilename(parent=self.root, title=f"Attach a file to {e.name}")
+        if not path:
+            return
+        try:
+            self.store.attach_file(e.id, path)
+        except (OSError, crypto.CryptoError, DaemonError) as err:
+            messagebox.showerror("Attachments", f"Couldn't attach {os.path.basename(path)}:\n{err}")
+            return
+        self._reload_current_entry()
+
+    def _save_attachment(self):
+        a = self._selected_attachment()
+        if not a:
+            return
+        dest = filedialog.asksaveasfilename(parent=self.root, title="Save attachment",
+                                            initialfile=os.path.basename(a["name"]))
+        if not dest:
+            return
+        try:
+            self.store.export_attachment(self.current_entry.id, a["id"], dest)
+        except Exception as err:
+            messagebox.showerror("Attachments", f"Couldn't save {a['name']}:\n{err}")
+            return
+        self.status_left.config(text=f"Saved {a['name']} ✨")
+
+    def _remove_attachment(self):
+        a = self._selected_attachment()
+        if not a or not messagebox.askyesno("Attachments", f"Remove {a['name']} from this entry?"):
+            return
+        self.store.detach_file(self.current_entry.id, a["id"])
+        self._reload_current_entry()
 
     # --- Dialogs ---
     def _add_entry_dialog(self):
         base, custom = self._entry_form_dialog("Add Entry")
-        print(f"DEBUG: Dialog returned base={base}, custom={custom}")
         if base is None: 
-            print("DEBUG: Dialog was cancelled")
             return
         
         # Validation
         if not base.get("name", "").strip():
-            print("DEBUG: Name validation failed")
             messagebox.showerror("Validation Error", "Name is required.")
             return
         
         # Password confirmation validation
         password = base.get("password", "")
         password_confirm = base.get("password_confirm", "")
-        print(f"DEBUG: password='{password}', confirm='{password_confirm}'")
         if password and password != password_confirm:
-            print("DEBUG: Password confirmation failed")
             messagebox.showerror("Validation Error", "Passwords do not match.")
             return
         
-        print("DEBUG: About to save entry")
         self.store.add_entry(base, custom)
-        print("DEBUG: Entry saved, refreshing UI")
         self._refresh_field_labels()
         self._load_entries()
-        print("DEBUG: Showing success message")
         messagebox.showinfo("Success", "Entry saved ✨")
 
     def _edit_entry_dialog(self):
@@ -259,8 +600,9 @@ class PixieVaultApp:
             messagebox.showinfo("Edit", "Select an entry to edit.")
             return
         entry_id = sel[0]
-        entry = next((x for x in self.store.all_entries() if x["id"] == entry_id), None)
+        entry = self.store.get_entry(entry_id)
         if not entry: return
+        rev = entry.rev  # the live entry may be refreshed while the dialog is open
         base, custom = self._entry_form_dialog("Edit Entry", entry)
         if base is None: return
         
@@ -274,12 +616,17 @@ class PixieVaultApp:
         if len(base.get("password", "")) < 3:
             messagebox.showwarning("Validation Warning", "Password should be at least 3 characters long.")
         
-        self.store.update_entry(entry_id, base, custom)
+        try:
+            self.store.update_entry(entry_id, base, custom, expected_rev=rev)
+        except (ConflictError, DaemonError) as err:
+            self._load_entries()
+            messagebox.showerror("Edit", f"Not saved: {err}\nThe entry was changed elsewhere; reopen it to see the new version.")
+            return
         self._refresh_field_labels()
         self._load_entries()
         messagebox.showinfo("Success", "Entry updated ✨")
 
-    def _entry_form_dialog(self, title: str, entry: Dict[str,Any] | None = None):
+    def _entry_form_dialog(self, title: str, entry: Entry | None = None):
         # Simple synchronous dialog with dynamic custom fields
         dlg = tk.Toplevel(self.root)
         dlg.title(title)
@@ -293,14 +640,7 @@ class PixieVaultApp:
         # Result storage
         result = {"base": None, "custom": None}
 
-        vals = {
-            "name": (entry or {}).get("name",""),
-            "protocol": (entry or {}).get("protocol",""),
-            "website": (entry or {}).get("website",""),
-            "username": (entry or {}).get("username",""),
-            "password": (entry or {}).get("password",""),
-            "notes": (entry or {}).get("notes","")
-        }
+        vals = {k: getattr(entry, k) if entry else "" for k in BASE_FIELDS}
         row = 0
         widgets: Dict[str, tk.Entry] = {}
         # Password visibility toggle for dialog
@@ -327,6 +667,8 @@ class PixieVaultApp:
                 ent.grid(row=row, column=1, padx=6, pady=4, sticky="w")
                 ent.insert(0, vals[label_key])
                 widgets[label_key] = ent
+                if label_key in ("protocol", "website", "username"):
+                    _Autocomplete(ent, lambda text, f=label_key: self.store.suggest(f, text))
             
             row += 1
 
@@ -340,6 +682,7 @@ class PixieVaultApp:
             nonlocal row
             key_ent = ttk.Entry(dlg, width=20)
             val_ent = ttk.Entry(dlg, width=30)
+            _Autocomplete(key_ent, lambda text: self.store.suggest("custom", text))
             
             def remove_this_row():
                 nonlocal custom_rows
@@ -366,7 +709,7 @@ class PixieVaultApp:
             row += 1
 
         # preload existing custom
-        for k, v in ((entry or {}).get("custom") or {}).items():
+        for k, v in (entry.custom if entry else {}).items():
             add_custom_row(k, v)
 
         # add-row button
@@ -410,8 +753,16 @@ class PixieVaultApp:
     def _delete_selected(self):
         sel = self.tree.selection()
         if not sel: return
+        entry = self.store.get_entry(sel[0])
+        if not entry: return
+        rev = entry.rev
         if messagebox.askyesno("Delete", "Delete selected entry?"):
-            self.store.delete_entry(sel[0])
+            try:
+                self.store.delete_entry(sel[0], expected_rev=rev)
+            except (ConflictError, DaemonError) as err:
+                self._load_entries()
+                messagebox.showerror("Delete", f"Not deleted: {err}")
+                return
             self._refresh_field_labels()
             self._load_entries()
     
@@ -450,11 +801,260 @@ class PixieVaultApp:
             ttk.Label(parent, text=f"🧚‍♀️ Image error: {e}", 
                      font=("DejaVu Sans", 8)).pack(side="bottom", pady=5)
 
+    # --- Encryption ---
+    def _ask_new_password(self) -> str | None:
+        pw = simpledialog.askstring("Master Password", "New master password:", show="•", parent=self.root)
+        if not pw:
+            return None
+        if pw != simpledialog.askstring("Master Password", "Confirm master password:", show="•", parent=self.root):
+            messagebox.showerror("Master Password", "Passwords do not match.")
+            return None
+        return pw
+
+    def _check_encryption_state(self):
+        if not isinstance(self.store, Storage):
+            return  # the vault daemon owns encryption
+        state = rekey.pending(self.store)
+        if state is not None:
+            if messagebox.askyesno("Security", "An interrupted re-encryption was found. Resume it?"):
+                pw = None
+                if state.get("header"):
+                    pw = simpledialog.askstring("Master Password", "New master password you chose:",
+                                                show="•", parent=self.root)
+                    if pw is None:
+                        return
+                self._start_rotation(pw)
+            else:
+                rekey.discard(self.store)
+        elif self.store.encryption_enabled and not self.store.encrypted and crypto.CRYPTO_AVAILABLE:
+            if messagebox.askyesno("Security", "Encryption is enabled in config.json but the vault "
+                                   "isn't encrypted yet. Set a master password now?"):
+                pw = self._ask_new_password()
+                if pw:
+                    self._start_rotation(pw)
+
+    def _security_dialog(self):
+        if not isinstance(self.store, Storage):
+            messagebox.showinfo("Security", "Encryption is managed by the vault daemon.")
+            return
+        if self.rotation and not (self.rotation.finished or self.rotation.error):
+            messagebox.showinfo("Security", self.rotation.status())
+            return
+        if not crypto.CRYPTO_AVAILABLE:
+            messagebox.showerror("Security", "Encryption needs the 'cryptography' package:\n\npip3 install cryptography")
+            return
+        if self.store.encrypted:
+            choice = messagebox.askyesnocancel("Security", "Change the master password?\n\n"
+                                               "Yes = change password, No = remove encryption")
+            if choice is None:
+                return
+            if choice is False:
+                if messagebox.askyesno("Security", "Store all entries unencrypted?"):
+                    self._start_rotation(None)
+                return
+        elif not messagebox.askyesno("Security", "Encrypt the vault with a master password?"):
+            return
+        pw = self._ask_new_password()
+        if pw:
+            self._start_rotation(pw)
+
+    def _start_rotation(self, new_password: str | None):
+        # Runs off the UI thread; progress and throughput show in the status bar
+        self.rotation = rekey.start(self.store, new_password)
+        self._poll_rotation()
+
+    def _poll_rotation(self):
+        rot = self.rotation
+        self.status_left.config(text=rot.status())
+        if rot.error:
+            messagebox.showerror("Security", rot.status())
+        elif rot.finished:
+            self._load_entries()
+            messagebox.showinfo("Security", rot.status())
+        else:
+            self.root.after(200, self._poll_rotation)
+
     def _on_closing(self):
         """Clean up before closing"""
+        if self.rotation and not (self.rotation.finished or self.rotation.error):
+            if not messagebox.askyesno("Quit", "Re-encryption is still running. Quit anyway? "
+                                       "It will resume next time."):
+                return
+        if self.watchdog:
+            self.watchdog.stop()
+        metrics.dump()
+        if self.store is not None:
+            try:
+                self.store.gc_attachments()  # drop files of deleted entries
+            except Exception:
+                pass
+            self.store.close()  # wait for pending writes to reach disk
         self.root.destroy()
 
+class _Autocomplete:
+    """Tap-to-fill list of suggestions under an Entry, updated as the user types."""
+
+    def __init__(self, entry: ttk.Entry, lookup: Callable[[str], List[str]]):
+        self.entry = entry
+        self.lookup = lookup
+        self.popup: tk.Toplevel | None = None
+        self.listbox: tk.Listbox | None = None
+        entry.bind("<KeyRelease>", self._update, add="+")
+        entry.bind("<FocusIn>", self._update, add="+")
+        entry.bind("<FocusOut>", self._focus_out, add="+")
+        entry.bind("<Escape>", lambda e: self.hide(), add="+")
+        entry.bind("<Down>", self._focus_list, add="+")
+
+    def _update(self, evt=None):
+        if evt is not None and getattr(evt, "keysym", "") in ("Escape", "Return", "Tab", "Down", "Up"):
+            return
+        text = self.entry.get()
+        try:
+            items = [s for s in self.lookup(text) if s != text]
+        except (DaemonError, OSError, ValueError):
+            items = []
+        if not items:
+            self.hide()
+            return
+        if self.popup is None:
+            self.popup = tk.Toplevel(self.entry)
+            self.popup.wm_overrideredirect(True)
+            self.listbox = tk.Listbox(self.popup, font=("DejaVu Sans", 12), exportselection=False)
+            self.listbox.pack(fill="both", expand=True)
+            self.listbox.bind("<ButtonRelease-1>", self._pick)
+            self.listbox.bind("<Return>", self._pick)
+            self.listbox.bind("<Escape>", lambda e: (self.hide(), self.entry.focus_set()))
+            self.listbox.bind("<FocusOut>", self._focus_out)
+        self.listbox.delete(0, "end")
+        for s in items:
+            self.listbox.insert("end", s)
+        self.listbox.configure(height=len(items), width=max(int(self.entry.cget("width")), max(map(len, items))))
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self.popup.geometry(f"+{x}+{y}")
+        self.popup.lift()
+
+    def _focus_out(self, _evt=None):
+        # Checked a moment later so a tap on the list lands before it goes away
+        def check():
+            try:
+                focus = self.entry.focus_get()
+            except (KeyError, tk.TclError):
+                focus = None
+            if focus is None or focus not in (self.entry, self.listbox):
+                self.hide()
+        self.entry.after(200, check)
+
+    def _focus_list(self, _evt=None):
+        if self.listbox is not None:
+            self.listbox.focus_set()
+            self.listbox.selection_clear(0, "end")
+            self.listbox.selection_set(0)
+            self.listbox.activate(0)
+
+    def _pick(self, _evt=None):
+        sel = self.listbox.curselection() if self.listbox is not None else ()
+        if not sel:
+            return
+        value = self.listbox.get(sel[0])
+        self.hide()
+        self.entry.delete(0, "end")
+        self.entry.insert(0, value)
+        self.entry.icursor("end")
+        self.entry.focus_set()
+
+    def hide(self):
+        if self.popup is not None:
+            self.popup.destroy()
+            self.popup = None
+            self.listbox = None
+
+def _format_size(n: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def unlock_store(root: tk.Tk):
+    """Open the vault, asking for the master password while it's locked.
+    Returns None if the user gives up."""
+    password = None
+    while True:
+        try:
+            return open_store(password=password)
+        except crypto.VaultLocked:
+            pass
+        except crypto.CryptoError as e:
+            messagebox.showerror("Unlock", str(e), parent=root)
+        password = simpledialog.askstring("🔒 Unlock Pixie Vault", "Master password:", show="•", parent=root)
+        if password is None:
+            return None
+
+def warm_start(root: tk.Tk) -> PixieVaultApp:
+    """Start behind the boot animation: parse the vault on a worker thread
+    while the window is built hidden, fill it in when the load finishes, and
+    reveal it once the animation signals it has finished (or the timeout
+    passes) and the vault is there. An encrypted vault can't be preloaded;
+    its password is asked for once the window shows."""
+    import warmstart
+    started = warmstart.boot_time() or time.time()
+    loaded: Dict[str, Any] = {}
+    def load():
+        try:
+            loaded["store"] = open_store()
+        except Exception as e:
+            loaded["error"] = e
+    loader = threading.Thread(target=load, daemon=True)
+    loader.start()
+
+    # Tk isn't thread-safe: the window is built here, on the UI thread,
+    # while the loader parses the vault
+    root.withdraw()
+    app = PixieVaultApp(root, defer_store=True)
+    root.update_idletasks()
+
+    boot_cfg = load_config().get("boot", {})
+    timeout = float(boot_cfg.get("warm_start_timeout", 60))
+    deadline = time.time() + timeout
+    wait_for_video = boot_cfg.get("play_pixie_video", True)
+
+    def reveal():
+        root.deiconify()
+        root.lift()
+        if app.store is None:
+            error = loaded.get("error")
+            if isinstance(error, crypto.CryptoError):
+                unlocked = unlock_store(root)
+            else:
+                messagebox.showerror("Pixie Vault", f"Could not open the vault:\n{error}", parent=root)
+                unlocked = None
+            if unlocked is None:
+                root.destroy()
+                return
+            app.attach_store(unlocked)
+        app.search_entry.focus_set()
+
+    def poll():
+        loading = loader.is_alive()  # before looking at `loaded`: set just before the thread ends
+        if app.store is None and "store" in loaded:
+            app.attach_store(loaded.pop("store"))  # fills the window while it's still hidden
+        boot_done = not wait_for_video or warmstart.is_ready(since=started) or time.time() >= deadline
+        if boot_done and not loading:
+            reveal()
+        else:
+            root.after(50, poll)
+
+    poll()
+    return app
+
 if __name__ == "__main__":
     root = tk.Tk()
-    app = PixieVaultApp(root)
-    root.mainloop()
+    if "--warm-start" in sys.argv[1:]:
+        app = warm_start(root)
+    else:
+        store = unlock_store(root)
+        if store is None:
+            sys.exit(0)
+        app = PixieVaultApp(root, store)
+    root.mainloop()
\ No newline at end of file
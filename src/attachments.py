@@ -0,0 +1,271 @@
+# src/attachments.py
+# File attachments (SSH keys, certificates, recovery codes) kept outside the
+# vault in a content-addressed chunk store, so they never pass through the
+# JSON load/save/search paths. An entry only holds a small reference:
+#
+#   "attachments": [{"id": "<uuid>", "name": "id_ed25519", "size": 411, "sha256": "..."}]
+#
+#   data/vault.blobs/manifests/<id>.json   {"size", "sha256", "enc", "chunks": [[addr, size], ...]}
+#   data/vault.blobs/chunks/ab/<addr>      1 MiB chunk, raw or a Fernet token
+#   data/vault.blobs/key.json              data key, wrapped by the vault key
+#
+# Files are streamed in and out one chunk at a time and chunks are read
+# through mmap. Identical chunks are stored once. With encryption on, chunks
+# are sealed with a random data key and addressed by an HMAC under it (so
+# addresses don't reveal content); the data key is wrapped by the vault key,
+# which makes a password change a rewrap of key.json rather than a rewrite of
+# every chunk.
+import hashlib, hmac, json, mmap, os, tempfile, time, uuid
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Set, Tuple
+
+import crypto
+from storage import atomic_write
+
+CHUNK_SIZE = 1 << 20
+# gc() leaves manifests younger than this alone: a file may have been stored
+# but not yet linked to its entry
+GC_GRACE = 300
+
+class AttachmentError(Exception):
+    pass
+
+def _write_bytes(path: str, data: bytes):
+    # Same crash-safety as storage.atomic_write, for binary chunks
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".chunk.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+class BlobStore:
+    def __init__(self, root: str, vault_key: bytes | None):
+        self.root = root
+        self.vault_key = vault_key
+        self._dk: bytes | None = None
+
+    # --- Keys ---
+    def _key_path(self) -> str:
+        return os.path.join(self.root, "key.json")
+
+    def _wrap(self, data_key: bytes, vault_keys: Iterable[bytes]):
+        tokens = [crypto.encrypt_blob(k, data_key).decode("ascii") for k in vault_keys]
+        atomic_write(self._key_path(), json.dumps({"tokens": tokens}))
+
+    def _unwrap(self, vault_key: bytes) -> bytes | None:
+        try:
+            with open(self._key_path(), "r", encoding="utf-8") as f:
+                tokens = json.load(f)["tokens"]
+        except OSError:
+            return None
+        for token in tokens:  # during a key rotation the data key is wrapped by both keys
+            try:
+                return crypto.decrypt_blob(vault_key, token.encode("ascii"))
+            except crypto.BadPassword:
+                continue
+        raise crypto.BadPassword("attachment key can't be unwrapped with the vault key")
+
+    def _pending_path(self) -> str:
+        return os.path.join(self.root, "key.pending")
+
+    def data_key(self) -> bytes | None:
+        if self.vault_key is None:
+            # Encryption is being turned on (see migrate): new files already
+            # use the key the vault is about to get
+            try:
+                with open(self._pending_path(), "rb") as f:
+                    return f.read()
+            except OSError:
+                return None
+        if self._dk is None:
+            dk = self._unwrap(self.vault_key)
+            if dk is None:
+                dk = crypto.new_data_key()
+                self._wrap(dk, [self.vault_key])
+            self._dk = dk
+        return self._dk
+
+    # --- Chunks and manifests ---
+    def _chunk_path(self, addr: str) -> str:
+        return os.path.join(self.root, "chunks", addr[:2], addr)
+
+    def _manifest_path(self, att_id: str) -> str:
+        return os.path.join(self.root, "manifests", att_id + ".json")
+
+    def _address(self, data: bytes, dk: bytes | None) -> str:
+        if dk is None:
+            return hashlib.sha256(data).hexdigest()
+        return hmac.new(dk, data, hashlib.sha256).hexdigest()
+
+    def _put_chunk(self, data: bytes, dk: bytes | None) -> str:
+        addr = self._address(data, dk)
+        path = self._chunk_path(addr)
+        if not os.path.exists(path):  # dedupe: same content, same address
+            _write_bytes(path, crypto.encrypt_blob(dk, data) if dk else data)
+        return addr
+
+    def _map_chunk(self, addr: str) -> mmap.mmap:
+        with open(self._chunk_path(addr), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)  # chunks are never empty
+
+    def _chunks(self, man: Dict[str, Any]) -> Iterator[bytes | memoryview]:
+        # Plaintext chunks are handed out as views of the mapping, valid until
+        # the next item is requested
+        dk = self._manifest_key(man)
+        for addr, _size in man["chunks"]:
+            mm = self._map_chunk(addr)
+            try:
+                if dk is None:
+                    with memoryview(mm) as view:
+                        yield view
+                else:
+                    yield crypto.decrypt_blob(dk, mm[:])
+            finally:
+                mm.close()
+
+    def manifest(self, att_id: str) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path(att_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise AttachmentError(f"attachment {att_id} is missing from {self.root}")
+
+    def _manifest_key(self, man: Dict[str, Any]) -> bytes | None:
+        if not man.get("enc"):
+            return None
+        dk = self.data_key()
+        if dk is None:
+            raise crypto.VaultLocked("attachment is encrypted; unlock the vault first")
+        return dk
+
+    # --- Public API ---
+    def put(self, src: BinaryIO, name: str) -> Dict[str, Any]:
+        """Stream `src` into the store. Returns the reference to keep on the entry."""
+        dk = self.data_key()
+        digest = hashlib.sha256()
+        chunks: List[Tuple[str, int]] = []
+        size = 0
+        while True:
+            data = src.read(CHUNK_SIZE)
+            if not data:
+                break
+            digest.update(data)
+            chunks.append((self._put_chunk(data, dk), len(data)))
+            size += len(data)
+        att_id = str(uuid.uuid4())
+        man = {"id": att_id, "size": size, "sha256": digest.hexdigest(), "enc": dk is not None, "chunks": chunks}
+        atomic_write(self._manifest_path(att_id), json.dumps(man, separators=(",", ":")))
+        return {"id": att_id, "name": name, "size": size, "sha256": man["sha256"]}
+
+    def read(self, att_id: str) -> Iterator[bytes | memoryview]:
+        """Yield the attachment's contents chunk by chunk. Each item is only
+        valid until the next one is requested; copy it to keep it."""
+        return self._chunks(self.manifest(att_id))
+
+    def save_to(self, att_id: str, dest: str) -> str:
+        """Write the attachment to `dest` (atomically), verifying its checksum."""
+        man = self.manifest(att_id)
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(dest))
+        fd, tmp = tempfile.mkstemp(prefix=".attachment.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for part in self._chunks(man):
+                    digest.update(part)
+                    f.write(part)
+            if digest.hexdigest() != man["sha256"]:
+                raise AttachmentError(f"attachment {att_id} is corrupt (checksum mismatch)")
+            os.replace(tmp, dest)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return dest
+
+    def manifests(self) -> List[str]:
+        folder = os.path.join(self.root, "manifests")
+        if not os.path.isdir(folder):
+            return []
+        return [n[:-5] for n in os.listdir(folder) if n.endswith(".json")]
+
+    def gc(self, live: Set[str], grace: float = GC_GRACE) -> Dict[str, int]:
+        """Delete manifests not in `live` and chunks no remaining manifest uses."""
+        removed = {"manifests": 0, "chunks": 0, "bytes": 0}
+        keep: Set[str] = set()
+        cutoff = time.time() - grace
+        for att_id in self.manifests():
+            if att_id in live or os.path.getmtime(self._manifest_path(att_id)) > cutoff:
+                keep.update(addr for addr, _ in self.manifest(att_id)["chunks"])
+            else:
+                os.remove(self._manifest_path(att_id))
+                removed["manifests"] += 1
+        chunk_root = os.path.join(self.root, "chunks")
+        if os.path.isdir(chunk_root):
+            for sub in os.listdir(chunk_root):
+                for addr in os.listdir(os.path.join(chunk_root, sub)):
+                    if addr not in keep and not addr.endswith(".tmp"):
+                        path = os.path.join(chunk_root, sub, addr)
+                        removed["bytes"] += os.path.getsize(path)
+                        os.remove(path)
+                        removed["chunks"] += 1
+        return removed
+
+    # --- Key rotation (see rekey.py) ---
+    def migrate(self, new_vault_key: bytes | None):
+        """Prepare for a switch to `new_vault_key` (None = plaintext). Safe to
+        interrupt and re-run: each manifest is replaced only once its chunks
+        exist in the new form."""
+        if new_vault_key is None and not os.path.isdir(self.root):
+            return  # nothing was ever encrypted
+        old_dk = self.data_key()
+        if new_vault_key is not None and self.vault_key is not None:
+            # Password change: same data key, wrapped by both until finish()
+            self._wrap(old_dk, [self.vault_key, new_vault_key])
+            return
+        new_dk = None
+        if new_vault_key is not None:
+            # Turning encryption on. Until finish() the vault itself is still
+            # plaintext, so the new data key can sit unwrapped next to it: an
+            # interrupted run resumed with a different password must still be
+            # able to read chunks the first run already encrypted.
+            new_dk = old_dk  # key.pending from an interrupted run
+            if new_dk is None:
+                new_dk = crypto.new_data_key()
+                _write_bytes(self._pending_path(), new_dk)
+            self._wrap(new_dk, [new_vault_key])
+        for att_id in self.manifests():
+            man = self.manifest(att_id)
+            if bool(man.get("enc")) == (new_dk is not None):
+                continue
+            chunks = [(self._put_chunk(bytes(part), new_dk), len(part)) for part in self._chunks(man)]
+            atomic_write(self._manifest_path(att_id),
+                         json.dumps(dict(man, enc=new_dk is not None, chunks=chunks), separators=(",", ":")))
+
+    def finish(self, new_vault_key: bytes | None, live: Set[str]):
+        """After the vault switched keys: drop the old wrapping and old chunks."""
+        self.vault_key = new_vault_key
+        self._dk = None
+        if not os.path.isdir(self.root):
+            return
+        if new_vault_key is None:
+            paths = [self._key_path()]
+        else:
+            self._wrap(self._unwrap(new_vault_key), [new_vault_key])
+            paths = [self._pending_path()]
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.gc(live)
@@ -0,0 +1,328 @@
+# src/backup.py
+# Snapshot backups of the vault. A snapshot is the vault as stored on disk
+# (entries still sealed when encryption is on), written as a header line with
+# everything but the entries followed by one JSON line per entry, and cut into
+# content-defined chunks that are stored once each:
+#
+#   data/vault.snapshots/snapshots/<id>.json   {"id", "created_at", "label", "entries", "size",
+#                                                "sha256", "attachments", "chunks": [[addr, size], ...]}
+#   data/vault.snapshots/chunks/ab/<addr>      zlib-compressed chunk; addr = sha256 of its contents
+#
+# Cut points depend on the content, not on offsets: a chunk ends after a line
+# whose CRC falls below a threshold proportional to the line's length, so
+# chunks average AVG_CHUNK bytes and an added, edited or removed entry only
+# changes the chunk it sits in. The other chunks are already stored, so a
+# snapshot after a small edit writes a few KB plus its manifest.
+# Listing and restoring to a file only read these files: they need neither the
+# vault key nor the app. A key rotation re-seals every snapshot (see reseal),
+# so none is left in plain text or under a key the vault no longer has.
+import hashlib, json, os, time, zlib
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from storage import FileLock, atomic_write
+
+MIN_CHUNK = 4 << 10
+AVG_CHUNK = 16 << 10
+MAX_CHUNK = 64 << 10
+LEVEL = 6  # zlib level: most of the gain of 9 at a fraction of the time
+
+class BackupError(Exception):
+    pass
+
+def snapshot_dir(data_path: str) -> str:
+    return os.path.splitext(data_path)[0] + ".snapshots"
+
+def _line(obj: Dict[str, Any]) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+def encode(meta: Dict[str, Any], entries: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """The vault as lines: everything but the entries, then one entry per line."""
+    yield _line(meta)
+    for d in entries:
+        yield _line(d)
+
+def decode(data: bytes) -> Dict[str, Any]:
+    lines = data.split(b"\n")
+    vault = json.loads(lines[0])
+    vault["entries"] = [json.loads(line) for line in lines[1:] if line]
+    return vault
+
+def chunks(lines: Iterable[bytes]) -> Iterator[bytes]:
+    """Cut a stream of lines into content-defined chunks of MIN_CHUNK to
+    MAX_CHUNK bytes (only a single line longer than that is split)."""
+    buf: List[bytes] = []
+    size = 0
+    for line in lines:
+        n = len(line)
+        if buf and (size + n > MAX_CHUNK or n > MAX_CHUNK):
+            yield b"".join(buf)
+            buf, size = [], 0
+        if n > MAX_CHUNK:
+            for i in range(0, n, MAX_CHUNK):
+                yield line[i:i + MAX_CHUNK]
+            continue
+        buf.append(line)
+        size += n
+        if size >= MIN_CHUNK and zlib.crc32(line) < (n << 32) // AVG_CHUNK:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
+
+def _sync(paths: List[str]):
+    # One sync() flushes every new chunk at once; fsyncing each of them costs
+    # a round trip to the SD card per chunk
+    if hasattr(os, "sync"):
+        os.sync()
+        return
+    for path in paths:
+        with open(path, "rb+") as f:
+            os.fsync(f.fileno())
+
+class SnapshotStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def _chunk_path(self, addr: str) -> str:
+        return os.path.join(self.root, "chunks", addr[:2], addr)
+
+    def _manifest_path(self, snapshot_id: str) -> str:
+        return os.path.join(self.root, "snapshots", snapshot_id + ".json")
+
+    def _lock(self) -> FileLock:
+        # take() and prune() exclude each other: gc must not delete a chunk a
+        # snapshot being written counts on
+        os.makedirs(self.root, exist_ok=True)
+        return FileLock(os.path.join(self.root, "lock"))
+
+    # --- Writing ---
+    def take(self, lines: Iterable[bytes], label: str = "", entries: int = 0,
+             attachments: Iterable[str] = (), skip_unchanged: bool = False) -> Dict[str, Any] | None:
+        """Store a snapshot of `lines` (see encode). Returns its manifest with
+        "written" = compressed bytes of new chunks, or None if `skip_unchanged`
+        and the newest snapshot has the same contents."""
+        with self._lock():
+            digest, refs, pending, written = self._write_chunks(lines)
+            try:
+                newest = self.list()[:1]
+                if skip_unchanged and newest and newest[0]["sha256"] == digest:
+                    self._discard(pending)
+                    return None
+                self._publish(pending)
+            except BaseException:
+                self._discard(pending)
+                raise
+            now = time.time()
+            snapshot_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + "-" + digest[:6]
+            man = {"id": snapshot_id, "created_at": int(now), "label": label, "entries": entries,
+                   "size": sum(n for _, n in refs), "sha256": digest,
+                   "attachments": sorted(set(attachments)), "chunks": refs}
+            atomic_write(self._manifest_path(snapshot_id), json.dumps(man, separators=(",", ":")))
+            return dict(man, written=written)
+
+    def _write_chunks(self, lines: Iterable[bytes]) -> Tuple[str, List[Tuple[str, int]], Dict[str, str], int]:
+        # Chunks of `lines` not stored yet go to .tmp files: (sha256 of it all,
+        # chunk refs, tmp path -> final path, compressed bytes written).
+        # _publish() makes them count, _discard() drops them.
+        digest = hashlib.sha256()
+        refs: List[Tuple[str, int]] = []
+        pending: Dict[str, str] = {}
+        written = 0
+        try:
+            for data in chunks(lines):
+                digest.update(data)
+                addr = hashlib.sha256(data).hexdigest()
+                refs.append((addr, len(data)))
+                path = self._chunk_path(addr)
+                if path + ".tmp" in pending or os.path.exists(path):
+                    continue  # stored once
+                packed = zlib.compress(data, LEVEL)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(packed)
+                pending[tmp] = path
+                written += len(packed)
+        except BaseException:
+            self._discard(pending)
+            raise
+        return digest.hexdigest(), refs, pending, written
+
+    def _publish(self, pending: Dict[str, str]):
+        # New chunks reach the disk before anything names them
+        _sync(list(pending))
+        for tmp, path in pending.items():
+            os.replace(tmp, path)
+        if pending:
+            _sync(list(pending.values()))
+
+    def _discard(self, pending: Dict[str, str]):
+        for tmp in pending:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def reseal(self, old_key: bytes | None, old_header: Dict[str, Any] | None,
+               new_key: bytes | None, new_header: Dict[str, Any] | None) -> int:
+        """After a key rotation: rewrite every snapshot taken in plain text or
+        under `old_key` so its entries are sealed with `new_key` (or plain
+        text if None). Ids, times and labels stay; the old chunks are deleted.
+        Snapshots already under the new key, or under a key older than
+        `old_key`, are left alone. Returns how many were rewritten."""
+        import crypto  # only needed here
+        resealed: Dict[bytes, bytes] = {}  # entry line -> new line: snapshots share most entries
+        count = 0
+        with self._lock():
+            for m in self.list():
+                lines = self.read(m["id"]).split(b"\n")
+                meta = json.loads(lines[0])
+                header = meta.get("crypto")
+                if header == new_header or (header is not None and header != old_header):
+                    continue
+                key = old_key if header is not None else None
+                out = [b""]
+                for line in lines[1:]:
+                    if not line:
+                        continue
+                    new = resealed.get(line)
+                    if new is None:
+                        new = resealed[line] = _line(crypto.reseal_chunk(key, new_key, [json.loads(line)])[0])
+                    out.append(new)
+                if new_header is None:
+                    meta.pop("crypto", None)
+                else:
+                    meta["crypto"] = new_header
+                out[0] = _line(meta)
+                digest, refs, pending, _ = self._write_chunks(out)
+                try:
+                    self._publish(pending)
+                except BaseException:
+                    self._discard(pending)
+                    raise
+                path = self._manifest_path(m["id"])
+                st = os.stat(path)
+                man = dict(self._read_manifest(m["id"]), size=sum(n for _, n in refs), sha256=digest, chunks=refs)
+                atomic_write(path, json.dumps(man, separators=(",", ":")))
+                os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))  # list() orders by it within a second
+                count += 1
+            if count:
+                self._gc()
+        return count
+
+    # --- Reading ---
+    def list(self) -> List[Dict[str, Any]]:
+        """Every snapshot's manifest without its chunk list, newest first."""
+        folder = os.path.join(self.root, "snapshots")
+        if not os.path.isdir(folder):
+            return []
+        found = []
+        for name in os.listdir(folder):
+            if name.endswith(".json"):
+                path = os.path.join(folder, name)
+                with open(path, "r", encoding="utf-8") as f:
+                    man = json.load(f)
+                man.pop("chunks", None)
+                # created_at is in whole seconds; the file time orders snapshots within one
+                found.append(((man["created_at"], os.stat(path).st_mtime_ns), man))
+        found.sort(key=lambda x: x[0], reverse=True)
+        return [man for _, man in found]
+
+    def manifest(self, ref: str) -> Dict[str, Any]:
+        """A snapshot's manifest by id or unique id prefix ("latest" = newest)."""
+        ids = [m["id"] for m in self.list()]
+        if ref == "latest" and ids:
+            hits = ids[:1]
+        else:
+            hits = [i for i in ids if i.startswith(ref)]
+        if len(hits) != 1:
+            raise BackupError(f"no snapshot matches {ref!r}" if not hits else f"snapshot {ref!r} is ambiguous")
+        return self._read_manifest(hits[0])
+
+    def _read_manifest(self, snapshot_id: str) -> Dict[str, Any]:
+        with open(self._manifest_path(snapshot_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def read(self, ref: str) -> bytes:
+        """A snapshot's contents, checked against its checksum."""
+        man = self.manifest(ref)
+        parts = []
+        for addr, size in man["chunks"]:
+            try:
+                with open(self._chunk_path(addr), "rb") as f:
+                    data = zlib.decompress(f.read())
+            except (OSError, zlib.error) as e:
+                raise BackupError(f"snapshot {man['id']}: chunk {addr[:12]} is unreadable ({e})")
+            if len(data) != size:
+                raise BackupError(f"snapshot {man['id']}: chunk {addr[:12]} is corrupt")
+            parts.append(data)
+        data = b"".join(parts)
+        if hashlib.sha256(data).hexdigest() != man["sha256"]:
+            raise BackupError(f"snapshot {man['id']} is corrupt (checksum mismatch)")
+        return data
+
+    def load(self, ref: str) -> Dict[str, Any]:
+        """A snapshot as vault data (entries sealed if they were)."""
+        return decode(self.read(ref))
+
+    def restore_to(self, ref: str, path: str) -> str:
+        """Write a snapshot out as a standalone vault.json at `path`."""
+        if os.path.exists(path):
+            raise BackupError(f"{path} already exists")
+        atomic_write(path, json.dumps(self.load(ref), ensure_ascii=False, indent=2))
+        return path
+
+    def attachment_ids(self) -> Set[str]:
+        """Attachments some snapshot refers to (kept by gc_attachments)."""
+        return {a for m in self.list() for a in m.get("attachments", ())}
+
+    # --- Retention ---
+    def prune(self, keep_last: int = 10, keep_daily: int = 7) -> Dict[str, int]:
+        """Keep the `keep_last` newest snapshots and the newest one of each of
+        the last `keep_daily` days that have any; delete the rest and the
+        chunks only they used."""
+        with self._lock():
+            snaps = self.list()
+            keep = {m["id"] for m in snaps[:keep_last]}
+            days: Set[str] = set()
+            for m in snaps:
+                day = time.strftime("%Y-%m-%d", time.localtime(m["created_at"]))
+                if day not in days and len(days) < keep_daily:
+                    days.add(day)
+                    keep.add(m["id"])
+            removed = {"snapshots": 0, "chunks": 0, "bytes": 0}
+            for m in snaps:
+                if m["id"] not in keep:
+                    os.remove(self._manifest_path(m["id"]))
+                    removed["snapshots"] += 1
+            gc = self._gc()
+            removed["chunks"], removed["bytes"] = gc["chunks"], gc["bytes"]
+            return removed
+
+    def _gc(self) -> Dict[str, int]:
+        live: Set[str] = set()
+        for m in self.list():
+            live.update(addr for addr, _ in self._read_manifest(m["id"])["chunks"])
+        removed = {"chunks": 0, "bytes": 0}
+        chunk_root = os.path.join(self.root, "chunks")
+        if not os.path.isdir(chunk_root):
+            return removed
+        for sub in os.listdir(chunk_root):
+            for name in os.listdir(os.path.join(chunk_root, sub)):
+                if name not in live:  # includes .tmp left by an interrupted take()
+                    path = os.path.join(chunk_root, sub, name)
+                    removed["bytes"] += os.path.getsize(path)
+                    os.remove(path)
+                    removed["chunks"] += 1
+        return removed
+
+    def usage(self) -> Dict[str, int]:
+        """Snapshots kept, what they hold in total, and what that takes on disk."""
+        snaps = self.list()
+        stored = 0
+        chunk_root = os.path.join(self.root, "chunks")
+        if os.path.isdir(chunk_root):
+            for sub in os.listdir(chunk_root):
+                for name in os.listdir(os.path.join(chunk_root, sub)):
+                    stored += os.path.getsize(os.path.join(chunk_root, sub, name))
+        return {"snapshots": len(snaps), "logical_bytes": sum(m["size"] for m in snaps), "stored_bytes": stored}
@@ -0,0 +1,284 @@
+# src/bodies.py
+# Bounded-memory mode ("bounded_memory": true under "storage"). Entries keep
+# only what the list and search need in memory: name, protocol, website,
+# username, custom fields, timestamps and attachment references. The body,
+# password and notes, is written to a spill file and read back on demand
+# through an LRU cache with a fixed byte budget:
+#
+#   LazyEntry(name=..., _ref=(store, 4711))  ──get(ref)──>  LRU  ──miss──>  spill file @ offset
+#
+# The spill file is an anonymous temporary file next to the vault: it is
+# never visible under a name and disappears with the process. Records are
+# only ever appended, so a ref stays valid as long as its file, and a Storage
+# view can keep pointing at the body its version had. Once most of the file
+# is records nothing points at any more (every save of a changed entry adds
+# its new sealed form), Storage copies the live ones to a fresh file and
+# moves the entries there; views taken before keep the old file open until
+# they are dropped. For an encrypted vault every record is encrypted under a
+# key that only lives in this process (from the point the vault is
+# encrypted, if that happens later: what was spilled before was plain text
+# on disk in the vault file anyway).
+#
+# The vault's sealed form of each entry (needed to save without re-encrypting
+# everything) is parked in the same file; see Storage._spill.
+import json, sys, tempfile, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+
+from model import Entry
+
+BODY_FIELDS = ("password", "notes")
+ENTRY_OVERHEAD = 160  # cache node, tuple and key; counted against the budget per body
+COMPACT_MIN = 1 << 20  # dead bytes before compacting the spill file is worth a pass
+_PASSWORD = Entry.__dict__["password"]  # the slots under the properties below
+_NOTES = Entry.__dict__["notes"]
+
+def _ref(offset: int, length: int) -> int:
+    return offset << 32 | length
+
+class BodyStore:
+    def __init__(self, directory: str, budget: int):
+        self.budget = budget
+        self._key: bytes | None = None
+        self._encrypted_from = 0  # records at this offset and later are encrypted with _key
+        self._file = tempfile.TemporaryFile(prefix=".bodies.", dir=directory)
+        self._end = 0
+        self._unflushed = False
+        self._cache: "OrderedDict[int, Tuple[Tuple[str, str], int]]" = OrderedDict()  # ref -> (body, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()  # .scanning: this thread's reads bypass the cache
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._cache.clear()
+            self._bytes = 0
+
+    @property
+    def end(self) -> int:
+        """Bytes written to the spill file so far."""
+        return self._end
+
+    # --- Raw records ---
+    def append(self, data: bytes) -> int:
+        with self._lock:
+            self._file.seek(self._end)
+            self._file.write(data)
+            ref = _ref(self._end, len(data))
+            self._end += len(data)
+            self._unflushed = True
+            return ref
+
+    def read(self, ref: int) -> bytes:
+        with self._lock:
+            if self._unflushed:
+                self._file.flush()
+                self._unflushed = False
+            self._file.seek(ref >> 32)
+            return self._file.read(ref & 0xFFFFFFFF)
+
+    def append_json(self, obj: Any) -> int:
+        return self.append(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def read_json(self, ref: int) -> Any:
+        return json.loads(self.read(ref))
+
+    def start_encrypting(self, key: bytes):
+        """Encrypt every body stored from now on with `key`."""
+        with self._lock:
+            if self._key is None:
+                self._key, self._encrypted_from = key, self._end
+
+    # --- Bodies ---
+    def put(self, body: Tuple[str, str]) -> int:
+        data = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if self._key is not None:
+            import crypto  # only needed here
+            data = crypto.encrypt_blob(self._key, data)
+        return self.append(data)
+
+    def get(self, ref: int) -> Tuple[str, str]:
+        """(password, notes) stored under `ref`."""
+        scanning = getattr(self._local, "scanning", 0)
+        with self._lock:
+            hit = self._cache.get(ref)
+            if hit is not None:
+                if not scanning:
+                    self._cache.move_to_end(ref)
+                    self.hits += 1
+                return hit[0]
+        data = self.read(ref)
+        if self._key is not None and ref >> 32 >= self._encrypted_from:
+            import crypto  # only needed here
+            data = crypto.decrypt_blob(self._key, data)
+        password, notes = json.loads(data)
+        body = (password, notes)
+        if scanning:
+            return body
+        size = sys.getsizeof(password) + sys.getsizeof(notes) + ENTRY_OVERHEAD
+        with self._lock:
+            self.misses += 1
+            if ref not in self._cache and size <= self.budget:
+                self._cache[ref] = (body, size)
+                self._bytes += size
+                while self._bytes > self.budget:
+                    _, (_, evicted) = self._cache.popitem(last=False)
+                    self._bytes -= evicted
+        return body
+
+    @contextmanager
+    def scan(self) -> Iterator[None]:
+        """Reads on this thread inside the block neither fill the cache nor
+        count towards its hit rate: a pass over every entry (a save, an
+        export, a search in the notes) would otherwise flush the working set."""
+        self._local.scanning = getattr(self._local, "scanning", 0) + 1
+        try:
+            yield
+        finally:
+            self._local.scanning -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            looked_up = self.hits + self.misses
+            return {
+                "cache_bodies": len(self._cache),
+                "cache_bytes": self._bytes,
+                "budget_bytes": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / looked_up, 4) if looked_up else 0.0,
+                "spill_bytes": self._end,
+            }
+
+class LazyEntry(Entry):
+    """An Entry whose password and notes may live in a BodyStore. Reading
+    them loads the body (through the cache); setting either brings the body
+    back into the entry until Storage spills it again."""
+    __slots__ = ("_ref",)
+
+    def __init__(self, *args, **kwargs):
+        self._ref: Tuple[BodyStore, int] | None = None  # None: password and notes are in the slots
+        super().__init__(*args, **kwargs)
+
+    # Readers may be on another thread than the one spilling or compacting:
+    # the store and ref are swapped together as one tuple, and spill() sets
+    # it before it clears the slots, so a slot value read while the ref was
+    # None both before and after is still current.
+    def _body_field(self, i: int, slot) -> str:
+        while True:
+            ref = self._ref
+            if ref is not None:
+                return ref[0].get(ref[1])[i]
+            v = slot.__get__(self)
+            if self._ref is None:
+                return v
+
+    def _get_password(self) -> str:
+        return self._body_field(0, _PASSWORD)
+
+    def _get_notes(self) -> str:
+        return self._body_field(1, _NOTES)
+
+    def _set_password(self, value: str):
+        ref = self._ref
+        if ref is not None:
+            if value == ref[0].get(ref[1])[0]:
+                return  # unchanged: keep the spilled record rather than write it again
+            self._load_body()
+        _PASSWORD.__set__(self, value)
+
+    def _set_notes(self, value: str):
+        ref = self._ref
+        if ref is not None:
+            if value == ref[0].get(ref[1])[1]:
+                return
+            self._load_body()
+        _NOTES.__set__(self, value)
+
+    password = property(_get_password, _set_password)
+    notes = property(_get_notes, _set_notes)
+
+    def _load_body(self):
+        ref = self._ref
+        if ref is not None:
+            password, notes = ref[0].get(ref[1])
+            _PASSWORD.__set__(self, password)
+            _NOTES.__set__(self, notes)
+            self._ref = None
+
+    def spill(self, bodies: BodyStore) -> bool:
+        """Move the body to `bodies`. False if it already was elsewhere."""
+        if self._ref is not None:
+            return False
+        self._ref = (bodies, bodies.put((_PASSWORD.__get__(self), _NOTES.__get__(self))))
+        _PASSWORD.__set__(self, "")
+        _NOTES.__set__(self, "")
+        return True
+
+    def move_body(self, bodies: BodyStore) -> int:
+        """Copy a body spilled elsewhere into `bodies` and point there
+        (compaction). Returns the bytes it takes in `bodies`."""
+        ref = self._ref
+        if ref is None:
+            return 0
+        if ref[0] is not bodies:
+            ref = self._ref = (bodies, bodies.put(ref[0].get(ref[1])))
+        return ref[1] & 0xFFFFFFFF
+
+    def spilled_bytes(self, bodies: BodyStore) -> int:
+        """Bytes of `bodies` this entry's current body takes (0 if none)."""
+        ref = self._ref
+        return ref[1] & 0xFFFFFFFF if ref is not None and ref[0] is bodies else 0
+
+    def _raw(self) -> Tuple[str, str, Tuple[BodyStore, int] | None]:
+        # Same order as the getters: ref, slots, ref again
+        while True:
+            ref = self._ref
+            if ref is not None:
+                return ("", "", ref)
+            password, notes = _PASSWORD.__get__(self), _NOTES.__get__(self)
+            if self._ref is None:
+                return (password, notes, None)
+
+    def _put_raw(self, raw: Tuple[str, str, Tuple[BodyStore, int] | None]):
+        _PASSWORD.__set__(self, raw[0])
+        _NOTES.__set__(self, raw[1])
+        self._ref = raw[2]
+
+    def assign(self, other: Entry):
+        for k in Entry.__slots__:
+            if k not in BODY_FIELDS:
+                setattr(self, k, getattr(other, k))
+        raw = other._raw() if isinstance(other, LazyEntry) else (other.password, other.notes, None)
+        if raw[2] is None and self._ref is not None and (raw[0], raw[1]) == self._ref[0].get(self._ref[1]):
+            return  # same body as the record we point at: keep it rather than write it again
+        self._put_raw(raw)
+
+    def copy(self) -> "LazyEntry":
+        """A separate entry sharing this one's body record (records are never
+        rewritten, so the copy keeps the body it was taken with)."""
+        e = LazyEntry.__new__(LazyEntry)
+        e._put_raw(self._raw())
+        for k in Entry.__slots__:
+            if k not in BODY_FIELDS:
+                setattr(e, k, getattr(self, k))
+        return e
+
+def resident_bytes(entries) -> int:
+    """Rough size of what stays in memory per entry (the objects and the
+    strings and dicts they hold; interned strings count every time)."""
+    total = 0
+    size = sys.getsizeof
+    for e in entries:
+        total += size(e) + size(e.id) + size(e.name) + size(e.website) + size(e.username)
+        if e.custom:
+            total += size(e.custom) + sum(size(v) for v in e.custom.values())
+        if e.attachments:
+            total += size(e.attachments) + sum(size(a) for a in e.attachments)
+        if e._ref is None:
+            total += size(e.password) + size(e.notes)
+    return total
@@ -0,0 +1,445 @@
+# src/cli.py
+# Headless command line for the vault. Built only on storage.py/search.py so it
+# never imports tkinter or PIL. Every command prints JSON lines on stdout.
+#
+#   pixievault list --sort updated
+#   pixievault search git --field website
+#   pixievault get 3f2a9c1e
+#   pixievault add --name "GitHub – Work" --website github.com --custom Category=Dev
+#   pixievault add --jsonl new_entries.jsonl      # one commit for the whole file
+#   pixievault delete ID [ID ...]
+#   pixievault stats
+#   pixievault rekey [--remove]                 # set/change the master password
+#   pixievault attachment add 3f2a9c1e ~/.ssh/id_ed25519
+#   pixievault sync export /media/usb          # then `sync import` on the other Pi
+#   pixievault backup take --label "before cleanup"
+import argparse, getpass, json, os, sys
+from typing import Any, Dict, Iterable, List
+
+from storage import Storage
+from search import sort_entries
+from vaultclient import DaemonError, VaultClient, open_store
+import crypto
+from model import BASE_FIELDS, Entry, to_json
+
+SORT_ALIASES = {
+    "az": "A→Z", "a-z": "A→Z", "name": "A→Z",
+    "added": "Recently Added",
+    "updated": "Recently Updated",
+    "used": "Most Used",
+}
+
+class CliError(Exception):
+    pass
+
+def _out(obj: Any):
+    sys.stdout.write(json.dumps(obj, ensure_ascii=False, default=to_json) + "\n")
+
+def _public(e: Entry | Dict[str, Any], reveal: bool) -> Dict[str, Any]:
+    d = e.to_dict() if isinstance(e, Entry) else e
+    if reveal:
+        return d
+    return {k: v for k, v in d.items() if k != "password"}
+
+def _sort_mode(name: str | None) -> str:
+    if not name:
+        return "A→Z"
+    return SORT_ALIASES.get(name.lower(), name)
+
+def _parse_custom(pairs: List[str] | None, flag: str = "--custom") -> Dict[str, str]:
+    custom = {}
+    for p in pairs or []:
+        if "=" not in p:
+            raise CliError(f"{flag} expects KEY=VALUE, got {p!r}")
+        k, v = p.split("=", 1)
+        custom[k.strip()] = v
+    return custom
+
+def _read_jsonl(path: str) -> Iterable[Dict[str, Any]]:
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for n, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise CliError(f"{path}:{n}: {e}")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def _resolve(store: Storage, ref: str) -> Entry:
+    """Find an entry by full id or by a unique id prefix (the list view shows 8 chars)."""
+    e = store.get_entry(ref)
+    if e:
+        return e
+    hits = [e for e in store.all_entries() if e.id.startswith(ref)]
+    if len(hits) == 1:
+        return hits[0]
+    raise CliError(f"no entry matches id {ref!r}" if not hits else f"id prefix {ref!r} is ambiguous")
+
+def _fields_from_args(args) -> Dict[str, Any]:
+    return {k: getattr(args, k) for k in BASE_FIELDS if getattr(args, k) is not None}
+
+# --- Commands ---
+def cmd_list(store: Storage, args):
+    for e in store.query("", None, _sort_mode(args.sort), args.limit, _parse_custom(args.facet, "--facet")):
+        _out(_public(e, args.reveal))
+
+def cmd_search(store: Storage, args):
+    for e in store.query(args.term, args.field, _sort_mode(args.sort), args.limit,
+                         _parse_custom(args.facet, "--facet")):
+        _out(_public(e, args.reveal))
+
+def cmd_site(store: Storage, args):
+    try:
+        entries = store.site_entries(args.url, args.scope)
+    except (ValueError, DaemonError) as e:
+        raise CliError(str(e))
+    for e in entries:
+        _out(_public(e, args.reveal))
+
+def cmd_facets(store: Storage, args):
+    selected = _parse_custom(args.facet, "--facet")
+    ids = None
+    if args.term or selected:
+        ids = [e.id for e in store.query(args.term or "", args.field, facets=selected)]
+    for key, values in sorted(store.facet_counts(ids, args.top).items(), key=lambda kv: kv[0].lower()):
+        _out({"key": key, "values": values})
+
+def cmd_get(store: Storage, args):
+    for ref in args.ids:
+        _out(_resolve(store, ref))
+
+def cmd_add(store: Storage, args):
+    if args.jsonl:
+        items = list(_read_jsonl(args.jsonl))
+    else:
+        if not args.name:
+            raise CliError("add needs --name (or --jsonl FILE)")
+        items = [dict(_fields_from_args(args), custom=_parse_custom(args.custom))]
+    for item in items:
+        if not str(item.get("name", "")).strip():
+            raise CliError(f"entry without a name: {item!r}")
+    with store.batch():
+        for item in items:
+            new_id = store.add_entry(item, item.get("custom") or {})
+            _out({"id": new_id, "name": item["name"]})
+
+def cmd_update(store: Storage, args):
+    if args.jsonl:
+        items = list(_read_jsonl(args.jsonl))
+    else:
+        if not args.id:
+            raise CliError("update needs an ID (or --jsonl FILE)")
+        items = [dict(_fields_from_args(args), id=args.id,
+                      custom=_parse_custom(args.custom), unset=args.unset)]
+    # Resolve everything up front so a bad id doesn't leave a half-applied batch
+    targets = [(_resolve(store, str(item.get("id", ""))), item) for item in items]
+    with store.batch():
+        for e, item in targets:
+            custom = dict(e.custom)
+            if args.jsonl and "custom" in item:
+                custom = item["custom"] or {}  # JSONL rows replace custom wholesale
+            else:
+                custom.update(item.get("custom") or {})
+            for k in item.get("unset") or []:
+                custom.pop(k, None)
+            store.update_entry(e.id, {k: item[k] for k in BASE_FIELDS if k in item}, custom)
+            _out({"id": e.id, "updated": True})
+
+def cmd_delete(store: Storage, args):
+    targets = [_resolve(store, ref) for ref in args.ids]
+    with store.batch():
+        for e in targets:
+            store.delete_entry(e.id)
+            _out({"id": e.id, "deleted": True})
+
+def cmd_history(store: Storage, args):
+    e = _resolve(store, args.id)
+    for v in store.entry_history(e.id):
+        _out(dict(v, entry=_public(v["entry"], args.reveal)))
+
+def cmd_dupes(store: Storage, args):
+    for group in store.find_duplicates(args.threshold):
+        entries = [store.get_entry(i) for i in group["ids"]]
+        _out(dict(group, entries=[_public(e, args.reveal) for e in entries if e is not None]))
+
+def cmd_merge(store: Storage, args):
+    keep = _resolve(store, args.keep)
+    others = [_resolve(store, ref) for ref in args.others]
+    if any(o.id == keep.id for o in others):
+        raise CliError("an entry can't be merged into itself")
+    store.merge_entries(keep.id, [o.id for o in others])
+    _out({"id": keep.id, "merged": [o.id for o in others]})
+
+def cmd_stats(store: Storage, args):
+    entries = store.all_entries()
+    custom_keys: Dict[str, int] = {}
+    for e in entries:
+        for k in e.custom:
+            custom_keys[k] = custom_keys.get(k, 0) + 1
+    stats = {
+        "entries": len(entries),
+        "file_bytes": os.path.getsize(store.data_path) if os.path.exists(store.data_path) else 0,
+        "fields": store.field_labels(),
+        "custom_keys": dict(sorted(custom_keys.items(), key=lambda kv: -kv[1])),
+        "never_accessed": sum(1 for e in entries if not e.access_count),
+        "most_used": [{"id": e.id, "name": e.name, "access_count": e.access_count}
+                      for e in sort_entries(entries, "Most Used")[:5]],
+    }
+    memory = store.memory_stats()
+    if memory is not None:
+        stats["memory"] = memory
+    _out(stats)
+
+def cmd_rekey(store: Storage, args):
+    if not isinstance(store, Storage):
+        raise CliError("stop the vault daemon before changing the master password")
+    import rekey  # only needed here
+    new_password = None
+    if not args.remove:
+        new_password = os.environ.get("PIXIE_NEW_PASSWORD") or getpass.getpass("New master password: ")
+        if "PIXIE_NEW_PASSWORD" not in os.environ and new_password != getpass.getpass("Confirm: "):
+            raise CliError("passwords do not match")
+        if not new_password:
+            raise CliError("empty password")
+    rot = rekey.start(store, new_password, args.workers)
+    while True:
+        rot.join(1.0)
+        _out({"done": rot.done, "total": rot.total, "rate": round(rot.rate, 1)})
+        if rot.finished or rot.error:
+            break
+    if rot.error:
+        raise CliError(rot.status())
+    _out({"status": rot.status()})
+
+def _attachment(e: Entry, ref: str) -> Dict[str, Any]:
+    """Find an attachment on an entry by id prefix or file name."""
+    atts = e.attachments or []
+    hits = [a for a in atts if a["id"].startswith(ref)] or [a for a in atts if a["name"] == ref]
+    if len(hits) == 1:
+        return hits[0]
+    raise CliError(f"no attachment matches {ref!r}" if not hits else f"attachment {ref!r} is ambiguous")
+
+def cmd_attachment(store: Storage, args):
+    import attachments  # only needed here
+    try:
+        if args.action == "gc":
+            _out(store.gc_attachments())
+            return
+        if not args.id:
+            raise CliError(f"attachment {args.action} needs an entry ID")
+        e = _resolve(store, args.id)
+        if args.action == "list":
+            for a in e.attachments or []:
+                _out(a)
+        elif args.action == "add":
+            if len(args.args) != 1:
+                raise CliError("usage: attachment add ID FILE [--name NAME]")
+            if not os.path.isfile(args.args[0]):
+                raise CliError(f"{args.args[0]}: no such file")
+            _out(store.attach_file(e.id, args.args[0], args.name))
+        elif args.action == "get":
+            if len(args.args) != 2:
+                raise CliError("usage: attachment get ID ATTACHMENT DEST")
+            a = _attachment(e, args.args[0])
+            dest = args.args[1]
+            if os.path.isdir(dest):
+                dest = os.path.join(dest, os.path.basename(a["name"]))
+            _out({"id": a["id"], "saved": store.export_attachment(e.id, a["id"], dest)})
+        elif args.action == "rm":
+            if len(args.args) != 1:
+                raise CliError("usage: attachment rm ID ATTACHMENT")
+            a = _attachment(e, args.args[0])
+            _out({"id": a["id"], "removed": store.detach_file(e.id, a["id"])})
+    except (attachments.AttachmentError, crypto.CryptoError, DaemonError, OSError) as e:
+        raise CliError(str(e))
+
+def cmd_backup(store: Storage, args):
+    import backup  # only needed here
+    # Listing and restoring to a file read the snapshot files directly
+    snaps = backup.SnapshotStore(backup.snapshot_dir(os.path.abspath(store.data_path)))
+    try:
+        if args.action == "take":
+            man = store.take_snapshot(args.label or "")
+            _out({k: v for k, v in man.items() if k != "chunks"})
+        elif args.action == "list":
+            for m in snaps.list():
+                _out(m)
+        elif args.action == "usage":
+            _out(snaps.usage())
+        elif args.action == "restore":
+            if not args.id:
+                raise CliError("backup restore needs a snapshot id (or \"latest\")")
+            if args.to:
+                _out({"id": snaps.manifest(args.id)["id"], "saved": snaps.restore_to(args.id, args.to)})
+            else:
+                _out(dict(store.restore_snapshot(args.id), id=snaps.manifest(args.id)["id"]))
+        elif args.action == "prune":
+            _out(store.prune_snapshots(args.keep_last, args.keep_daily))
+    except (backup.BackupError, crypto.CryptoError, DaemonError, OSError) as e:
+        raise CliError(str(e))
+
+def _sync_passphrase(args, confirm: bool) -> str | None:
+    if os.environ.get("PIXIE_SYNC_PASSPHRASE"):
+        return os.environ["PIXIE_SYNC_PASSPHRASE"]
+    if not args.passphrase:
+        return None
+    phrase = getpass.getpass("Sync passphrase: ")
+    if confirm and phrase != getpass.getpass("Confirm: "):
+        raise CliError("passphrases do not match")
+    return phrase
+
+def cmd_sync(store: Storage, args):
+    import sync  # only needed here
+    directory = os.path.abspath(args.dir) if args.dir else None
+    if args.action in ("export", "import") and not directory:
+        raise CliError(f"sync {args.action} needs the bundle directory (e.g. the USB stick)")
+    daemon = isinstance(store, VaultClient)
+    try:
+        if args.action == "export":
+            phrase = _sync_passphrase(args, confirm=True)
+            if daemon:
+                _out(store.call("sync_export", directory=directory, passphrase=phrase, full=args.full))
+            else:
+                _out(sync.export_bundle(store, directory, phrase, args.full))
+        elif args.action == "import":
+            phrase = _sync_passphrase(args, confirm=False)
+            results = (store.call("sync_import", directory=directory, passphrase=phrase) if daemon
+                       else sync.import_bundles(store, directory, phrase))
+            for r in results:
+                _out(r)
+        elif args.action == "status":
+            _out(store.call("sync_status") if daemon else sync.status(store))
+        elif args.action == "conflicts":
+            rows = store.call("sync_conflicts") if daemon else sync.conflicts(store)
+            for r in rows:
+                if not args.reveal and r.get("discarded_kind") == "entry":
+                    r = dict(r, discarded=_public(r["discarded"], False))
+                _out(r)
+    except (sync.SyncError, crypto.CryptoError, DaemonError) as e:
+        raise CliError(str(e))
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="pixievault", description="Pixie Vault command line (JSON lines output)")
+    ap.add_argument("--vault", help="path to vault.json (default: data/vault.json)")
+    ap.add_argument("--config", help="path to config.json (default: data/config.json)")
+    ap.add_argument("--socket", help="talk to the vault daemon on this socket (default: PIXIE_SOCKET / config)")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    def listing(p):
+        p.add_argument("--sort", help="az | added | updated | used (default az)")
+        p.add_argument("--limit", type=int)
+        p.add_argument("--reveal", action="store_true", help="include passwords")
+        p.add_argument("--facet", action="append", metavar="KEY=VALUE", help="only entries with this custom value")
+
+    p = sub.add_parser("list", help="list entries"); listing(p); p.set_defaults(fn=cmd_list)
+    p = sub.add_parser("search", help="search entries")
+    p.add_argument("term")
+    p.add_argument("--field", help="base or custom field to search (default: Any)")
+    listing(p); p.set_defaults(fn=cmd_search)
+    p = sub.add_parser("site", help="entries for a website (any URL or host)")
+    p.add_argument("url")
+    p.add_argument("--scope", choices=("site", "subdomains", "host"), default="site",
+                   help="site: whole registrable domain (default) | subdomains: host and below | host: exact host")
+    p.add_argument("--reveal", action="store_true", help="include passwords")
+    p.set_defaults(fn=cmd_site)
+    p = sub.add_parser("facets", help="custom field values and how many entries have each")
+    p.add_argument("term", nargs="?", help="count only entries matching this search")
+    p.add_argument("--field", help="base or custom field to search (default: Any)")
+    p.add_argument("--facet", action="append", metavar="KEY=VALUE", help="count only entries with this custom value")
+    p.add_argument("--top", type=int, help="values to show per key")
+    p.set_defaults(fn=cmd_facets)
+    p = sub.add_parser("get", help="print entries by id or unique id prefix")
+    p.add_argument("ids", nargs="+"); p.set_defaults(fn=cmd_get)
+
+    def fields(p):
+        for k in BASE_FIELDS:
+            p.add_argument("--" + k)
+        p.add_argument("--custom", action="append", metavar="KEY=VALUE")
+        p.add_argument("--jsonl", metavar="FILE", help="bulk input, one JSON object per line ('-' for stdin)")
+
+    p = sub.add_parser("add", help="add entries"); fields(p); p.set_defaults(fn=cmd_add)
+    p = sub.add_parser("update", help="update entries")
+    p.add_argument("id", nargs="?")
+    p.add_argument("--unset", action="append", metavar="KEY", help="remove a custom field")
+    fields(p); p.set_defaults(fn=cmd_update)
+    p = sub.add_parser("delete", help="delete entries")
+    p.add_argument("ids", nargs="+"); p.set_defaults(fn=cmd_delete)
+    p = sub.add_parser("dupes", help="groups of entries that look like duplicates")
+    p.add_argument("--threshold", type=float, help="similarity needed, 0..1 (default 0.5)")
+    p.add_argument("--reveal", action="store_true", help="include passwords")
+    p.set_defaults(fn=cmd_dupes)
+    p = sub.add_parser("merge", help="merge entries into KEEP and delete them")
+    p.add_argument("keep"); p.add_argument("others", nargs="+"); p.set_defaults(fn=cmd_merge)
+    p = sub.add_parser("stats", help="vault statistics"); p.set_defaults(fn=cmd_stats)
+    p = sub.add_parser("history", help="past versions of an entry, oldest first")
+    p.add_argument("id")
+    p.add_argument("--reveal", action="store_true", help="include passwords")
+    p.set_defaults(fn=cmd_history)
+    p = sub.add_parser("rekey", help="encrypt, change the master password, or decrypt (--remove)")
+    p.add_argument("--remove", action="store_true", help="store entries unencrypted")
+    p.add_argument("--workers", type=int, default=0, help="processes to use (0 = one per CPU)")
+    p.set_defaults(fn=cmd_rekey)
+    p = sub.add_parser("attachment", help="files attached to entries (keys, certificates, ...)")
+    p.add_argument("action", choices=("list", "add", "get", "rm", "gc"))
+    p.add_argument("id", nargs="?", help="entry id or unique prefix")
+    p.add_argument("args", nargs="*", help="add: FILE | get: ATTACHMENT DEST | rm: ATTACHMENT")
+    p.add_argument("--name", help="name to store the file under (add)")
+    p.set_defaults(fn=cmd_attachment)
+    p = sub.add_parser("sync", help="offline sync with other devices through a USB stick")
+    p.add_argument("action", choices=("export", "import", "status", "conflicts"))
+    p.add_argument("dir", nargs="?", help="mount point of the stick (export/import)")
+    p.add_argument("--full", action="store_true", help="export every entry, not just the differences")
+    p.add_argument("--passphrase", action="store_true",
+                   help="encrypt/decrypt bundles with a passphrase (or set PIXIE_SYNC_PASSPHRASE)")
+    p.add_argument("--reveal", action="store_true", help="include passwords of conflicting copies")
+    p.set_defaults(fn=cmd_sync)
+    p = sub.add_parser("backup", help="deduplicated snapshots of the vault")
+    p.add_argument("action", choices=("take", "list", "usage", "restore", "prune"))
+    p.add_argument("id", nargs="?", help="snapshot id, unique prefix or \"latest\" (restore)")
+    p.add_argument("--label", help="note stored with the snapshot (take)")
+    p.add_argument("--to", metavar="PATH", help="restore into a new vault file instead of the vault itself")
+    p.add_argument("--keep-last", type=int, help="snapshots to keep (prune; default from config)")
+    p.add_argument("--keep-daily", type=int, help="days to keep one snapshot of (prune; default from config)")
+    p.set_defaults(fn=cmd_backup)
+    return ap
+
+def _open(args, password: str | None = None):
+    try:
+        if args.socket:
+            return VaultClient(args.socket)
+        if args.vault or args.config:
+            return Storage(data_path=args.vault, config_path=args.config, write_behind=False, password=password)
+        # Daemon if one is running, else synchronous saves: one write per command (or batch)
+        return open_store(write_behind=False, password=password)
+    except crypto.VaultLocked:
+        if password is not None:
+            raise
+        if os.environ.get("PIXIE_PASSWORD"):
+            return _open(args, os.environ["PIXIE_PASSWORD"])
+        if not sys.stdin.isatty():
+            raise crypto.VaultLocked("vault is encrypted; set PIXIE_PASSWORD or run from a terminal")
+        return _open(args, getpass.getpass("Master password: "))
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        store = _open(args)
+    except crypto.CryptoError as e:
+        print(f"pixievault: {e}", file=sys.stderr)
+        return 1
+    try:
+        args.fn(store, args)
+    except CliError as e:
+        print(f"pixievault: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        pass
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
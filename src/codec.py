@@ -0,0 +1,201 @@
+# src/codec.py
+# At-rest encodings for vault.json and the shard files. "json" is the plain
+# text the vault has always been; "zlib" and "lzma" store compact JSON
+# compressed behind a one-line header:
+#
+#   PVZ1 {"codec":"zlib","dict":"3f2a9c01d4e5b6a7","trained_on":1200}\n<compressed JSON>
+#
+# Readers look at the first bytes, so every reader takes any encoding and
+# switching "codec" in config.json only changes what the next save writes.
+#
+# Every entry repeats the same keys, protocols and custom fields, which is
+# what DEFLATE would learn anyway, but only after the first few KB of each
+# file. A preset dictionary hands it those strings up front: train() picks the
+# field names and values that recur in the vault (plus the entry skeleton, so
+# an empty vault starts with something) and the files point at it by id:
+#
+#   data/vault.zdict/<id>.bin   never modified; the id is a hash of the contents
+#
+# Passwords are left out of the dictionary, and a sealed vault only offers
+# its structure: ciphertext doesn't repeat. Python's lzma module has no
+# preset dictionary option, so lzma files never name one.
+import hashlib, json, lzma, os, zlib
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+CODECS = ("json", "zlib", "lzma")
+MAGIC = b"PVZ1 "
+ZLIB_LEVEL = 6
+LZMA_PRESET = 6
+DICT_SIZE = 32 << 10  # DEFLATE only looks 32 KB back; more would be ignored
+MAX_FRAGMENT = 64  # longer values are rarely shared
+SECRET_FIELDS = ("password",)
+
+class CodecError(Exception):
+    pass
+
+def dict_dir(data_path: str) -> str:
+    return os.path.splitext(data_path)[0] + ".zdict"
+
+# --- Encoding ---
+def encode(obj: Any, codec: str = "json", zdict: Tuple[str, bytes] | None = None,
+           trained_on: int = 0, indent: int | None = None) -> str | bytes:
+    """`obj` as the file contents for `codec`: text for "json" (indented with
+    `indent`), bytes otherwise. `zdict` = (id, dictionary) is used by zlib."""
+    if codec == "json":
+        if indent is None:
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+        return json.dumps(obj, ensure_ascii=False, indent=indent)
+    raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    header: Dict[str, Any] = {"codec": codec}
+    if codec == "zlib":
+        if zdict is not None:
+            header["dict"] = zdict[0]
+            header["trained_on"] = trained_on
+            z = zlib.compressobj(ZLIB_LEVEL, zdict=zdict[1])
+        else:
+            z = zlib.compressobj(ZLIB_LEVEL)
+        body = z.compress(raw) + z.flush()
+    elif codec == "lzma":
+        body = lzma.compress(raw, preset=LZMA_PRESET)
+    else:
+        raise CodecError(f"unknown codec {codec!r} (expected one of {', '.join(CODECS)})")
+    return MAGIC + json.dumps(header, separators=(",", ":")).encode("ascii") + b"\n" + body
+
+def header(data: bytes) -> Dict[str, Any]:
+    """What a file's contents were written with: {"codec": "json"} for plain JSON."""
+    if not data.startswith(MAGIC):
+        return {"codec": "json"}
+    end = data.find(b"\n")
+    if end < 0:
+        raise CodecError("truncated codec header")
+    return json.loads(data[len(MAGIC):end])
+
+def decode(data: bytes, dictionaries: Callable[[str], bytes] | None = None) -> Any:
+    """Parse file contents in any encoding. `dictionaries` maps a dictionary
+    id to its bytes (see Dictionaries.get)."""
+    if not data.startswith(MAGIC):
+        return json.loads(data)
+    head = header(data)
+    body = data[data.find(b"\n") + 1:]
+    codec = head.get("codec")
+    try:
+        if codec == "zlib":
+            if head.get("dict"):
+                if dictionaries is None:
+                    raise CodecError(f"needs preset dictionary {head['dict']}")
+                z = zlib.decompressobj(zdict=dictionaries(head["dict"]))
+            else:
+                z = zlib.decompressobj()
+            raw = z.decompress(body) + z.flush()
+        elif codec == "lzma":
+            raw = lzma.decompress(body)
+        else:
+            raise CodecError(f"unknown codec {codec!r}")
+    except (zlib.error, lzma.LZMAError) as e:
+        raise CodecError(f"corrupt {codec} data ({e})")
+    return json.loads(raw)
+
+def peek(path: str) -> Dict[str, Any] | None:
+    """The header of the file at `path`, None if it doesn't exist."""
+    try:
+        with open(path, "rb") as f:
+            start = f.read(256)
+    except FileNotFoundError:
+        return None
+    return header(start)
+
+def read(path: str, dict_root: str | None = None) -> Any:
+    with open(path, "rb") as f:
+        data = f.read()
+    return decode(data, Dictionaries(dict_root).get if dict_root else None)
+
+# --- Preset dictionaries ---
+def _fragments(d: Dict[str, Any], out: Counter):
+    # Pieces of the compact JSON text of `d`, as they will appear in the file
+    for k, v in d.items():
+        key = json.dumps(k, ensure_ascii=False) + ":"
+        if isinstance(v, dict):
+            out[key + "{"] += 1
+            _fragments(v, out)
+        elif isinstance(v, list):
+            out[key + "["] += 1
+            for item in v:
+                if isinstance(item, dict):
+                    _fragments(item, out)
+        elif k in SECRET_FIELDS:
+            out[key] += 1
+        else:
+            text = key + json.dumps(v, ensure_ascii=False)
+            out[text if len(text) <= MAX_FRAGMENT else key] += 1
+
+def skeleton() -> bytes:
+    """An empty entry as it is written: the part of the dictionary that
+    doesn't depend on the vault."""
+    from model import Entry  # only needed here
+    d = Entry("", custom={}).to_dict()
+    return json.dumps(d, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def train(entries: Iterable[Dict[str, Any]], size: int = DICT_SIZE) -> bytes:
+    """A preset dictionary from entries in their on-disk form: fragments seen
+    at least twice, those that save the most (count x length) nearest the end,
+    where DEFLATE reaches them with the shortest distances."""
+    counts: Counter = Counter()
+    for d in entries:
+        _fragments(d, counts)
+    ranked = sorted((f for f, n in counts.items() if n > 1), key=lambda f: counts[f] * len(f))
+    base = skeleton()
+    parts: List[bytes] = []
+    room = size - len(base)
+    for frag in reversed(ranked):
+        b = frag.encode("utf-8")
+        if len(b) > room:
+            continue
+        parts.append(b)
+        room -= len(b)
+    return base + b"".join(reversed(parts))
+
+def dict_id(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+class Dictionaries:
+    """The preset dictionaries of one vault, cached once read."""
+    _cache: Dict[Tuple[str, str], bytes] = {}
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, ref: str) -> str:
+        return os.path.join(self.root, ref + ".bin")
+
+    def get(self, ref: str) -> bytes:
+        data = self._cache.get((self.root, ref))
+        if data is None:
+            try:
+                with open(self._path(ref), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                raise CodecError(f"preset dictionary {ref} is missing from {self.root}")
+            if dict_id(data) != ref:
+                raise CodecError(f"preset dictionary {ref} is corrupt")
+            self._cache[(self.root, ref)] = data
+        return data
+
+    def put(self, data: bytes) -> str:
+        """Store `data` unless it is already there; returns its id."""
+        from storage import atomic_write  # imports this module
+        ref = dict_id(data)
+        if not os.path.exists(self._path(ref)):
+            atomic_write(self._path(ref), data)
+        self._cache[(self.root, ref)] = data
+        return ref
+
+    def remove_except(self, keep: Iterable[str]):
+        """Delete dictionaries no file refers to any more."""
+        if not os.path.isdir(self.root):
+            return
+        names = {ref + ".bin" for ref in keep}
+        for name in os.listdir(self.root):
+            if name not in names:
+                os.remove(os.path.join(self.root, name))
+                self._cache.pop((self.root, name[:-4]), None)
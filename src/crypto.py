@@ -0,0 +1,137 @@
+# src/crypto.py
+# Optional at-rest encryption (needs `pip3 install cryptography`).
+#
+# Every entry is sealed on its own as a Fernet token, so sealing and unsealing
+# a large vault can be split across a process pool. The vault keeps a small
+# header next to the entries:
+#
+#   "crypto": {"kdf": "pbkdf2-sha256", "iterations": 200000, "salt": "...", "check": "<token>"}
+#
+# On disk a sealed entry is {"id": "...", "enc": "<token>"}; in memory Storage
+# only ever holds plaintext entries.
+import base64, hashlib, json, os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    CRYPTO_AVAILABLE = True
+except ImportError:
+    CRYPTO_AVAILABLE = False
+
+KDF = "pbkdf2-sha256"
+ITERATIONS = 200_000
+CHECK = b"pixievault"
+CHUNK = 512
+# Below this many entries a pool costs more to start than it saves
+PARALLEL_MIN_ENTRIES = 4000
+
+class CryptoError(Exception):
+    pass
+
+class VaultLocked(CryptoError):
+    """The vault is encrypted and no password was given."""
+
+class BadPassword(CryptoError):
+    pass
+
+def _require():
+    if not CRYPTO_AVAILABLE:
+        raise CryptoError("encryption needs the 'cryptography' package (pip3 install cryptography)")
+
+_fernets: Dict[bytes, Any] = {}
+
+def _fernet(key: bytes):
+    f = _fernets.get(key)
+    if f is None:
+        _require()
+        f = _fernets[key] = Fernet(key)
+    return f
+
+def _derive(password: str, salt: bytes, iterations: int) -> bytes:
+    raw = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return base64.urlsafe_b64encode(raw)
+
+def new_header(password: str) -> Tuple[Dict[str, Any], bytes]:
+    """Fresh salt + key for `password`. Returns (header, key)."""
+    _require()
+    salt = os.urandom(16)
+    key = _derive(password, salt, ITERATIONS)
+    header = {
+        "kdf": KDF,
+        "iterations": ITERATIONS,
+        "salt": base64.b64encode(salt).decode("ascii"),
+        "check": _fernet(key).encrypt(CHECK).decode("ascii"),
+    }
+    return header, key
+
+def unlock(header: Dict[str, Any], password: str) -> bytes:
+    """Derive the key for an existing header, verifying the password."""
+    _require()
+    key = _derive(password, base64.b64decode(header["salt"]), int(header.get("iterations", ITERATIONS)))
+    try:
+        if _fernet(key).decrypt(header["check"].encode("ascii")) != CHECK:
+            raise BadPassword("wrong password")
+    except InvalidToken:
+        raise BadPassword("wrong password")
+    return key
+
+def is_sealed(entry: Dict[str, Any]) -> bool:
+    return "enc" in entry
+
+def seal(key: bytes, entry: Dict[str, Any]) -> Dict[str, Any]:
+    plain = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return {"id": entry["id"], "enc": _fernet(key).encrypt(plain).decode("ascii")}
+
+def unseal(key: bytes, sealed: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        return json.loads(_fernet(key).decrypt(sealed["enc"].encode("ascii")))
+    except InvalidToken:
+        raise BadPassword(f"entry {sealed.get('id')} can't be decrypted with this key")
+
+def new_data_key() -> bytes:
+    """Random key for data sealed independently of the master password."""
+    _require()
+    return Fernet.generate_key()
+
+def encrypt_blob(key: bytes, data: bytes) -> bytes:
+    return _fernet(key).encrypt(data)
+
+def decrypt_blob(key: bytes, token: bytes) -> bytes:
+    try:
+        return _fernet(key).decrypt(token)
+    except InvalidToken:
+        raise BadPassword("data can't be decrypted with this key")
+
+# --- Bulk helpers (process pool) ---
+def seal_chunk(key: bytes, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [seal(key, e) for e in entries]
+
+def unseal_chunk(key: bytes, sealed: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [unseal(key, s) for s in sealed]
+
+def reseal_chunk(old_key: bytes | None, new_key: bytes | None, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Decrypt with the old key (if sealed) and encrypt with the new one (if any)."""
+    out = []
+    for item in items:
+        entry = unseal(old_key, item) if old_key and is_sealed(item) else item
+        out.append(seal(new_key, entry) if new_key else entry)
+    return out
+
+def chunks(items: List[Any], size: int = CHUNK) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _map(fn, key: bytes, items: List[Any], workers: int) -> List[Any]:
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(items) < PARALLEL_MIN_ENTRIES:
+        return fn(key, items)
+    parts = chunks(items)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        done = pool.map(fn, [key] * len(parts), parts)
+        return [x for part in done for x in part]
+
+def seal_many(key: bytes, entries: List[Dict[str, Any]], workers: int = 0) -> List[Dict[str, Any]]:
+    return _map(seal_chunk, key, entries, workers)
+
+def unseal_many(key: bytes, sealed: List[Dict[str, Any]], workers: int = 0) -> List[Dict[str, Any]]:
+    return _map(unseal_chunk, key, sealed, workers)
@@ -0,0 +1,172 @@
+# src/dedupe.py
+# Near-duplicate finder. Each entry is reduced to a set of features taken
+# from its normalized name, website host, username and custom values:
+#
+#   "GitHub – Work"  ->  n:git n:ith n:thu n:hub ... w:github.com u:bob c:category=work
+#
+# and the set to a MinHash signature: NUM_PERM independent 32-bit hashes of
+# every feature (one shake_128 digest each), minimum taken per position. Two
+# entries agree on a position with probability equal to their Jaccard
+# similarity.
+# Signatures are cut into BANDS bands of ROWS values; entries sharing any band
+# land in the same bucket and become candidates, so finding them takes one
+# pass over the vault instead of comparing every pair. Candidates are then
+# checked against the similarity threshold and grouped.
+#
+# Signatures are cached per entry and dropped from Storage change
+# notifications, so only edited entries are re-hashed on the next run. Hashing
+# works on a Storage view without the storage lock, so edits don't wait for a
+# scan to finish; the cache has a lock of its own.
+import hashlib, re, struct, threading, time, unicodedata
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from domains import normalize_host
+from model import BASE_FIELDS, Entry
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # 4 rows: pairs around 50% similar become candidates
+THRESHOLD = 0.5
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+_unpack = struct.Struct("<%dI" % NUM_PERM).unpack
+
+def normalize(text: Any) -> str:
+    """Lowercase, accents and punctuation stripped: "GitHub – Work" -> "github work"."""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+def features(e: Entry) -> Set[str]:
+    out: Set[str] = set()
+    name = normalize(e.name).replace(" ", "")
+    out.update("n:" + name[i:i + 3] for i in range(max(1, len(name) - 2)) if name)
+    host = normalize_host(e.website)
+    if host:
+        out.add("w:" + host)
+    if e.username:
+        out.add("u:" + e.username.strip().lower())
+    for k, v in e.custom.items():
+        v = normalize(v)
+        if v:
+            out.add("c:" + normalize(k) + "=" + v)
+    return out
+
+def signature(feats: Iterable[str]) -> Tuple[int, ...]:
+    rows = [_unpack(hashlib.shake_128(f.encode("utf-8")).digest(4 * NUM_PERM)) for f in feats]
+    return tuple(map(min, zip(*rows)))
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the two feature sets."""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+class DuplicateFinder:
+    def __init__(self, store):
+        self.store = store
+        self._sigs: Dict[str, Tuple[int, Tuple[int, ...] | None]] = {}  # id -> (rev, signature; None: nothing to compare)
+        self._lock = threading.Lock()  # _sigs: notifications come from the editing thread
+        store.subscribe(self._changed)
+
+    def close(self):
+        self.store.unsubscribe(self._changed)
+
+    def _changed(self, entry_ids: Iterable[str]):
+        with self._lock:
+            for entry_id in entry_ids:
+                self._sigs.pop(entry_id, None)
+
+    def _signatures(self) -> Dict[str, Tuple[int, ...]]:
+        view = self.store.view()
+        out: Dict[str, Tuple[int, ...]] = {}
+        for e in view:
+            cached = self._sigs.get(e.id)
+            if cached is None or cached[0] != e.rev:
+                # Hashed outside the lock; an edit racing with it only leaves
+                # a signature for an old rev, which the rev check skips
+                feats = features(e)
+                cached = (e.rev, signature(feats) if feats else None)
+                with self._lock:
+                    self._sigs[e.id] = cached
+            if cached[1] is not None:
+                out[e.id] = cached[1]
+        with self._lock:
+            for gone in [i for i in self._sigs if i not in view]:
+                self._sigs.pop(gone, None)
+        return out
+
+    def groups(self, threshold: float = THRESHOLD) -> List[Dict[str, Any]]:
+        """Groups of likely duplicates, most similar first:
+        [{"ids": [...], "score": 0.81}, ...] (score = weakest link in the group)."""
+        sigs = self._signatures()
+        buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = {}
+        for entry_id, sig in sigs.items():
+            for band in range(BANDS):
+                buckets.setdefault((band, sig[band * ROWS:(band + 1) * ROWS]), []).append(entry_id)
+
+        parent: Dict[str, str] = {}  # union-find over ids that matched something
+        def find(x: str) -> str:
+            root = parent.setdefault(x, x)
+            while parent[root] != root:
+                root = parent[root]
+            while parent[x] != root:
+                parent[x], x = root, parent[x]
+            return root
+
+        scores: Dict[Tuple[str, str], float] = {}
+        for ids in buckets.values():
+            if len(ids) < 2:
+                continue
+            for i, a in enumerate(ids):
+                for b in ids[i + 1:]:
+                    pair = (a, b) if a < b else (b, a)
+                    if pair in scores:
+                        continue
+                    s = scores[pair] = similarity(sigs[a], sigs[b])
+                    if s >= threshold:
+                        ra, rb = find(a), find(b)
+                        if ra != rb:
+                            parent[ra] = rb
+
+        members: Dict[str, List[str]] = {}
+        for x in parent:
+            members.setdefault(find(x), []).append(x)
+        out = []
+        for ids in members.values():
+            if len(ids) < 2:
+                continue
+            ids.sort()
+            links = [scores[(a, b)] for i, a in enumerate(ids) for b in ids[i + 1:]
+                     if scores.get((a, b), 0) >= threshold]
+            out.append({"ids": ids, "score": round(min(links), 2)})
+        out.sort(key=lambda g: (-g["score"], g["ids"][0]))
+        return out
+
+def merge_into(keep: Entry, others: List[Entry]):
+    """Fold `others` into `keep`: usage counts add up, the earliest creation
+    and latest access win, empty base fields are filled in, custom fields are
+    combined (a different value under the same key is kept as "Key (2)") and
+    attachments are pooled. The caller deletes `others`."""
+    for o in others:
+        seen = {normalize(v) for v in keep.custom.values()}
+        for k in BASE_FIELDS:
+            if not getattr(keep, k) and getattr(o, k):
+                keep[k] = getattr(o, k)
+        custom = dict(keep.custom)
+        for k, v in o.custom.items():
+            if k not in custom:
+                custom[k] = v
+            elif normalize(v) not in seen:
+                n = 2
+                while f"{k} ({n})" in custom:
+                    n += 1
+                custom[f"{k} ({n})"] = v
+                seen.add(normalize(v))
+        keep["custom"] = custom
+        keep.access_count += o.access_count
+        if o.created_at and (not keep.created_at or o.created_at < keep.created_at):
+            keep.created_at = o.created_at
+        if o.last_access_at and (not keep.last_access_at or o.last_access_at > keep.last_access_at):
+            keep.last_access_at = o.last_access_at
+        if o.attachments:
+            have = {a["id"] for a in keep.attachments or []}
+            keep.attachments = (keep.attachments or []) + [a for a in o.attachments if a["id"] not in have]
+    keep.updated_at = int(time.time())
@@ -0,0 +1,215 @@
+# src/domains.py
+# "Which entries belong to this site?" The website field is free text
+# ("github.com", "https://www.github.com/login", "gist.github.com"), so each
+# value is first reduced to a normalized host: scheme, credentials, port, path
+# and a leading "www." dropped, lower-cased, internationalized names in their
+# IDNA (xn--) form. The registrable domain ("github.com" for all three) comes
+# from the public suffix rules in public_suffix.dat.
+#
+# Hosts are indexed in a trie keyed by their labels in reverse order:
+#
+#   com ─ github ─ gist          {id3}
+#           └──── {id1, id2}
+#
+# so the entries for one host, for a host and its subdomains, or for a whole
+# site are one walk down the trie plus the ids found below that node; the
+# cost follows the size of the answer, not of the vault.
+import ipaddress, os
+from typing import Dict, Iterable, List, Set, Tuple
+from urllib.parse import urlsplit
+
+from model import Entry
+
+SUFFIX_PATH = os.path.join(os.path.dirname(__file__), "public_suffix.dat")
+SCOPES = ("host", "subdomains", "site")
+
+def normalize_host(text: str) -> str:
+    """Host part of a URL or bare domain, normalized; "" if there is none."""
+    text = (text or "").strip()
+    if not text:
+        return ""
+    if "://" not in text:
+        text = "//" + text  # bare "github.com/login" would parse as a path
+    try:
+        host = urlsplit(text).hostname or ""
+    except ValueError:  # e.g. a malformed IPv6 literal
+        return ""
+    host = host.rstrip(".")
+    if not host or any(c.isspace() or c in "<>\"'`{}|\\^" for c in host):
+        return ""  # free text, not an address
+    if _is_ip(host):
+        return host
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass  # not a valid IDN; keep it as typed
+    host = host.lower()
+    return host[4:] if host.startswith("www.") and host.count(".") > 1 else host
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+# --- Public suffixes ---
+class Suffixes:
+    def __init__(self, lines: Iterable[str]):
+        self.rules: Set[str] = set()
+        self.wildcards: Set[str] = set()  # "*.ck" stored as "ck"
+        self.exceptions: Set[str] = set()  # "!www.ck" stored as "www.ck"
+        for line in lines:
+            rule = line.split("//", 1)[0].strip()
+            if not rule:
+                continue
+            rule = rule.lower()
+            if not rule.isascii():
+                rule = rule.encode("idna").decode("ascii")
+            if rule.startswith("!"):
+                self.exceptions.add(rule[1:])
+            elif rule.startswith("*."):
+                self.wildcards.add(rule[2:])
+            else:
+                self.rules.add(rule)
+
+    @classmethod
+    def load(cls, path: str | None = None) -> "Suffixes":
+        with open(path or SUFFIX_PATH, "r", encoding="utf-8") as f:
+            return cls(f)
+
+    def suffix_len(self, labels: List[str]) -> int:
+        """Number of trailing labels of `labels` that form the public suffix."""
+        n = len(labels)
+        best = 1  # implicit "*" rule: any TLD is a suffix
+        for i in range(n):
+            name = ".".join(labels[i:])
+            if name in self.exceptions:
+                return n - i - 1
+            if name in self.rules:
+                best = max(best, n - i)
+            if i > 0 and name in self.wildcards:
+                best = max(best, n - i + 1)
+        return min(best, n)
+
+    def registrable(self, host: str) -> str:
+        """The part of `host` someone could register: suffix plus one label."""
+        if not host or _is_ip(host):
+            return host
+        labels = host.split(".")
+        keep = self.suffix_len(labels) + 1
+        return ".".join(labels[-keep:]) if keep <= len(labels) else host
+
+_default: Suffixes | None = None
+
+def suffixes() -> Suffixes:
+    global _default
+    if _default is None:
+        _default = Suffixes.load()
+    return _default
+
+def registrable_domain(text: str) -> str:
+    return suffixes().registrable(normalize_host(text))
+
+# --- Index ---
+class _Node:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.ids: Set[str] = set()
+
+def _labels(host: str) -> List[str]:
+    # IP addresses are one label: "10.0.0.1" isn't a subdomain of "0.0.1"
+    return [host] if _is_ip(host) else host.split(".")[::-1]
+
+class DomainIndex:
+    def __init__(self, store, suffix_list: str | None = None):
+        self.store = store
+        self.suffixes = Suffixes.load(suffix_list) if suffix_list else suffixes()
+        self._root = _Node()
+        self._hosts: Dict[str, str] = {}  # id -> host as indexed
+        self._built = False
+        store.subscribe(self._changed)
+
+    def close(self):
+        self.store.unsubscribe(self._changed)
+
+    def _build(self):
+        for e in self.store.all_entries():
+            self._add(e)
+        self._built = True
+
+    def _add(self, e: Entry):
+        host = normalize_host(e.website)
+        if not host:
+            return
+        self._hosts[e.id] = host
+        node = self._root
+        for label in _labels(host):
+            node = node.children.setdefault(label, _Node())
+        node.ids.add(e.id)
+
+    def _remove(self, entry_id: str):
+        host = self._hosts.pop(entry_id, None)
+        if host is None:
+            return
+        path: List[Tuple[_Node, str]] = []
+        node = self._root
+        for label in _labels(host):
+            path.append((node, label))
+            node = node.children[label]
+        node.ids.discard(entry_id)
+        # Prune branches left without entries
+        for parent, label in reversed(path):
+            child = parent.children[label]
+            if child.ids or child.children:
+                break
+            del parent.children[label]
+
+    def _changed(self, entry_ids: Iterable[str]):
+        # Runs with the storage lock held
+        if not self._built:
+            return
+        for entry_id in entry_ids:
+            e = self.store.get_entry(entry_id)
+            if e is not None and self._hosts.get(entry_id) == (normalize_host(e.website) or None):
+                continue  # website unchanged
+            self._remove(entry_id)
+            if e is not None:
+                self._add(e)
+
+    def _node(self, host: str) -> _Node | None:
+        node = self._root
+        for label in _labels(host):
+            node = node.children.get(label)
+            if node is None:
+                return None
+        return node
+
+    def lookup(self, url: str, scope: str = "site") -> Set[str]:
+        """Ids of entries for `url`: the same host ("host"), the host and its
+        subdomains ("subdomains") or anything under its registrable domain
+        ("site", e.g. gist.github.com -> *.github.com)."""
+        if scope not in SCOPES:
+            raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+        host = normalize_host(url)
+        if not host:
+            return set()
+        if scope == "site":
+            host = self.suffixes.registrable(host)
+        with self.store._lock:
+            if not self._built:
+                self._build()
+            node = self._node(host)
+            if node is None:
+                return set()
+            if scope == "host":
+                return set(node.ids)
+            out: Set[str] = set()
+            stack = [node]
+            while stack:
+                n = stack.pop()
+                out |= n.ids
+                stack.extend(n.children.values())
+            return out
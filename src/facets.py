@@ -0,0 +1,100 @@
+# src/facets.py
+# Facet index over custom fields: custom key -> value -> set of entry ids.
+#
+#   {"Category": {"Work": {id1, id2}, "Home": {id3}},
+#    "Environment": {"prod": {id1}, "staging": {id2, id3}}}
+#
+# Built once from the store, then kept current from Storage change
+# notifications: a changed entry only moves its own ids between value sets.
+# Narrowing by facets is an intersection of those sets, and the counts shown
+# next to each value for the current result are intersections too, so neither
+# needs a pass over the entries' custom dicts.
+from typing import Dict, Iterable, List, Set, Tuple
+
+from model import Entry
+
+def facet_value(v) -> str:
+    # Custom values are usually strings, but JSON imports may hold numbers
+    return str(v).strip() if v is not None else ""
+
+class FacetIndex:
+    def __init__(self, store):
+        self.store = store
+        self._postings: Dict[str, Dict[str, Set[str]]] = {}  # key -> value -> ids
+        self._values: Dict[str, Dict[str, str]] = {}  # id -> {key: value} as indexed
+        self._built = False
+        store.subscribe(self._changed)
+
+    def close(self):
+        self.store.unsubscribe(self._changed)
+
+    def _build(self):
+        self._postings = {}
+        self._values = {}
+        for e in self.store.all_entries():
+            self._add(e)
+        self._built = True
+
+    def _add(self, e: Entry):
+        values = {k: facet_value(v) for k, v in e.custom.items()}
+        values = {k: v for k, v in values.items() if v}
+        if values:
+            self._values[e.id] = values
+        for k, v in values.items():
+            self._postings.setdefault(k, {}).setdefault(v, set()).add(e.id)
+
+    def _remove(self, entry_id: str):
+        for k, v in self._values.pop(entry_id, {}).items():
+            by_value = self._postings[k]
+            ids = by_value[v]
+            ids.discard(entry_id)
+            if not ids:
+                del by_value[v]
+                if not by_value:
+                    del self._postings[k]
+
+    def _changed(self, entry_ids: Iterable[str]):
+        # Runs with the storage lock held
+        if not self._built:
+            return
+        for entry_id in entry_ids:
+            e = self.store.get_entry(entry_id)
+            old = self._values.get(entry_id)
+            if e is not None and old is not None and old == {k: facet_value(v) for k, v in e.custom.items()}:
+                continue  # e.g. record_access: custom fields untouched
+            self._remove(entry_id)
+            if e is not None:
+                self._add(e)
+
+    def select(self, facets: Dict[str, str]) -> Set[str]:
+        """Ids of entries having every given key = value."""
+        with self.store._lock:
+            if not self._built:
+                self._build()
+            sets = [self._postings.get(k, {}).get(facet_value(v), set()) for k, v in facets.items()]
+            if not sets:
+                return set(self._values)
+            sets.sort(key=len)  # intersect starting from the rarest value
+            result = set(sets[0])
+            for ids in sets[1:]:
+                result &= ids
+            return result
+
+    def counts(self, within: Iterable[str] | None = None, top: int | None = None) -> Dict[str, List[Tuple[str, int]]]:
+        """key -> [(value, count)], most common first. With `within`, count
+        only those entries (e.g. the current search result); values with no
+        entries there are left out."""
+        with self.store._lock:
+            if not self._built:
+                self._build()
+            scope = None if within is None else (within if isinstance(within, set) else set(within))
+            out: Dict[str, List[Tuple[str, int]]] = {}
+            for k, by_value in self._postings.items():
+                if scope is None:
+                    pairs = [(v, len(ids)) for v, ids in by_value.items()]
+                else:
+                    pairs = [(v, n) for v, ids in by_value.items() if (n := len(ids & scope))]
+                if pairs:
+                    pairs.sort(key=lambda p: (-p[1], p[0].lower()))
+                    out[k] = pairs[:top] if top else pairs
+            return out
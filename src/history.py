@@ -0,0 +1,234 @@
+# src/history.py
+# Per-entry revision history, kept outside vault.json so loading, saving and
+# searching never pay for it. Before Storage overwrites or deletes an entry,
+# the version being replaced is appended to that entry's log:
+#
+#   data/vault.history/3f/3f2a9c1e-....jsonl
+#   {"rev": 1, "at": 1735822800, "key": {...whole entry...}}         keyframe
+#   {"rev": 2, "at": 1735909200, "set": {"password": "..."}, "del": []}   delta
+#
+# Rows are deltas against the previous revision, with a full keyframe every
+# KEYFRAME_EVERY revisions, so rebuilding any version reads at most that many
+# rows. With encryption on, each row is sealed with the same data key as the
+# attachments. Versions are buffered and written by Storage.save(), i.e. in
+# the same group commit as the change that produced them. They are numbered
+# only then, under the vault lock and from the rows the file ends with, so
+# processes recording the same entry keep one sequence between them.
+import json, os, threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+import crypto
+from model import Entry
+from storage import atomic_write
+
+KEYFRAME_EVERY = 16
+# Usage stats change on every reveal and aren't worth a revision; rev counts
+# writes, not content
+SKIP_FIELDS = ("access_count", "last_access_at", "rev")
+_CACHE_SIZE = 256
+
+def snapshot(e: Entry) -> Dict[str, Any]:
+    d = e.to_dict()
+    for k in SKIP_FIELDS:
+        d.pop(k, None)
+    return d
+
+def delta(old: Dict[str, Any], new: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    changed = {k: v for k, v in new.items() if old.get(k, object()) != v}
+    return changed, [k for k in old if k not in new]
+
+class History:
+    def __init__(self, root: str, data_key: Callable[[], bytes | None]):
+        self.root = root
+        self._data_key = data_key
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}  # entry id -> (at, version) not yet on disk
+        self._tails: "OrderedDict[str, Tuple[int, Tuple[int, Dict[str, Any]]]]" = OrderedDict()  # id -> (file size, latest (rev, version))
+
+    def _path(self, entry_id: str) -> str:
+        return os.path.join(self.root, entry_id[:2], entry_id + ".jsonl")
+
+    # --- Row encoding ---
+    def _encode(self, row: Dict[str, Any], key: bytes | None) -> str:
+        text = json.dumps(row, ensure_ascii=False, separators=(",", ":"))
+        if key is not None:
+            text = json.dumps({"enc": crypto.encrypt_blob(key, text.encode("utf-8")).decode("ascii")})
+        return text
+
+    def _decode(self, line: str) -> Dict[str, Any]:
+        row = json.loads(line)
+        if "enc" in row:
+            key = self._data_key()
+            if key is None:
+                raise crypto.VaultLocked("history is encrypted; unlock the vault first")
+            row = json.loads(crypto.decrypt_blob(key, row["enc"].encode("ascii")))
+        return row
+
+    def _lines(self, entry_id: str) -> List[str]:
+        try:
+            with open(self._path(entry_id), "r", encoding="utf-8") as f:
+                return [l for l in f.read().splitlines() if l]
+        except FileNotFoundError:
+            return []
+
+    def _row(self, item: str | Dict[str, Any]) -> Dict[str, Any]:
+        return item if isinstance(item, dict) else self._decode(item)
+
+    def _keyframe_rows(self, items: List[str | Dict[str, Any]], end: int | None) -> List[Dict[str, Any]]:
+        # items[i:end] decoded, for the last keyframe i before `end`
+        rows = []
+        for item in reversed(items[:end]):
+            rows.append(self._row(item))
+            if "key" in rows[-1]:
+                break
+        rows.reverse()
+        return rows
+
+    # --- Reconstruction ---
+    def _replay(self, rows: List[Dict[str, Any]], upto: int | None = None) -> List[Tuple[int, int, Dict[str, Any]]]:
+        # `rows` must start at a keyframe
+        out: List[Tuple[int, int, Dict[str, Any]]] = []
+        current: Dict[str, Any] = {}
+        for row in rows:
+            if upto is not None and row["rev"] > upto:
+                break
+            if "key" in row:
+                current = dict(row["key"])
+            else:
+                current = dict(current, **row.get("set", {}))
+                for k in row.get("del", ()):
+                    current.pop(k, None)
+            out.append((row["rev"], row["at"], current))
+        return out
+
+    def _items(self, entry_id: str) -> List[str | Dict[str, Any]]:
+        # With self._lock held: the rows on disk (encoded) followed by the
+        # buffered versions, numbered as flush() would number them now
+        lines: List[str | Dict[str, Any]] = list(self._lines(entry_id))
+        pending = self._pending.get(entry_id)
+        if pending:
+            lines += self._number(self._tail(entry_id), pending)[0]
+        return lines
+
+    def versions(self, entry_id: str) -> List[Dict[str, Any]]:
+        """Every recorded past version, oldest first: {"rev", "at", "entry"}."""
+        with self._lock:
+            rows = [self._row(x) for x in self._items(entry_id)]
+        return [{"rev": rev, "at": at, "entry": v} for rev, at, v in self._replay(rows)]
+
+    def version(self, entry_id: str, rev: int) -> Dict[str, Any] | None:
+        """One past version, rebuilt from the nearest keyframe."""
+        with self._lock:
+            items = self._items(entry_id)
+        # Revisions are numbered from 1 with one row each, so `rev` is normally
+        # at line rev - 1; logs written by two processes before numbering moved
+        # into flush() can repeat numbers, so check and search if it isn't
+        at = rev - 1
+        if not (0 <= at < len(items) and self._row(items[at])["rev"] == rev):
+            at = next((i for i, x in enumerate(items) if self._row(x)["rev"] == rev), None)
+            if at is None:
+                return None
+        replayed = self._replay(self._keyframe_rows(items, at + 1), rev)
+        return replayed[-1][2] if replayed else None
+
+    def _tail(self, entry_id: str) -> Tuple[int, Dict[str, Any]] | None:
+        # With self._lock held: the latest (rev, version) in the file, cached
+        # for as long as the file keeps its size (other processes only append)
+        try:
+            size = os.path.getsize(self._path(entry_id))
+        except FileNotFoundError:
+            return None
+        hit = self._tails.get(entry_id)
+        if hit is not None and hit[0] == size:
+            self._tails.move_to_end(entry_id)
+            return hit[1]
+        rows = self._keyframe_rows(self._lines(entry_id), None)
+        if not rows:
+            return None
+        rev, _at, version = self._replay(rows)[-1]
+        self._remember(entry_id, size, (rev, version))
+        return rev, version
+
+    def _remember(self, entry_id: str, size: int, tail: Tuple[int, Dict[str, Any]]):
+        self._tails[entry_id] = (size, tail)
+        self._tails.move_to_end(entry_id)
+        while len(self._tails) > _CACHE_SIZE:
+            self._tails.popitem(last=False)
+
+    def forget(self, entry_id: str):
+        """Drop the cached latest version (another process appended to the log)."""
+        with self._lock:
+            self._tails.pop(entry_id, None)
+
+    # --- Recording ---
+    def _number(self, tail: Tuple[int, Dict[str, Any]] | None,
+                pending: List[Tuple[int, Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], Tuple[int, Dict[str, Any]] | None]:
+        # Rows for the buffered versions, numbered on from `tail`
+        rows = []
+        for at, version in pending:
+            if tail is not None and tail[1] == version:
+                continue  # already recorded (by another process, or only usage stats changed since)
+            rev = tail[0] + 1 if tail else 1
+            if tail is None or (rev - 1) % KEYFRAME_EVERY == 0:
+                row = {"rev": rev, "at": at, "key": version}
+            else:
+                changed, removed = delta(tail[1], version)
+                row = {"rev": rev, "at": at, "set": changed, "del": removed}
+            rows.append(row)
+            tail = (rev, version)
+        return rows, tail
+
+    def record(self, e: Entry):
+        """Remember `e` as it is now, before the caller changes it."""
+        version = snapshot(e)
+        with self._lock:
+            pending = self._pending.get(e.id)
+            last = pending[-1][1] if pending else (self._tail(e.id) or (0, None))[1]
+            if last == version:
+                return  # already recorded (e.g. only usage stats changed since)
+            self._pending.setdefault(e.id, []).append((e.updated_at or e.created_at or 0, version))
+
+    def flush(self):
+        """Append buffered versions to their files (called from Storage.save,
+        with the vault lock held). They are numbered here, from what the file
+        ends with, so two processes recording the same entry continue one
+        sequence and a version the other one already wrote isn't repeated."""
+        with self._lock:
+            if not self._pending:
+                return
+            key = self._data_key()
+            for entry_id in list(self._pending):
+                rows, tail = self._number(self._tail(entry_id), self._pending[entry_id])
+                if not rows:
+                    del self._pending[entry_id]
+                    continue
+                path = self._path(entry_id)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("".join(self._encode(r, key) + "\n" for r in rows))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._remember(entry_id, os.fstat(f.fileno()).st_size, tail)
+                del self._pending[entry_id]
+
+    # --- Key rotation (see rekey.py) ---
+    def migrate(self, encrypt: bool):
+        """Rewrite every log sealed (or unsealed) with the current data key."""
+        self.flush()
+        if not os.path.isdir(self.root):
+            return
+        with self._lock:
+            key = self._data_key() if encrypt else None
+            for sub in os.listdir(self.root):
+                folder = os.path.join(self.root, sub)
+                for name in os.listdir(folder):
+                    if not name.endswith(".jsonl"):
+                        continue
+                    path = os.path.join(folder, name)
+                    with open(path, "r", encoding="utf-8") as f:
+                        lines = [l for l in f.read().splitlines() if l]
+                    if all(("\"enc\"" in l[:8]) == encrypt for l in lines):
+                        continue  # already in the target form (resumed run)
+                    atomic_write(path, "".join(self._encode(self._decode(l), key) + "\n" for l in lines))
+            self._tails.clear()
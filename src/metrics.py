@@ -0,0 +1,207 @@
+# src/metrics.py
+# Lightweight timing for the hot paths (load, save, search, sort, render) and a
+# Tk event-loop stall watchdog. Off by default; turn on with PIXIE_METRICS=1 or
+# "metrics": {"enabled": true} in config.json. When off, span() is a shared
+# no-op context manager and costs one attribute check.
+import json, os, sys, threading, time, traceback, atexit, functools
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+
+DUMP_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "metrics.json")
+MAX_STALLS = 50
+
+class Histogram:
+    """Latency histogram with power-of-two microsecond buckets."""
+
+    def __init__(self):
+        self.buckets: List[int] = [0] * 40
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        us = int(seconds * 1e6)
+        self.buckets[min(us.bit_length(), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3 if self.count else 0.0,
+            "min_ms": self.min * 1e3 if self.count else 0.0,
+            "max_ms": self.max * 1e3,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p95_ms": self.percentile(95) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+            "buckets_us": {str(1 << i): n for i, n in enumerate(self.buckets) if n},
+        }
+
+class _Metrics:
+    def __init__(self):
+        self.enabled = os.environ.get("PIXIE_METRICS", "") not in ("", "0")
+        self.dump_path = os.environ.get("PIXIE_METRICS_FILE", DUMP_PATH)
+        self.status_bar = False
+        self.stall_ms = 250
+        self.histograms: Dict[str, Histogram] = {}
+        self.stalls: List[Dict[str, Any]] = []
+        self.gauges: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+state = _Metrics()
+
+def configure(cfg: Dict[str, Any] | None):
+    """Apply the "metrics" section of config.json. The env var wins if set."""
+    cfg = cfg or {}
+    if cfg.get("enabled"):
+        state.enabled = True
+    state.stall_ms = cfg.get("stall_ms", state.stall_ms)
+    state.status_bar = cfg.get("status_bar", state.status_bar)
+    if "dump_path" in cfg and "PIXIE_METRICS_FILE" not in os.environ:
+        state.dump_path = cfg["dump_path"]
+
+def record(name: str, seconds: float):
+    with state._lock:
+        h = state.histograms.get(name)
+        if h is None:
+            h = state.histograms[name] = Histogram()
+        h.add(seconds)
+
+def gauge(name: str, fn: Callable[[], Dict[str, Any]] | None):
+    """Report fn()'s numbers (e.g. cache statistics) along with the timings;
+    None removes the gauge."""
+    with state._lock:
+        if fn is None:
+            state.gauges.pop(name, None)
+        else:
+            state.gauges[name] = fn
+
+@contextmanager
+def _span(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0)
+
+class _NoSpan:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NO_SPAN = _NoSpan()
+
+def span(name: str):
+    """with span("search"): ...  -- times the block when metrics are on."""
+    return _span(name) if state.enabled else _NO_SPAN
+
+def timed(name: str):
+    """Decorator form of span()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def snapshot() -> Dict[str, Any]:
+    with state._lock:
+        return {
+            "timestamp": time.time(),
+            "spans": {k: h.to_dict() for k, h in sorted(state.histograms.items())},
+            "gauges": {k: fn() for k, fn in sorted(state.gauges.items())},
+            "stalls": list(state.stalls),
+        }
+
+def dump(path: str | None = None):
+    if not state.enabled:
+        return
+    path = path or state.dump_path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, indent=2)
+    os.replace(tmp, path)
+
+def summary() -> str:
+    """One-line summary for the status bar, e.g. 'search p95 3.1ms · stalls 2'."""
+    parts = []
+    with state._lock:
+        for name in ("search", "sort", "render", "save"):
+            h = state.histograms.get(name)
+            if h and h.count:
+                parts.append(f"{name} p95 {h.percentile(95) * 1e3:.1f}ms")
+        bodies = state.gauges.get("body_cache")
+        if bodies is not None:
+            g = bodies()
+            parts.append(f"cache {g['hit_rate']:.0%} hit {g['cache_bytes'] >> 10}/{g['budget_bytes'] >> 10} KB")
+        if state.stalls:
+            parts.append(f"stalls {len(state.stalls)}")
+    return " · ".join(parts)
+
+atexit.register(dump)
+
+class Watchdog(threading.Thread):
+    """Detects Tk event-loop stalls. The UI thread bumps a heartbeat via
+    root.after(); this thread notices when it stops and samples the UI
+    thread's stack while it is still stuck."""
+
+    def __init__(self, root, interval_ms: int = 50):
+        super().__init__(name="pixie-watchdog", daemon=True)
+        self.root = root
+        self.interval_ms = interval_ms
+        self.threshold = state.stall_ms / 1000.0
+        self.ui_thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._halt = threading.Event()
+
+    def start(self):
+        self._heartbeat()
+        super().start()
+
+    def stop(self):
+        self._halt.set()
+
+    def _heartbeat(self):
+        now = time.perf_counter()
+        gap = now - self._beat
+        self._beat = now
+        record("event_loop_gap", gap)
+        if gap >= self.threshold:
+            with state._lock:
+                if state.stalls and state.stalls[-1].get("duration_ms") is None:
+                    state.stalls[-1]["duration_ms"] = gap * 1e3
+        if not self._halt.is_set():
+            self.root.after(self.interval_ms, self._heartbeat)
+
+    def run(self):
+        sampled_for = None
+        while not self._halt.wait(self.threshold / 2):
+            beat = self._beat
+            if time.perf_counter() - beat < self.threshold or sampled_for == beat:
+                continue
+            sampled_for = beat  # one stack sample per stall
+            frame = sys._current_frames().get(self.ui_thread_id)
+            stack = traceback.format_stack(frame) if frame else []
+            with state._lock:
+                state.stalls.append({
+                    "at": time.time(),
+                    "duration_ms": None,  # filled in when the loop resumes
+                    "stack": [line.strip() for line in stack[-12:]],
+                })
+                del state.stalls[:-MAX_STALLS]
@@ -0,0 +1,154 @@
+# src/model.py
+# Entry model. One Entry per vault entry, with fixed __slots__ instead of a
+# per-entry dict, so a large vault holds one pointer per field rather than a
+# hash table with the same keys repeated. Custom-field keys and protocol names are
+# interned: every "Category" or "https" in the vault is the same string
+# object. Timestamps are always ints.
+#
+# Entries still read like the JSON they come from (e["name"], e.get("custom"),
+# dict(e)), so file formats and older callers keep working; the hot paths in
+# search.py use attributes. to_dict()/from_dict() round-trip the JSON form,
+# keeping unknown keys from newer files in `extra`.
+import sys
+from typing import Any, Dict, Iterator, List, Tuple
+
+BASE_FIELDS = ("name", "protocol", "website", "username", "password", "notes")
+FIELDS = ("id",) + BASE_FIELDS + ("custom", "created_at", "updated_at", "access_count", "last_access_at",
+                                  "vv", "attachments", "rev")
+_OPTIONAL = ("vv", "attachments", "rev")  # left out of the JSON form when unset
+_FIELD_SET = frozenset(FIELDS)
+_TIMESTAMPS = ("created_at", "updated_at", "last_access_at")
+_intern = sys.intern
+
+def _int_or_none(v: Any) -> int | None:
+    return None if v is None else int(v)
+
+def intern_custom(custom: Dict[str, Any] | None) -> Dict[str, Any]:
+    return {_intern(str(k)): v for k, v in (custom or {}).items()}
+
+class Entry:
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, id: str, name: str = "", protocol: str = "", website: str = "", username: str = "",
+                 password: str = "", notes: str = "", custom: Dict[str, Any] | None = None,
+                 created_at: int | None = None, updated_at: int | None = None, access_count: int = 0,
+                 last_access_at: int | None = None, vv: Dict[str, int] | None = None,
+                 attachments: List[Dict[str, Any]] | None = None, rev: int = 0,
+                 extra: Dict[str, Any] | None = None):
+        self.id = id
+        self.name = name
+        self.protocol = _intern(protocol) if protocol else ""
+        self.website = website
+        self.username = username
+        self.password = password
+        self.notes = notes
+        self.custom = intern_custom(custom)
+        self.created_at = _int_or_none(created_at)
+        self.updated_at = _int_or_none(updated_at)
+        self.access_count = int(access_count or 0)
+        self.last_access_at = _int_or_none(last_access_at)
+        self.vv = vv
+        self.attachments = attachments or None
+        self.rev = int(rev or 0)  # bumped on every local change (see Storage._commit)
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Entry":
+        extra = None if _FIELD_SET.issuperset(d) else {k: v for k, v in d.items() if k not in _FIELD_SET}
+        return cls(d["id"], d.get("name") or "", d.get("protocol") or "", d.get("website") or "",
+                   d.get("username") or "", d.get("password") or "", d.get("notes") or "",
+                   d.get("custom"), d.get("created_at"), d.get("updated_at"), d.get("access_count"),
+                   d.get("last_access_at"), d.get("vv"), d.get("attachments"), d.get("rev"), extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {
+            "id": self.id,
+            "name": self.name,
+            "protocol": self.protocol,
+            "website": self.website,
+            "username": self.username,
+            "password": self.password,
+            "notes": self.notes,
+            "custom": self.custom,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "access_count": self.access_count,
+            "last_access_at": self.last_access_at,
+        }
+        if self.vv is not None:
+            d["vv"] = self.vv
+        if self.attachments:
+            d["attachments"] = self.attachments
+        if self.rev:
+            d["rev"] = self.rev
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    def assign(self, other: "Entry"):
+        """Take over every field of `other`, keeping this object's identity
+        (the UI and indexes hold references to it)."""
+        for k in Entry.__slots__:
+            setattr(self, k, getattr(other, k))
+
+    def copy(self) -> "Entry":
+        """A separate Entry with the same values. The dicts and lists inside
+        are shared: edits always put new ones in place rather than changing
+        them (see views.py)."""
+        e = Entry.__new__(Entry)
+        e.assign(self)
+        return e
+
+    def __repr__(self) -> str:
+        return f"Entry(id={self.id!r}, name={self.name!r})"
+
+    # --- Mapping-style access (JSON-shaped callers) ---
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET and (key not in _OPTIONAL or getattr(self, key)):
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key in _FIELD_SET:
+            if key == "custom":
+                value = intern_custom(value)
+            elif key == "protocol" and value:
+                value = _intern(value)
+            elif key in _TIMESTAMPS:
+                value = _int_or_none(value)
+            setattr(self, key, value)
+        else:
+            self.extra = {**(self.extra or {}), key: value}  # new dict: copies share the old one
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]  # type: ignore[index]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> List[str]:
+        return list(self.to_dict())
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return list(self.to_dict().items())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+def to_json(obj: Any) -> Any:
+    """`default=` hook for json.dump(s) so Entries serialize as their dicts."""
+    if isinstance(obj, Entry):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,178 @@
+# src/rekey.py
+# Key rotation: turning encryption on or off, or changing the master password.
+#
+# The current on-disk vault is streamed in chunks through a process pool that
+# decrypts with the old key and encrypts with the new one. Each finished chunk
+# is checkpointed under <vault>.rekey/, so an interrupted rotation picks up
+# where it stopped. When every entry is done the vault is written as a new
+# generation (one atomic replace of vault.json, or a new shard set followed by
+# its index) and Storage switches keys. The app keeps running throughout;
+# entries edited meanwhile are re-sealed from memory at the swap. Snapshot
+# backups are re-sealed after it, so none keeps the vault under the old key
+# (or in plain text).
+import hashlib, json, os, shutil, threading, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Tuple
+
+import crypto
+from storage import Storage, atomic_write
+
+STATE_NAME = "state.json"
+
+def checkpoint_dir(store: Storage) -> str:
+    return store.data_path + ".rekey"
+
+def pending(store: Storage) -> Dict[str, Any] | None:
+    """State of an interrupted rotation, if there is one."""
+    path = os.path.join(checkpoint_dir(store), STATE_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def discard(store: Storage):
+    shutil.rmtree(checkpoint_dir(store), ignore_errors=True)
+
+def _fingerprint(item: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(item, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class Rotation:
+    """One key rotation. Call run() on a worker thread (or use start()) and
+    read the progress fields from the UI thread."""
+
+    def __init__(self, store: Storage, new_password: str | None, workers: int = 0):
+        self.store = store
+        self.new_password = new_password
+        self.workers = workers or os.cpu_count() or 1
+        self.total = 0
+        self.done = 0
+        self.reused = 0  # entries taken from an earlier, interrupted run
+        self.started = 0.0
+        self.finished = False
+        self.error: BaseException | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def rate(self) -> float:
+        """Entries re-encrypted per second (excluding reused checkpoints)."""
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        return (self.done - self.reused) / elapsed if elapsed > 0 else 0.0
+
+    def status(self) -> str:
+        verb = "Re-encrypt" if self.new_password is not None else "Decrypt"
+        if self.error:
+            return f"{verb}ion failed: {self.error}"
+        if self.finished:
+            return f"{verb}ed {self.total} entries ✨"
+        return f"{verb}ing {self.done}/{self.total} entries ({self.rate:.0f}/s)"
+
+    # --- Checkpoint handling ---
+    def _target(self) -> Tuple[Dict[str, Any] | None, bytes | None]:
+        """New header + key, reusing the salt of an interrupted run so its
+        checkpoints stay valid."""
+        state = pending(self.store)
+        if self.new_password is None:
+            if state and state.get("header"):
+                discard(self.store)  # was heading somewhere else; start over
+            return None, None
+        if state and state.get("header"):
+            try:
+                return state["header"], crypto.unlock(state["header"], self.new_password)
+            except crypto.BadPassword:
+                discard(self.store)  # different new password: old checkpoints are useless
+        return crypto.new_header(self.new_password)
+
+    def _load_checkpoints(self) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        done: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        cdir = checkpoint_dir(self.store)
+        if not os.path.isdir(cdir):
+            return done
+        for name in sorted(os.listdir(cdir)):
+            if name.startswith("chunk-"):
+                with open(os.path.join(cdir, name), "r", encoding="utf-8") as f:
+                    for entry_id, fp, result in json.load(f):
+                        done[entry_id] = (fp, result)
+        return done
+
+    def _write_checkpoint(self, n: int, rows: List[List[Any]]):
+        atomic_write(os.path.join(checkpoint_dir(self.store), f"chunk-{n:06d}.json"),
+                     json.dumps(rows, ensure_ascii=False, separators=(",", ":")))
+
+    # --- Pipeline ---
+    def run(self):
+        store = self.store
+        self.started = time.perf_counter()
+        store._begin_rekey()
+        try:
+            header, new_key = self._target()
+            old_key, old_header = store._key, store.data.get("crypto")
+            atomic_write(os.path.join(checkpoint_dir(store), STATE_NAME),
+                         json.dumps({"header": header, "started_at": int(time.time())}))
+
+            store.flush()  # the disk copy is the pipeline's source
+            source = store._read_raw().get("entries", [])
+            self.total = len(source)
+
+            done = self._load_checkpoints()
+            results: Dict[str, Dict[str, Any]] = {}
+            todo: List[Tuple[str, Dict[str, Any]]] = []
+            for item in source:
+                fp = _fingerprint(item)
+                prev = done.get(item["id"])
+                if prev and prev[0] == fp:
+                    results[item["id"]] = prev[1]
+                else:
+                    todo.append((fp, item))
+            self.done = self.reused = len(results)
+            first_chunk = len([n for n in os.listdir(checkpoint_dir(store)) if n.startswith("chunk-")])
+
+            parts = crypto.chunks(todo)
+            def finish(n: int, part, out):
+                rows = [[item["id"], fp, r] for (fp, item), r in zip(part, out)]
+                self._write_checkpoint(first_chunk + n, rows)
+                for (_, item), r in zip(part, out):
+                    results[item["id"]] = r
+                self.done += len(part)
+
+            if self.workers > 1 and len(todo) >= crypto.PARALLEL_MIN_ENTRIES:
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    futures = {pool.submit(crypto.reseal_chunk, old_key, new_key, [it for _, it in part]): n
+                               for n, part in enumerate(parts)}
+                    for fut in as_completed(futures):
+                        n = futures[fut]
+                        finish(n, parts[n], fut.result())
+            else:
+                for n, part in enumerate(parts):
+                    finish(n, part, crypto.reseal_chunk(old_key, new_key, [it for _, it in part]))
+
+            store.blobs.migrate(new_key)
+            store.history.migrate(encrypt=new_key is not None)
+            store._install_key(header, new_key, results)
+            if os.path.isdir(store.snapshots.root):
+                store.snapshots.reseal(old_key, old_header, new_key, header)
+            store.blobs.finish(new_key, store.live_attachment_ids())
+            discard(store)
+            self.finished = True
+        except BaseException as e:
+            store._abort_rekey()
+            self.error = e
+            raise
+
+    def start(self) -> "Rotation":
+        def target():
+            try:
+                self.run()
+            except BaseException:
+                pass  # kept in self.error for the UI
+        self._thread = threading.Thread(target=target, name="pixie-rekey", daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout: float | None = None):
+        if self._thread:
+            self._thread.join(timeout)
+
+def start(store: Storage, new_password: str | None, workers: int = 0) -> Rotation:
+    """Re-encrypt the vault under `new_password` (None removes encryption) in
+    the background."""
+    return Rotation(store, new_password, workers).start()
@@ -1,44 +1,47 @@
 # src/search.py
-from typing import List, Dict, Any, Set
+from typing import List, Set
 
-def all_field_labels(entries: List[Dict[str, Any]]) -> List[str]:
-    base = ["name", "protocol", "website", "username", "password", "notes"]
+from model import Entry, BASE_FIELDS, FIELDS
+
+def all_field_labels(entries: List[Entry]) -> List[str]:
+    base = list(BASE_FIELDS)
     extras: Set[str] = set()
     for e in entries:
-        for k in (e.get("custom") or {}).keys():
-            extras.add(k)
+        extras.update(e.custom)
     return base + sorted(extras)
 
-def matches(entry: Dict[str, Any], term: str, field: str | None) -> bool:
+def matches(entry: Entry, term: str, field: str | None) -> bool:
     t = term.lower()
     if not field or field == "Any":
         return _any_match(entry, t)
     # base
-    if field in entry and isinstance(entry[field], str):
-        return t in entry[field].lower()
+    if field in FIELDS:
+        v = getattr(entry, field)
+        if isinstance(v, str):
+            return t in v.lower()
     # custom
-    if field in (entry.get("custom") or {}):
-        v = entry["custom"][field]
-        return t in str(v).lower()
+    if field in entry.custom:
+        return t in str(entry.custom[field]).lower()
     return False
 
-def _any_match(e: Dict[str, Any], t: str) -> bool:
-    for k in ["name","protocol","website","username","password","notes"]:
-        v = e.get(k)
-        if isinstance(v, str) and t in v.lower():
-            return True
-    for k, v in (e.get("custom") or {}).items():
+def _any_match(e: Entry, t: str) -> bool:
+    if (t in e.name.lower() or t in e.protocol.lower() or t in e.website.lower()
+            or t in e.username.lower()):
+        return True
+    for v in e.custom.values():
         if t in str(v).lower():
             return True
-    return False
+    # Last: in bounded-memory mode the body is read from the spill file
+    # (Storage.query runs inside body_scan(), so that leaves the cache alone)
+    return t in e.password.lower() or t in e.notes.lower()
 
-def sort_entries(entries: List[Dict[str, Any]], mode: str) -> List[Dict[str, Any]]:
+def sort_entries(entries: List[Entry], mode: str) -> List[Entry]:
     if mode == "A→Z":
-        return sorted(entries, key=lambda e: (e.get("name") or "").lower())
+        return sorted(entries, key=lambda e: e.name.lower())
     if mode == "Recently Updated":
-        return sorted(entries, key=lambda e: e.get("updated_at") or 0, reverse=True)
+        return sorted(entries, key=lambda e: e.updated_at or 0, reverse=True)
     if mode == "Recently Added":
-        return sorted(entries, key=lambda e: e.get("created_at") or 0, reverse=True)
+        return sorted(entries, key=lambda e: e.created_at or 0, reverse=True)
     if mode == "Most Used":
-        return sorted(entries, key=lambda e: (e.get("access_count") or 0, e.get("last_access_at") or 0), reverse=True)
+        return sorted(entries, key=lambda e: (e.access_count, e.last_access_at or 0), reverse=True)
     return entries
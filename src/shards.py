@@ -0,0 +1,89 @@
+# src/shards.py
+# Sharded on-disk layout: entries are spread over N shard files by a stable
+# hash of their id, next to an index file that lists them.
+#
+#   data/vault.d/index.json      {"format": "pixievault-shards", "shards": 16, "files": [...], "meta": {...}}
+#   data/vault.d/shard-16-00.json   {"entries": [...]}   (or compressed, see codec.py)
+#
+# Only shards holding changed entries are rewritten on save, and large vaults
+# are parsed with one process per shard so all cores help with cold start.
+import functools, json, os, zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import codec
+
+FORMAT = "pixievault-shards"
+INDEX_NAME = "index.json"
+# Below this many bytes of shard files, process start-up costs more than it saves
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+def shard_of(entry_id: str, shards: int) -> int:
+    return zlib.crc32(entry_id.encode("utf-8")) % shards
+
+def shard_name(i: int, shards: int, generation: int = 0) -> str:
+    # Shard count and generation are part of the name, so re-sharding or
+    # re-keying writes a new set of files and the old set stays valid until
+    # the new index replaces the old one
+    if generation:
+        return f"shard-{shards}-{i:02d}.g{generation}.json"
+    return f"shard-{shards}-{i:02d}.json"
+
+def index_path(shard_dir: str) -> str:
+    return os.path.join(shard_dir, INDEX_NAME)
+
+def exists(shard_dir: str) -> bool:
+    return os.path.exists(index_path(shard_dir))
+
+def read_index(shard_dir: str) -> Dict[str, Any]:
+    with open(index_path(shard_dir), "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("format") != FORMAT:
+        raise ValueError(f"{index_path(shard_dir)} is not a Pixie Vault shard index")
+    return index
+
+def read_shard(path: str, dict_root: str | None = None) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    return codec.read(path, dict_root).get("entries", [])
+
+def load(shard_dir: str, workers: int = 0, dict_root: str | None = None) -> Tuple[Dict[str, Any], List[List[Dict[str, Any]]]]:
+    """Read every shard. Returns (data, entries per shard), where data has the
+    same shape as a monolithic vault.json (entries in no particular order).
+    workers=0 means one per CPU, workers=1 reads serially. `dict_root` holds
+    the preset dictionaries of compressed shards."""
+    index = read_index(shard_dir)
+    paths = [os.path.join(shard_dir, name) for name in index["files"]]
+    total = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(paths) > 1 and total >= PARALLEL_MIN_BYTES:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            per_shard = list(pool.map(functools.partial(read_shard, dict_root=dict_root), paths))
+    else:
+        per_shard = [read_shard(p, dict_root) for p in paths]
+    entries = [e for shard in per_shard for e in shard]
+    data = dict(index.get("meta") or {})
+    data["entries"] = entries
+    return data, per_shard
+
+def dump_shard(entries: List[Dict[str, Any]], fmt: str = "json",
+               zdict: Tuple[str, bytes] | None = None, trained_on: int = 0) -> str | bytes:
+    entries = sorted(entries, key=lambda e: (e.get("created_at") or 0, e["id"]))
+    return codec.encode({"entries": entries}, fmt, zdict, trained_on)
+
+def dump_index(shards: int, meta: Dict[str, Any], generation: int = 0) -> str:
+    return json.dumps({
+        "format": FORMAT,
+        "version": 1,
+        "shards": shards,
+        "generation": generation,
+        "files": [shard_name(i, shards, generation) for i in range(shards)],
+        "meta": meta,
+    }, ensure_ascii=False, indent=2)
+
+def remove_stale(shard_dir: str, shards: int, generation: int = 0):
+    """Delete shard files left over from another shard count or generation."""
+    keep = {shard_name(i, shards, generation) for i in range(shards)} | {INDEX_NAME}
+    for name in os.listdir(shard_dir):
+        if name.startswith("shard-") and name.endswith(".json") and name not in keep:
+            os.remove(os.path.join(shard_dir, name))
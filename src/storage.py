@@ -1,77 +1,1338 @@
 # src/storage.py
-import json, os, time, hashlib, base64, uuid
-from typing import Dict, List, Any
+import json, os, glob, shutil, time, hashlib, base64, uuid, tempfile, threading, atexit, weakref
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterable, List, Any, Set, Tuple
+import metrics, shards, crypto, views, codec, bodies
+from model import Entry
+from search import matches, sort_entries, all_field_labels
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "vault.json")
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "config.json")
+BOUNDED_LOAD_CHUNK = 8192  # entries decoded at a time when loading in bounded-memory mode
+
+def atomic_write(path: str, text: str | bytes):
+    """Write `text` (or bytes) to `path` so a crash leaves either the old or the
+    new file, never a truncated one: temp file in the same dir + fsync + os.replace."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with (os.fdopen(fd, "wb") if isinstance(text, bytes) else os.fdopen(fd, "w", encoding="utf-8")) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    # Persist the rename itself (not supported on Windows)
+    try:
+        dfd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dfd)
+    except OSError:
+        pass
+    finally:
+        os.close(dfd)
+
+class FileLock:
+    """Exclusive advisory lock on a file, shared by every process (and thread)
+    that opens the same vault. Each acquire() opens its own descriptor, so
+    threads of one process exclude each other too."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: int | None = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Take the lock; with `blocking` False, return False at once if
+        someone else holds it."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    return False
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            os.close(fd)
+                            return False
+                        continue  # LK_LOCK gives up after ~10 s; keep waiting
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def _stat(path: str) -> Tuple[int, int, int] | None:
+    # Every save replaces the file, so a new inode or mtime means another write
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+class ConflictError(Exception):
+    """The entry was changed by another writer since the caller read it."""
+
+class _Persister(threading.Thread):
+    """Write-behind thread. Mutations only bump a dirty counter; the thread
+    waits `delay` seconds for more to arrive and then writes them all in one
+    group commit. flush() is a barrier that returns once everything marked
+    dirty before the call is on disk."""
+
+    def __init__(self, storage: "Storage", delay: float):
+        super().__init__(name="pixie-persist", daemon=True)
+        self._storage = weakref.ref(storage)
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._dirty = 0      # generation of the latest mutation
+        self._saved = 0      # generation known to be on disk
+        self._urgent = False
+        self._stopping = False
+        self.error: BaseException | None = None
+
+    def mark_dirty(self):
+        with self._cond:
+            self._dirty += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        with self._cond:
+            target = self._dirty
+            if self._saved >= target:
+                return True
+            self._urgent = True
+            self._cond.notify_all()
+            done = self._cond.wait_for(lambda: self._saved >= target or self.error is not None, timeout)
+            if self.error is not None:
+                err, self.error = self.error, None
+                raise err
+            return done
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._urgent = True
+            self._cond.notify_all()
+        self.join()
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty > self._saved or self._stopping)
+                if self._dirty <= self._saved:
+                    return  # stopping and nothing left to write
+                # Coalesce: let a burst of mutations pile up before writing
+                self._cond.wait_for(lambda: self._urgent, self.delay)
+                self._urgent = False
+                target = self._dirty
+            storage = self._storage()
+            if storage is None:
+                return
+            try:
+                storage.save()
+            except BaseException as e:
+                with self._cond:
+                    self.error = e
+                    self._cond.notify_all()
+                time.sleep(self.delay)  # don't spin on a persistent disk error
+                continue
+            finally:
+                del storage
+            with self._cond:
+                self._saved = max(self._saved, target)
+                self.error = None  # a retry got through: an earlier failure no longer applies
+                self._cond.notify_all()
+
+_LIVE: "weakref.WeakSet[Storage]" = weakref.WeakSet()
+
+@atexit.register
+def _flush_live_storages():
+    for s in list(_LIVE):
+        try:
+            s.close()
+        except Exception:
+            pass
 
 class Storage:
-    def __init__(self):
+    def __init__(self, data_path: str | None = None, config_path: str | None = None,
+                 write_behind: bool | None = None, password: str | None = None):
+        self.data_path = data_path or DATA_PATH
+        self.config_path = config_path or CONFIG_PATH
         self.config = self._load_config()
+        metrics.configure(self.config.get("metrics"))
         self.encryption_enabled = self.config.get("encryption_enabled", False)
-        self._key = None  # only used if you later enable Fernet
+        self._key: bytes | None = None  # Fernet key once an encrypted vault is unlocked
+        self._password = password
+        self._sealed: Dict[str, Dict[str, Any] | int] = {}  # id -> on-disk sealed form (or its spill ref), reused until the entry changes
+        self._rekey_touched: Set[str] | None = None  # ids changed while a key rotation runs
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._batch_dirty = False
+        self._listeners: List[Callable[[Iterable[str] | None], None]] = []
+        self._view: views.VaultView | None = None  # last published version, see view()
+        self._view_dirty: Set[str] = set()  # ids changed since it was published
+        self._device_id: str | None = None
+        self._blobs = None  # attachments.BlobStore, opened on first use
+        self._history = None  # history.History, opened on first use
+        self._snapshots = None  # backup.SnapshotStore, opened on first use
+        self._next_snapshot = 0.0  # snapshot_if_due() does nothing before this time
+        self._facets = None  # facets.FacetIndex, built on first use
+        self._dupes = None  # dedupe.DuplicateFinder, built on first use
+        self._suggester = None  # suggest.Suggester, built on first use
+        self._domains = None  # domains.DomainIndex, built on first use
+
+        storage_cfg = self.config.get("storage", {})
+        self.layout = storage_cfg.get("layout", "json")  # "json" | "sharded"
+        self.shard_count = int(storage_cfg.get("shards", 16))
+        self.load_workers = int(storage_cfg.get("load_workers", 0))
+        self.shard_dir = os.path.splitext(self.data_path)[0] + ".d"
+        self._dirty_shards: Set[int] = set()
+        self._meta_dirty = False  # index.json needs rewriting (tombstones changed)
+        self._source_layout: str | None = None  # layout the vault was read from
+        self._source_shards = 0
+        self._shard_gen = 0
+        # At-rest encoding (see codec.py)
+        self.codec = storage_cfg.get("codec", "json")
+        if self.codec not in codec.CODECS:
+            raise ValueError(f"storage.codec must be one of {', '.join(codec.CODECS)}")
+        # A dictionary pays off for many small files; one vault.json gains less than the dictionary's size
+        self.codec_dictionary = bool(storage_cfg.get("codec_dictionary", self.layout == "sharded"))
+        self._dicts = codec.Dictionaries(codec.dict_dir(self.data_path))
+        self._zdict: Tuple[str, bytes] | None = None  # (id, preset dictionary) zlib files are written with
+        self._zdict_trained = 0  # entries it was trained on
+        self._source_codec: str | None = None  # encoding the vault was read in
+        # Bounded-memory mode (see bodies.py)
+        self.bounded_memory = bool(storage_cfg.get("bounded_memory", False))
+        self.body_cache_kb = int(storage_cfg.get("body_cache_kb", 1024))
+        self._entry_type = bodies.LazyEntry if self.bounded_memory else Entry
+        self._bodies: bodies.BodyStore | None = None
+        self._unspilled: Set[str] = set()  # ids whose body or sealed form may still be in memory
+        self._spill_checked = 0  # spill file size when it was last checked for dead records
+        # Other writers (see _merge_from_disk)
+        self.lock_path = os.path.splitext(self.data_path)[0] + ".lock"
+        self._stamps: Dict[str, Tuple[int, int, int] | None] = {}  # file -> stat as last read or written
+        self._disk_revs: Dict[str, int] = {}  # id -> rev as last read from or written to disk
+        self._local_dirty: Set[str] = set()  # ids changed here and not saved yet
+
         self.data = self._load()
+        self._password = None
+        self._reindex()
+        self._disk_revs = {e.id: e.rev for e in self.data.get("entries", [])}
+        # Migrating between layouts, shard counts or codecs rewrites everything once
+        self._full_save = self._source_layout is not None and (
+            self._source_layout != self.layout
+            or (self.layout == "sharded" and self._source_shards != self.shard_count)
+            or self._source_codec != self.codec
+            or (self._wants_dict() and self._zdict is None))
+
+        if write_behind is None:
+            write_behind = storage_cfg.get("write_behind", True)
+        self._persister: _Persister | None = None
+        if write_behind:
+            self._persister = _Persister(self, storage_cfg.get("commit_delay_ms", 50) / 1000.0)
+            self._persister.start()
+            _LIVE.add(self)
+        if self._full_save:
+            with self._lock:
+                self._commit()
 
     def _load_config(self) -> Dict[str, Any]:
-        if not os.path.exists(CONFIG_PATH):
+        if not os.path.exists(self.config_path):
             return {"encryption_enabled": False}
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        with open(self.config_path, "r", encoding="utf-8") as f:
             return json.load(f)
 
+    def _reindex(self):
+        self._by_id: Dict[str, Entry] = {e.id: e for e in self.data.get("entries", [])}
+        self._shard_members: List[Set[str]] = []
+        if self.layout == "sharded":
+            self._shard_members = [set() for _ in range(self.shard_count)]
+            for entry_id in self._by_id:
+                self._shard_members[shards.shard_of(entry_id, self.shard_count)].add(entry_id)
+
+    @metrics.timed("load")
     def _load(self) -> Dict[str, Any]:
-        if not os.path.exists(DATA_PATH):
+        data = self._read_raw(self._stamps)
+        header = data.get("crypto")
+        if header:
+            if self._key is None:
+                if self._password is None:
+                    raise crypto.VaultLocked("vault is encrypted; a password is required")
+                self._key = crypto.unlock(header, self._password)
+        if self.bounded_memory:
+            data["entries"] = self._load_spilled(data.get("entries", []))
+        else:
+            if header:
+                sealed = data.get("entries", [])
+                data["entries"] = crypto.unseal_many(self._key, sealed, self.load_workers)
+                self._sealed = {x["id"]: x for x in sealed}
+            data["entries"] = [Entry.from_dict(d) for d in data.get("entries", [])]
+        if self._source_layout == "sharded":
+            data["entries"].sort(key=lambda e: (e.created_at or 0, e.id))
+        return data
+
+    def _load_spilled(self, items: List[Dict[str, Any]]) -> List[Entry]:
+        # A chunk at a time: decode, spill the bodies (and sealed forms), and
+        # let go of the dicts, so the decoded vault is never in memory whole
+        self._bodies = bodies.BodyStore(os.path.dirname(os.path.abspath(self.data_path)), self.body_cache_kb << 10)
+        if self._key is not None:
+            self._bodies.start_encrypting(crypto.new_data_key())
+        metrics.gauge("body_cache", self._bodies.stats)
+        self._sealed = {}
+        out: List[Entry] = []
+        for start in range(0, len(items), BOUNDED_LOAD_CHUNK):
+            part = items[start:start + BOUNDED_LOAD_CHUNK]
+            items[start:start + len(part)] = [None] * len(part)
+            if self._key is not None:
+                for x in part:
+                    self._sealed[x["id"]] = self._bodies.append_json(x)
+                part = crypto.unseal_many(self._key, part, self.load_workers)
+            for d in part:
+                e = bodies.LazyEntry.from_dict(d)
+                e.spill(self._bodies)
+                out.append(e)
+        return out
+
+    def _spill(self):
+        # With self._lock held, after a save: move bodies and sealed forms of
+        # entries changed since the last spill out of memory. Views still
+        # holding the in-memory versions are refreshed on their next use.
+        if self._bodies is None or not self._unspilled:
+            return
+        spilled = set()
+        for entry_id in self._unspilled:
+            e = self._by_id.get(entry_id)
+            if e is not None and e.spill(self._bodies):
+                spilled.add(entry_id)
+            sealed = self._sealed.get(entry_id)
+            if isinstance(sealed, dict):
+                self._sealed[entry_id] = self._bodies.append_json(sealed)
+        self._unspilled = set()
+        if self._view is not None:
+            self._view_dirty.update(spilled)
+
+    def _maybe_compact(self):
+        # After a save. Records replaced by newer ones (a body set again, the
+        # sealed form of every entry saved since it was spilled) stay in the
+        # spill file; once they are most of it, copy what is still pointed at
+        # to a fresh file. Only this process's file: the vault lock isn't needed.
+        with self._lock:
+            store = self._bodies
+            if store is not None and store.end - self._spill_checked >= bodies.COMPACT_MIN:
+                self._compact_bodies(store)
+
+    def _compact_bodies(self, store: bodies.BodyStore):
+        live = sum(e.spilled_bytes(store) for e in self._by_id.values())
+        live += sum(ref & 0xFFFFFFFF for ref in self._sealed.values() if isinstance(ref, int))
+        self._spill_checked = store.end
+        if store.end - live < max(live, bodies.COMPACT_MIN):
+            return
+        with metrics.span("compact_bodies"):
+            fresh = bodies.BodyStore(os.path.dirname(os.path.abspath(self.data_path)), store.budget)
+            if self._key is not None:
+                fresh.start_encrypting(crypto.new_data_key())
+            fresh.hits, fresh.misses = store.hits, store.misses
+            with store.scan():
+                for e in self._by_id.values():
+                    e.move_body(fresh)
+            for entry_id, ref in self._sealed.items():
+                if isinstance(ref, int):
+                    self._sealed[entry_id] = fresh.append(store.read(ref))
+            self._bodies = fresh
+            metrics.gauge("body_cache", fresh.stats)
+            self._spill_checked = fresh.end
+            # Rebuilt from the moved entries on next use; views handed out
+            # before keep reading the old file, which closes once they are gone
+            self._view = None
+            self._view_dirty = set()
+
+    def body_scan(self):
+        """with store.body_scan(): ... -- reads of every entry's password or
+        notes on this thread bypass the bounded-memory body cache."""
+        return self._bodies.scan() if self._bodies is not None else nullcontext()
+
+    def memory_stats(self) -> Dict[str, Any] | None:
+        """Body cache hit rate and what stays in memory, in bounded-memory
+        mode (None otherwise)."""
+        if self._bodies is None:
+            return None
+        with self._lock:
+            entries = list(self.all_entries())
+        return dict(self._bodies.stats(), entries=len(entries), resident_bytes=bodies.resident_bytes(entries))
+
+    def _read_raw(self, stamps: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        """The vault as stored on disk (entries still sealed if encrypted).
+        With `stamps`, also note what each file looked like before reading it."""
+        # Prefer the configured layout; fall back to the other one so switching
+        # "layout" in config.json migrates the existing vault
+        sharded = shards.exists(self.shard_dir)
+        if sharded and (self.layout == "sharded" or not os.path.exists(self.data_path)):
+            if stamps is not None:
+                index_path = shards.index_path(self.shard_dir)
+                stamps[index_path] = _stat(index_path)
+                for name in shards.read_index(self.shard_dir)["files"]:
+                    stamps[os.path.join(self.shard_dir, name)] = _stat(os.path.join(self.shard_dir, name))
+            data, per_shard = shards.load(self.shard_dir, self.load_workers, self._dicts.root)
+            self._source_layout, self._source_shards = "sharded", len(per_shard)
+            index = shards.read_index(self.shard_dir)
+            self._shard_gen = index.get("generation", 0)
+            for name in index["files"]:
+                head = codec.peek(os.path.join(self.shard_dir, name))
+                if head is not None:
+                    self._adopt_codec(head)
+                    break
+            return data
+        if stamps is not None:
+            stamps[self.data_path] = _stat(self.data_path)
+        if not os.path.exists(self.data_path):
             return {"entries": []}
-        with open(DATA_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(self.data_path, "rb") as f:
+            raw = f.read()
+        data = codec.decode(raw, self._dicts.get)
+        self._source_layout = "json"
+        self._adopt_codec(codec.header(raw))
+        return data
+
+    def _adopt_codec(self, head: Dict[str, Any]):
+        # Note how the vault was stored, and keep writing with its preset
+        # dictionary while it suits the configured codec
+        self._source_codec = head["codec"]
+        if head.get("dict") and self._zdict is None and self._wants_dict():
+            self._zdict = (head["dict"], self._dicts.get(head["dict"]))
+            self._zdict_trained = int(head.get("trained_on", 0))
+
+    def _wants_dict(self) -> bool:
+        return self.codec == "zlib" and self.codec_dictionary
+
+    def _should_train(self) -> bool:
+        # Train once, then again whenever the vault has doubled since
+        n = len(self.data.get("entries", []))
+        return self._wants_dict() and (self._zdict is None or n >= max(2 * self._zdict_trained, self._zdict_trained + 16))
+
+    def _train_dict(self):
+        entries = self.data.get("entries", [])
+        data = codec.train(self._disk_entries(entries))
+        self._zdict = (codec.dict_id(data), data)
+        self._zdict_trained = len(entries)
+
+    @property
+    def encrypted(self) -> bool:
+        return self._key is not None
+
+    def _disk_entries(self, entries: List[Entry]) -> List[Dict[str, Any]]:
+        # Called with self._lock held. Only entries changed since the last save
+        # are encrypted again; the rest reuse their cached sealed form. Sealed
+        # entries carry their rev in the clear so other writers can tell what
+        # changed without decrypting everything.
+        if self._key is None:
+            return [e.to_dict() for e in entries]
+        out = []
+        for e in entries:
+            sealed = self._sealed.get(e.id)
+            if isinstance(sealed, int):
+                sealed = self._bodies.read_json(sealed)  # spilled (bounded-memory mode)
+            if sealed is None or sealed.get("rev", 0) != e.rev:
+                sealed = self._sealed[e.id] = crypto.seal(self._key, e.to_dict())
+                if e.rev:
+                    sealed["rev"] = e.rev
+            out.append(sealed)
+        return out
+
+    def save(self, full: bool = False):
+        """Write the vault now, on the calling thread. In the sharded layout
+        only shards with changes are written unless `full` is set. Changes
+        other processes saved in the meantime are merged in first; the vault
+        lock file is held from that merge until the write is done."""
+        self._save(full)
+
+    def _save(self, full: bool, before_write: Callable[[], None] | None = None):
+        # `before_write` runs with both locks held, after the merge: the key
+        # rotation swaps keys there, so other writers' changes are still read
+        # under the key they were written with
+        with metrics.span("save"):
+            lock = FileLock(self.lock_path)
+            with self._lock:
+                lock.acquire()
+                try:
+                    self._merge_from_disk()
+                    if before_write is not None:
+                        before_write()
+                    with self.body_scan():
+                        job = self._prepare_save(full)
+                    self._spill()
+                except BaseException:
+                    lock.release()
+                    raise
+            try:
+                try:
+                    self._write_save(job)
+                except BaseException:
+                    lock.release()
+                    with self._lock:
+                        self._dirty_shards.update(job["shards"])
+                        self._meta_dirty = self._meta_dirty or job["index"] is not None
+                        self._local_dirty.update(job["dirty"])
+                    raise
+                if self._source_layout not in (None, self.layout):
+                    self._retire_old_layout(job)
+                if self._history is not None:
+                    self._history.flush()
+            finally:
+                lock.release()
+            self._maybe_compact()
+
+    def _prepare_save(self, full: bool) -> Dict[str, Any]:
+        # With self._lock and the vault lock held: everything to write, as text
+        # or bytes. A preset dictionary is (re)trained on full saves only, so
+        # the files never name more than the current one and the one before.
+        job: Dict[str, Any] = {"files": {}, "shards": set(), "index": None,
+                               "dirty": self._local_dirty, "revs": None, "full": full}
+        self._local_dirty = set()
+        if self.layout == "sharded":
+            # A new vault has no index yet: its first save writes everything
+            full = full or self._full_save or self._stamps.get(shards.index_path(self.shard_dir)) is None \
+                or self._should_train()
+            if full and self._should_train():
+                self._train_dict()
+            zdict = self._zdict if self.codec == "zlib" else None
+            todo = range(self.shard_count) if full else sorted(self._dirty_shards)
+            gen = self._shard_gen
+            for i in todo:
+                job["files"][os.path.join(self.shard_dir, shards.shard_name(i, self.shard_count, gen))] = \
+                    shards.dump_shard(self._disk_entries([self._by_id[x] for x in self._shard_members[i]]),
+                                      self.codec, zdict, self._zdict_trained)
+            job["shards"] = set(todo)
+            if full or self._meta_dirty:
+                meta = {k: v for k, v in self.data.items() if k != "entries"}
+                job["index"] = shards.dump_index(self.shard_count, meta, gen)
+            self._dirty_shards.clear()
+            self._full_save = self._meta_dirty = False
+        else:
+            full = True
+            if self._should_train():
+                self._train_dict()
+            zdict = self._zdict if self.codec == "zlib" else None
+            out = dict(self.data, entries=self._disk_entries(self.data.get("entries", [])))
+            job["files"][self.data_path] = codec.encode(out, self.codec, zdict, self._zdict_trained, indent=2)
+        job["full"] = full
+        job["zdict"] = zdict
+        if full:
+            job["revs"] = {e.id: e.rev for e in self.data.get("entries", [])}
+        else:
+            job["revs"] = {i: self._by_id[i].rev for i in job["dirty"] if i in self._by_id}
+        return job
+
+    def _write_save(self, job: Dict[str, Any]):
+        # Vault lock held, self._lock not needed: only savers touch _stamps and _disk_revs
+        if job["zdict"] is not None:
+            self._dicts.put(job["zdict"][1])  # before any file names it
+        for path, text in job["files"].items():
+            atomic_write(path, text)
+            self._stamps[path] = _stat(path)
+        if job["index"] is not None:
+            # The index goes last: until it is replaced, readers still see the old shard set
+            index_path = shards.index_path(self.shard_dir)
+            atomic_write(index_path, job["index"])
+            self._stamps[index_path] = _stat(index_path)
+            shards.remove_stale(self.shard_dir, self.shard_count, self._shard_gen)
+        if job["full"]:
+            # Forget files of an older shard set or layout
+            current = set(job["files"]) | {shards.index_path(self.shard_dir)}
+            for path in [p for p in self._stamps if p not in current]:
+                del self._stamps[path]
+            self._disk_revs = job["revs"]
+            self._dicts.remove_except([job["zdict"][0]] if job["zdict"] is not None else [])
+        else:
+            self._disk_revs.update(job["revs"])
+            for entry_id in job["dirty"]:
+                if entry_id not in job["revs"]:
+                    self._disk_revs.pop(entry_id, None)  # deleted here
+
+    # --- Other writers ---
+    def refresh(self, wait: bool = True) -> int:
+        """Pick up changes other processes saved to this vault. Returns the
+        number of entries that changed. Takes no lock unless a vault file
+        changed; with `wait` False it also gives up (returning 0) instead of
+        waiting while someone else is saving, for callers that poll."""
+        if not self._disk_changed():
+            return 0
+        lock = FileLock(self.lock_path)
+        with self._lock:
+            # self._lock before the vault lock, like save(); without `wait`
+            # nobody is kept waiting on it while a save goes to disk
+            if not lock.acquire(blocking=wait):
+                return 0
+            try:
+                return len(self._merge_from_disk())
+            finally:
+                lock.release()
+
+    def _disk_changed(self) -> bool:
+        # Whether a vault file's stat moved since this process last read or
+        # wrote it, without any lock: a stale answer only means a later
+        # refresh looks again
+        stamps = dict(self._stamps)
+        if self.layout != "sharded":
+            return _stat(self.data_path) != stamps.get(self.data_path)
+        index_path = shards.index_path(self.shard_dir)
+        if _stat(index_path) != stamps.get(index_path):
+            return True
+        return any(_stat(p) != stamp for p, stamp in stamps.items()
+                   if p != index_path and os.path.dirname(p) == self.shard_dir)
+
+    def _changed_files(self) -> Tuple[Dict[str, Any] | None, List[str]]:
+        # (new shard index or None, files whose stamp changed), compared with
+        # what this process last read or wrote
+        if self.layout != "sharded":
+            return None, [self.data_path] if _stat(self.data_path) != self._stamps.get(self.data_path) else []
+        index_path = shards.index_path(self.shard_dir)
+        index = None
+        if _stat(index_path) != self._stamps.get(index_path):
+            self._stamps[index_path] = _stat(index_path)
+            if not shards.exists(self.shard_dir):
+                return None, []
+            index = shards.read_index(self.shard_dir)
+            files = [os.path.join(self.shard_dir, n) for n in index["files"]]
+        else:
+            files = [p for p in self._stamps if p != index_path and os.path.dirname(p) == self.shard_dir]
+        return index, [p for p in files if _stat(p) != self._stamps.get(p)]
+
+    def _merge_from_disk(self) -> Set[str]:
+        """Fold in what other writers saved since this process last read or
+        wrote the vault. Only files whose stat changed are read again, and of
+        those only entries whose rev moved are decoded. An entry changed both
+        here and there keeps the local version; the other one is put in its
+        history. Called with self._lock and the vault lock held."""
+        index, paths = self._changed_files()
+        meta: Dict[str, Any] | None = None
+        everything = False  # every file of the vault is being re-read
+        if index is not None:
+            meta = index.get("meta") or {}
+            if index.get("shards") != self.shard_count or index.get("generation", 0) != self._shard_gen:
+                # A new shard set written elsewhere: read all of it
+                paths = [os.path.join(self.shard_dir, n) for n in index["files"]]
+                everything = True
+                if index.get("shards") == self.shard_count:
+                    self._shard_gen = index.get("generation", 0)  # re-keyed; keep writing into that set
+                else:  # re-sharded with another count: write our own set
+                    self._shard_gen = max(self._shard_gen, index.get("generation", 0)) + 1
+                    self._full_save = True
+        if not paths and meta is None:
+            return set()
+
+        read: Dict[str, Dict[str, Any]] = {}
+        covered: Set[str] = set()  # ids the re-read files are responsible for
+        names = {shards.shard_name(i, self.shard_count, self._shard_gen): i for i in range(self.shard_count)}
+        for path in paths:
+            stamp = _stat(path)
+            if path == self.data_path:
+                if not os.path.exists(path):
+                    continue
+                data = codec.read(path, self._dicts.root)
+                meta = {k: v for k, v in data.items() if k != "entries"}
+                items = data.get("entries", [])
+                everything = True
+            else:
+                items = shards.read_shard(path, self._dicts.root)
+                i = names.get(os.path.basename(path))
+                if not everything and i is not None:
+                    covered.update(x for x in self._disk_revs if shards.shard_of(x, self.shard_count) == i)
+            self._stamps[path] = stamp
+            for d in items:
+                read[d["id"]] = d
+        if meta is not None and meta.get("crypto") != self.data.get("crypto"):
+            raise ConflictError("the vault was re-encrypted by another process; reopen it")
+
+        changed: Set[str] = set()
+        tombs = self.data.setdefault("tombstones", {})
+        for entry_id, d in read.items():
+            rev = d.get("rev", 0)
+            if self._disk_revs.get(entry_id) == rev:
+                continue  # not touched by anyone else
+            self._disk_revs[entry_id] = rev
+            theirs = self._entry_type.from_dict(crypto.unseal(self._key, d) if crypto.is_sealed(d) else d)
+            self.history.forget(entry_id)
+            mine = self._by_id.get(entry_id)
+            if entry_id in self._local_dirty:
+                # Changed on both sides: ours is saved next, theirs goes to history
+                self.history.record(theirs)
+                if mine is not None:
+                    mine.rev = max(mine.rev, rev) + 1
+                continue
+            if mine is not None:
+                mine.assign(theirs)
+            else:
+                self.data.setdefault("entries", []).append(theirs)
+                self._by_id[entry_id] = theirs
+                if self._shard_members:
+                    self._shard_members[shards.shard_of(entry_id, self.shard_count)].add(entry_id)
+            if crypto.is_sealed(d):
+                self._sealed[entry_id] = d
+            else:
+                self._sealed.pop(entry_id, None)
+            if tombs.pop(entry_id, None) is not None:
+                self._meta_dirty = True  # brought back elsewhere
+            changed.add(entry_id)
+
+        # Saved before and missing now: deleted by another writer
+        gone = (set(self._disk_revs) if everything else covered) - set(read)
+        for entry_id in gone:
+            self._disk_revs.pop(entry_id, None)
+            e = self._by_id.get(entry_id)
+            if e is None or entry_id in self._local_dirty:
+                continue  # already gone here, or edited here since: keep it
+            self.history.forget(entry_id)
+            self.history.record(e)
+            del self._by_id[entry_id]
+            if self._shard_members:
+                self._shard_members[shards.shard_of(entry_id, self.shard_count)].discard(entry_id)
+            changed.add(entry_id)
+        if gone & changed:
+            self.data["entries"] = [e for e in self.data.get("entries", []) if e.id in self._by_id]
+
+        for entry_id, tomb in ((meta or {}).get("tombstones") or {}).items():
+            if entry_id not in tombs and entry_id not in self._by_id:
+                tombs[entry_id] = tomb
 
-    def save(self):
-        os.makedirs(os.path.dirname(DATA_PATH), exist_ok=True)
-        with open(DATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        if changed:
+            if self._rekey_touched is not None:
+                self._rekey_touched.update(changed)  # the rotation resealed the old version
+            self._unspilled.update(changed)
+            if self._view is not None:
+                self._view_dirty.update(changed)
+            for listener in self._listeners:
+                listener(tuple(changed))
+        return changed
+
+    def _retire_old_layout(self, job: Dict[str, Any]):
+        # The vault now exists in both layouts. Once the new one reads back
+        # with every entry the save wrote, the old one is deleted: it is a
+        # full copy of the vault (in plain text if it predates encryption)
+        # that no key rotation would ever touch. Otherwise it is moved aside
+        # so it can't be loaded by mistake, but nothing is lost.
+        try:
+            if self.layout == "sharded":
+                written = shards.load(self.shard_dir, self.load_workers, self._dicts.root)[0]
+            else:
+                written = codec.read(self.data_path, self._dicts.root)
+            ok = job["full"] and {d["id"]: d.get("rev", 0) for d in written.get("entries", [])} == job["revs"]
+        except (OSError, ValueError, codec.CodecError):
+            ok = False
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        if self.layout == "sharded" and os.path.exists(self.data_path):
+            if ok:
+                os.remove(self.data_path)
+            else:
+                os.replace(self.data_path, f"{self.data_path}.pre-shard.{stamp}")
+        elif self.layout != "sharded" and os.path.isdir(self.shard_dir):
+            if ok:
+                shutil.rmtree(self.shard_dir)
+            else:
+                os.replace(self.shard_dir, f"{self.shard_dir}.migrated.{stamp}")
+        if ok:
+            self._remove_layout_copies()
+        self._source_layout = self.layout
+
+    def _remove_layout_copies(self):
+        # Copies of the vault set aside by migrations before they were deleted
+        for path in glob.glob(glob.escape(self.data_path) + ".pre-shard.*"):
+            os.remove(path)
+        for path in glob.glob(glob.escape(self.shard_dir) + ".migrated.*"):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _commit(self, *entry_ids: str):
+        # Called by every mutator with self._lock held
+        for entry_id in entry_ids:
+            self._sealed.pop(entry_id, None)
+            e = self._by_id.get(entry_id)
+            if e is not None:
+                e.rev += 1
+        self._local_dirty.update(entry_ids)
+        if self._bodies is not None:
+            self._unspilled.update(entry_ids)
+        if self._view is not None:
+            self._view_dirty.update(entry_ids)
+        if self._rekey_touched is not None:
+            self._rekey_touched.update(entry_ids)
+        if self._shard_members:
+            for entry_id in entry_ids:
+                self._dirty_shards.add(shards.shard_of(entry_id, self.shard_count))
+        if self._batch_depth:
+            self._batch_dirty = True
+        elif self._persister is not None:
+            self._persister.mark_dirty()
+        else:
+            self.save()
+        for listener in self._listeners:
+            listener(entry_ids)
+
+    def subscribe(self, listener: Callable[[Iterable[str] | None], None]):
+        """Call `listener(ids)` after every mutation with the ids it touched
+        (an empty tuple for changes that aren't about one entry). Listeners run
+        with the storage lock held and must not block."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Iterable[str] | None], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    # --- Versions and tombstones (see sync.py) ---
+    @property
+    def device_id(self) -> str:
+        """Stable id of this device, kept next to the vault in device.json (not
+        part of the vault, so a copied vault doesn't inherit it)."""
+        if self._device_id is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(self.data_path)), "device.json")
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._device_id = json.load(f)["device_id"]
+            except (OSError, ValueError, KeyError):
+                self._device_id = uuid.uuid4().hex[:12]
+                atomic_write(path, json.dumps({"device_id": self._device_id}))
+        return self._device_id
+
+    def _stamp(self, e: Entry):
+        # Version vector: one counter per device that ever edited the entry
+        vv = e.vv or {}
+        e.vv = {**vv, self.device_id: vv.get(self.device_id, 0) + 1}  # new dict: views share the old one
+
+    def tombstones(self) -> Dict[str, Dict[str, Any]]:
+        """id -> {"vv", "deleted_at"} for deleted entries, so deletions sync."""
+        return self.data.get("tombstones", {})
+
+    def _put_synced(self, entry: Dict[str, Any]):
+        """Insert or replace an entry exactly as given (merged by sync.py)."""
+        entry = self._entry_type.from_dict(entry)
+        with self._lock:
+            entry_id = entry.id
+            old = self._by_id.get(entry_id)
+            entry.rev = old.rev if old is not None else 0  # revs are local to this vault file
+            if old is not None:
+                self.history.record(old)
+                old.assign(entry)
+            else:
+                self.data.setdefault("entries", []).append(entry)
+                self._by_id[entry_id] = entry
+                if self._shard_members:
+                    self._shard_members[shards.shard_of(entry_id, self.shard_count)].add(entry_id)
+            if self.tombstones().pop(entry_id, None) is not None:
+                self._meta_dirty = True
+            self._commit(entry_id)
+
+    def _put_tombstone(self, entry_id: str, tomb: Dict[str, Any]):
+        with self._lock:
+            self.data.setdefault("tombstones", {})[entry_id] = tomb
+            self._meta_dirty = True
+            old = self._by_id.pop(entry_id, None)
+            if old is not None:
+                self.history.record(old)
+                self.data["entries"] = [e for e in self.data.get("entries", []) if e.id != entry_id]
+                if self._shard_members:
+                    self._shard_members[shards.shard_of(entry_id, self.shard_count)].discard(entry_id)
+            self._commit(entry_id)
+
+    # --- Key rotation hooks (see rekey.py) ---
+    def _begin_rekey(self):
+        with self._lock:
+            self._rekey_touched = set()
+
+    def _abort_rekey(self):
+        with self._lock:
+            self._rekey_touched = None
+
+    def _install_key(self, header: Dict[str, Any] | None, key: bytes | None,
+                     resealed: Dict[str, Dict[str, Any]]):
+        """Switch to a new key (None = plaintext) and write the whole vault as a
+        new generation. `resealed` holds entries already re-encrypted by the
+        rotation pipeline; anything changed since the rotation started is
+        sealed again from memory. Other writers' saves since the rotation
+        started are merged in under the old key first. If that write fails,
+        the store goes back to the old key, as the files on disk still are."""
+        before: List[Tuple[Any, ...]] = []
+
+        def switch():
+            before.append((self._key, self.data.get("crypto"), self._sealed, self._zdict,
+                           self._shard_gen, self._full_save))
+            touched = self._rekey_touched or set()
+            self._rekey_touched = None
+            self._sealed = {}
+            if key is not None:
+                for e in self.data.get("entries", []):
+                    r = resealed.get(e.id)
+                    if r is not None and e.id not in touched and crypto.is_sealed(r):
+                        self._sealed[e.id] = r
+                self.data["crypto"] = header
+            else:
+                self.data.pop("crypto", None)
+            self._key = key
+            self._zdict = None  # trained on the old form of the entries
+            if self._bodies is not None and key is not None:
+                self._bodies.start_encrypting(crypto.new_data_key())
+            self._unspilled.update(self._sealed)
+            self._shard_gen += 1
+            self._full_save = True
+
+        # Held throughout, so no other save can go out under the new key
+        # before a failed write is rolled back
+        with self._lock:
+            try:
+                self._save(True, switch)
+            except BaseException:
+                if before:
+                    self._key, header, self._sealed, self._zdict, self._shard_gen, self._full_save = before[0]
+                    if header is None:
+                        self.data.pop("crypto", None)
+                    else:
+                        self.data["crypto"] = header
+                raise
+        self._remove_layout_copies()  # left by older migrations, under the old key
+
+    @contextmanager
+    def batch(self):
+        """Group several mutations into a single commit:
+
+            with store.batch():
+                for item in items:
+                    store.add_entry(...)
+        """
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._batch_dirty:
+                    self._batch_dirty = False
+                    self._commit()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until every mutation made so far is on disk."""
+        if self._persister is None:
+            return True
+        return self._persister.flush(timeout)
+
+    def close(self):
+        """Flush pending writes and stop the persistence thread."""
+        if self._persister is not None:
+            self._persister.stop()
+            self._persister = None
+            _LIVE.discard(self)
 
     # --- Entries API ---
-    def all_entries(self) -> List[Dict[str, Any]]:
+    def all_entries(self) -> List[Entry]:
+        """The live entries. Only safe to iterate with the storage lock held
+        or on the thread that makes every edit; other readers use view()."""
         return self.data.get("entries", [])
 
-    def add_entry(self, base_fields: Dict[str, Any], custom_fields: Dict[str, Any]):
+    def view(self) -> views.VaultView:
+        """The vault as of now, as a version that later edits don't change.
+        Readers can take their time over it without holding the lock. Cheap
+        to call often: only entries edited since the previous call are copied."""
+        with self._lock:
+            if self._view is None:
+                self._view = views.VaultView.build(self.all_entries())
+            elif self._view_dirty:
+                self._view = self._view.evolve({i: self._by_id.get(i) for i in self._view_dirty})
+            self._view_dirty = set()
+            return self._view
+
+    def get_entry(self, entry_id: str) -> Entry | None:
+        return self._by_id.get(entry_id)
+
+    def field_labels(self) -> List[str]:
+        return all_field_labels(self.all_entries())
+
+    def query(self, term: str = "", field: str | None = None, sort_mode: str = "A→Z",
+              limit: int | None = None, facets: Dict[str, str] | None = None) -> List[Entry]:
+        """Filter by search term (optionally within one field) and by custom
+        field values (`facets`, key -> value, all must match), then sort.
+        Runs on a view(), so edits made meanwhile don't disturb it; the
+        entries returned are that version's read-only copies."""
+        entries = self.view().entries()
+        if facets:
+            with metrics.span("facets"):
+                ids = self.facet_index.select(facets)
+                entries = [e for e in entries if e.id in ids]
+        if "site:" in term.lower():
+            # "site:github.com work": entries for that site, then the rest of the term
+            words = term.split()
+            sites = [w[5:] for w in words if w.lower().startswith("site:") and len(w) > 5]
+            if sites:
+                term = " ".join(w for w in words if not w.lower().startswith("site:"))
+                with metrics.span("site"):
+                    ids = set().union(*(self.domain_index.lookup(s) for s in sites))
+                    entries = [e for e in entries if e.id in ids]
+        if term:
+            with metrics.span("search"), self.body_scan():
+                entries = [e for e in entries if matches(e, term, None if field == "Any" else field)]
+        with metrics.span("sort"):
+            entries = sort_entries(entries, sort_mode)
+        return entries[:limit] if limit else entries
+
+    def add_entry(self, base_fields: Dict[str, Any], custom_fields: Dict[str, Any],
+                  entry_id: str | None = None) -> str:
+        """Add an entry; returns its id (`entry_id` if given, e.g. handed out
+        by the daemon before a batched add runs)."""
         now = int(time.time())
-        entry = {
-            "id": str(uuid.uuid4()),
-            "name": base_fields.get("name","").strip(),
-            "protocol": base_fields.get("protocol","").strip(),
-            "website": base_fields.get("website","").strip(),
-            "username": base_fields.get("username","").strip(),
-            "password": base_fields.get("password",""),
-            "notes": base_fields.get("notes",""),
-            "custom": custom_fields or {},
-            "created_at": now,
-            "updated_at": now,
-            "access_count": 0,
-            "last_access_at": None
-        }
-        self.data.setdefault("entries", []).append(entry)
-        self.save()
-
-    def update_entry(self, entry_id: str, base_fields: Dict[str, Any], custom_fields: Dict[str, Any]):
-        for e in self.data.get("entries", []):
-            if e["id"] == entry_id:
-                for k in ("name","protocol","website","username","password","notes"):
-                    if k in base_fields:
-                        e[k] = base_fields[k]
-                e["custom"] = custom_fields or {}
-                e["updated_at"] = int(time.time())
-                self.save()
-                return True
-        return False
+        entry = self._entry_type(
+            id=entry_id or str(uuid.uuid4()),
+            name=base_fields.get("name","").strip(),
+            protocol=base_fields.get("protocol","").strip(),
+            website=base_fields.get("website","").strip(),
+            username=base_fields.get("username","").strip(),
+            password=base_fields.get("password",""),
+            notes=base_fields.get("notes",""),
+            custom=custom_fields,
+            created_at=now,
+            updated_at=now,
+        )
+        with self._lock:
+            self._stamp(entry)
+            self.data.setdefault("entries", []).append(entry)
+            self._by_id[entry.id] = entry
+            if self._shard_members:
+                self._shard_members[shards.shard_of(entry.id, self.shard_count)].add(entry.id)
+            self._commit(entry.id)
+        return entry.id
+
+    def _check_rev(self, entry_id: str, expected_rev: int | None):
+        # Edits made from a stale view (e.g. a dialog opened before another
+        # process saved) are refused instead of silently overwriting
+        if expected_rev is None:
+            return
+        self.refresh()
+        e = self._by_id.get(entry_id)
+        if e is not None and e.rev != expected_rev:
+            raise ConflictError(f"entry {entry_id} was changed elsewhere (rev {e.rev}, expected {expected_rev})")
 
-    def delete_entry(self, entry_id: str):
-        self.data["entries"] = [e for e in self.data.get("entries", []) if e["id"] != entry_id]
-        self.save()
+    def update_entry(self, entry_id: str, base_fields: Dict[str, Any], custom_fields: Dict[str, Any],
+                     expected_rev: int | None = None):
+        with self._lock:
+            self._check_rev(entry_id, expected_rev)
+            e = self._by_id.get(entry_id)
+            if e is None:
+                return False
+            self.history.record(e)
+            for k in ("name","protocol","website","username","password","notes"):
+                if k in base_fields:
+                    e[k] = base_fields[k]
+            e["custom"] = custom_fields
+            e.updated_at = int(time.time())
+            self._stamp(e)
+            self._commit(entry_id)
+            return True
+
+    def delete_entry(self, entry_id: str, expected_rev: int | None = None) -> bool:
+        with self._lock:
+            self._check_rev(entry_id, expected_rev)
+            e = self._by_id.pop(entry_id, None)
+            if e is None:
+                return False
+            self.history.record(e)
+            self._stamp(e)
+            self.data.setdefault("tombstones", {})[entry_id] = {"vv": e.vv, "deleted_at": int(time.time())}
+            self._meta_dirty = True
+            self.data["entries"] = [e for e in self.data.get("entries", []) if e.id != entry_id]
+            if self._shard_members:
+                self._shard_members[shards.shard_of(entry_id, self.shard_count)].discard(entry_id)
+            self._commit(entry_id)
+            return True
 
     def record_access(self, entry_id: str):
-        for e in self.data.get("entries", []):
-            if e["id"] == entry_id:
-                e["access_count"] = (e.get("access_count") or 0) + 1
-                e["last_access_at"] = int(time.time())
-                self.save()
+        with self._lock:
+            e = self._by_id.get(entry_id)
+            if e is None:
                 return
+            e.access_count += 1
+            e.last_access_at = int(time.time())
+            self._commit(entry_id)
+
+    # --- Facets (see facets.py) ---
+    @property
+    def facet_index(self):
+        if self._facets is None:
+            import facets  # only needed here
+            with self._lock:
+                if self._facets is None:
+                    self._facets = facets.FacetIndex(self)
+        return self._facets
+
+    def facet_counts(self, ids: Iterable[str] | None = None, top: int | None = None) -> Dict[str, List[Tuple[str, int]]]:
+        """Custom key -> [(value, entries)], most common first, counted over
+        `ids` (e.g. the current search result) or the whole vault."""
+        return self.facet_index.counts(ids, top)
+
+    # --- Websites (see domains.py) ---
+    @property
+    def domain_index(self):
+        if self._domains is None:
+            import domains  # only needed here
+            with self._lock:
+                if self._domains is None:
+                    self._domains = domains.DomainIndex(
+                        self, self.config.get("domains", {}).get("public_suffix_list"))
+        return self._domains
+
+    def site_entries(self, url: str, scope: str = "site") -> List[Entry]:
+        """Entries whose website is on the same site as `url` ("site"), on the
+        same host ("host"), or on the host or one of its subdomains
+        ("subdomains")."""
+        ids = self.domain_index.lookup(url, scope)
+        return sort_entries([self._by_id[i] for i in ids if i in self._by_id], "A→Z")
+
+    # --- Autocomplete (see suggest.py) ---
+    def suggest(self, field: str, prefix: str = "", limit: int = 8) -> List[str]:
+        """Values already used for `field` ("protocol", "website", "username",
+        or "custom" for custom field names) that start with `prefix`."""
+        if self._suggester is None:
+            import suggest  # only needed here
+            with self._lock:
+                if self._suggester is None:
+                    self._suggester = suggest.Suggester(self)
+        return self._suggester.suggest(field, prefix, limit)
+
+    # --- Near-duplicates (see dedupe.py) ---
+    def find_duplicates(self, threshold: float | None = None) -> List[Dict[str, Any]]:
+        """Groups of likely duplicate entries: [{"ids": [...], "score": 0.81}]."""
+        import dedupe  # only needed here
+        with self._lock:
+            if self._dupes is None:
+                self._dupes = dedupe.DuplicateFinder(self)
+        # The scan works on a view: edits go on while it runs
+        return self._dupes.groups(dedupe.THRESHOLD if threshold is None else threshold)
+
+    def merge_entries(self, keep_id: str, other_ids: List[str]) -> bool:
+        """Fold the other entries into `keep_id` and delete them."""
+        import dedupe  # only needed here
+        with self.batch():
+            keep = self._by_id.get(keep_id)
+            others = [self._by_id[i] for i in other_ids if i in self._by_id and i != keep_id]
+            if keep is None or not others:
+                return False
+            self.history.record(keep)
+            dedupe.merge_into(keep, others)
+            self._stamp(keep)
+            self._commit(keep_id)
+            for o in others:
+                self.delete_entry(o.id)
+            return True
+
+    # --- Revision history (see history.py) ---
+    @property
+    def history(self):
+        if self._history is None:
+            import history  # imports this module
+            self._history = history.History(os.path.splitext(self.data_path)[0] + ".history",
+                                            lambda: self.blobs.data_key())
+        return self._history
+
+    def entry_history(self, entry_id: str) -> List[Dict[str, Any]]:
+        """Past versions of an entry, oldest first: {"rev", "at", "entry"}."""
+        return self.history.versions(entry_id)
+
+    # --- Attachments (see attachments.py) ---
+    @property
+    def blobs(self):
+        if self._blobs is None:
+            import attachments  # imports this module
+            self._blobs = attachments.BlobStore(os.path.splitext(self.data_path)[0] + ".blobs", self._key)
+        return self._blobs
+
+    def attachment_ids(self) -> Set[str]:
+        with self._lock:
+            return {a["id"] for e in self.all_entries() for a in (e.attachments or ())}
+
+    def _find_attachment(self, entry_id: str, attachment_id: str) -> Dict[str, Any]:
+        e = self._by_id.get(entry_id)
+        for a in (e.attachments or ()) if e else ():
+            if a["id"] == attachment_id:
+                return a
+        raise KeyError(f"entry {entry_id} has no attachment {attachment_id}")
+
+    def attach_file(self, entry_id: str, path: str, name: str | None = None) -> Dict[str, Any] | None:
+        """Copy the file at `path` into the attachment store and link it to
+        the entry. Returns the new reference, or None if the entry is gone."""
+        if entry_id not in self._by_id:
+            return None
+        with open(path, "rb") as f:
+            ref = self.blobs.put(f, name or os.path.basename(path))  # streamed, outside the lock
+        with self._lock:
+            e = self._by_id.get(entry_id)
+            if e is None:
+                return None
+            self.history.record(e)
+            e.attachments = (e.attachments or []) + [ref]
+            e.updated_at = int(time.time())
+            self._stamp(e)
+            self._commit(entry_id)
+        return ref
+
+    def detach_file(self, entry_id: str, attachment_id: str) -> bool:
+        """Unlink an attachment; its data goes at the next gc_attachments()."""
+        with self._lock:
+            e = self._by_id.get(entry_id)
+            if e is None or not any(a["id"] == attachment_id for a in e.attachments or ()):
+                return False
+            self.history.record(e)
+            e.attachments = [a for a in e.attachments if a["id"] != attachment_id] or None
+            e.updated_at = int(time.time())
+            self._stamp(e)
+            self._commit(entry_id)
+            return True
+
+    def export_attachment(self, entry_id: str, attachment_id: str, dest: str) -> str:
+        """Write an attachment's contents to `dest`."""
+        with self._lock:
+            self._find_attachment(entry_id, attachment_id)
+        return self.blobs.save_to(attachment_id, dest)
+
+    def live_attachment_ids(self) -> Set[str]:
+        """Attachments an entry or a snapshot still refers to."""
+        live = self.attachment_ids()
+        if os.path.isdir(self.snapshots.root):
+            live |= self.snapshots.attachment_ids()
+        return live
+
+    def gc_attachments(self) -> Dict[str, int]:
+        """Delete stored data no entry or snapshot refers to any more."""
+        return self.blobs.gc(self.live_attachment_ids())
+
+    # --- Snapshot backups (see backup.py) ---
+    @property
+    def snapshots(self):
+        if self._snapshots is None:
+            import backup  # imports this module
+            self._snapshots = backup.SnapshotStore(backup.snapshot_dir(self.data_path))
+        return self._snapshots
+
+    def take_snapshot(self, label: str = "", skip_unchanged: bool = False) -> Dict[str, Any] | None:
+        """Back up the vault as it is now (in its on-disk form, so sealed
+        entries stay sealed). Only chunks no earlier snapshot has are written."""
+        import backup, copy  # only needed here
+        with self._lock, self.body_scan():
+            view = self.view()
+            meta = copy.deepcopy({k: v for k, v in self.data.items() if k != "entries"})
+            # Sealing needs the key and the seal cache; cached seals make it cheap
+            disk = self._disk_entries(view.entries()) if self._key is not None else None
+        if disk is None:
+            with self.body_scan():
+                disk = [e.to_dict() for e in view]  # the view's copies: no lock needed
+        lines = list(backup.encode(meta, disk))
+        attachment_ids = {a["id"] for e in view for a in (e.attachments or ())}
+        return self.snapshots.take(lines, label, len(view), attachment_ids, skip_unchanged)
+
+    def snapshot_if_due(self) -> Dict[str, Any] | None:
+        """Take a snapshot and prune old ones when the newest is older than
+        backup.interval_minutes (0 = never) and the vault changed since."""
+        cfg = self.config.get("backup", {})
+        interval = cfg.get("interval_minutes", 0) * 60
+        now = time.time()
+        if not interval or now < self._next_snapshot:
+            return None
+        newest = self.snapshots.list()[:1]
+        if newest and now - newest[0]["created_at"] < interval:
+            self._next_snapshot = newest[0]["created_at"] + interval
+            return None
+        man = self.take_snapshot("auto", skip_unchanged=True)
+        self.snapshots.prune(cfg.get("keep_last", 10), cfg.get("keep_daily", 7))
+        self._next_snapshot = now + interval
+        return man
+
+    def prune_snapshots(self, keep_last: int | None = None, keep_daily: int | None = None) -> Dict[str, int]:
+        cfg = self.config.get("backup", {})
+        return self.snapshots.prune(cfg.get("keep_last", 10) if keep_last is None else keep_last,
+                                    cfg.get("keep_daily", 7) if keep_daily is None else keep_daily)
+
+    def restore_snapshot(self, ref: str) -> Dict[str, int]:
+        """Put the vault back the way snapshot `ref` has it. Entries are
+        changed one by one like any edit (history, sync versions and other
+        writers all see a normal change), so a restore can itself be undone
+        from history or from the snapshot taken just before it."""
+        import backup  # only needed here
+        vault = self.snapshots.load(ref)
+        if vault.get("crypto") != self.data.get("crypto"):
+            raise backup.BackupError("the snapshot was taken under another master password; "
+                                     "restore it to a file with --to and open that instead")
+        def content(e: Entry) -> Dict[str, Any]:
+            # What a restore puts back: not sync versions, revs or usage stats
+            d = e.to_dict()
+            for k in ("vv", "rev", "access_count", "last_access_at"):
+                d.pop(k, None)
+            return d
+
+        counts = {"restored": 0, "added": 0, "removed": 0}
+        with self._lock, self.batch(), self.body_scan():
+            keep = set()
+            for d in vault["entries"]:
+                old_entry = self._entry_type.from_dict(crypto.unseal(self._key, d) if crypto.is_sealed(d) else d)
+                keep.add(old_entry.id)
+                e = self._by_id.get(old_entry.id)
+                if e is not None and content(e) == content(old_entry):
+                    continue
+                if e is not None:
+                    self.history.record(e)
+                    old_entry.vv, old_entry.rev = e.vv, e.rev
+                    old_entry.access_count, old_entry.last_access_at = e.access_count, e.last_access_at
+                    e.assign(old_entry)
+                    counts["restored"] += 1
+                else:
+                    tomb = self.tombstones().pop(old_entry.id, None)
+                    if tomb is not None:
+                        self._meta_dirty = True
+                    old_entry.vv = dict(tomb["vv"]) if tomb else old_entry.vv
+                    old_entry.rev = 0
+                    e = old_entry
+                    self.data.setdefault("entries", []).append(e)
+                    self._by_id[e.id] = e
+                    if self._shard_members:
+                        self._shard_members[shards.shard_of(e.id, self.shard_count)].add(e.id)
+                    counts["added"] += 1
+                # A new version as far as sync is concerned, so it wins over what it replaces
+                self._stamp(e)
+                self._commit(e.id)
+            for entry_id in [i for i in self._by_id if i not in keep]:
+                self.delete_entry(entry_id)
+                counts["removed"] += 1
+        return counts
@@ -0,0 +1,160 @@
+# src/suggest.py
+# Autocomplete for the add/edit dialog: the values already used for protocol,
+# website and username, and the custom field names, ranked by how often and
+# how recently they were used.
+#
+# Each field keeps its distinct values in a sorted list of match keys
+# (lowercased; websites without scheme or "www."), so the values starting with
+# what was typed are one bisect away. Prefixes of up to SHORT characters,
+# including the empty one, match too many values to rank on every keystroke;
+# for those a ready top-TOP_K list is kept and adjusted as values are used.
+# Everything is kept current from Storage change notifications.
+import heapq, math
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Tuple
+
+from model import Entry
+
+FIELDS = ("protocol", "website", "username", "custom")  # "custom" = custom field names
+TOP_K = 8
+SHORT = 2
+# A value last used HALF_LIFE later than another ranks as if it had been used
+# twice as often
+HALF_LIFE = 30 * 86400
+
+def match_key(field: str, text: str) -> str:
+    key = text.strip().lower()
+    if field == "website":
+        key = key.split("://", 1)[-1]
+        if key.startswith("www."):
+            key = key[4:]
+    return key
+
+def _used_at(e: Entry) -> int:
+    return max(e.updated_at or 0, e.last_access_at or 0, e.created_at or 0)
+
+def _values(e: Entry) -> List[Tuple[str, str]]:
+    out = [(f, getattr(e, f).strip()) for f in ("protocol", "website", "username") if getattr(e, f).strip()]
+    out.extend(("custom", k) for k in e.custom if k.strip())
+    return out
+
+class _Field:
+    __slots__ = ("keys", "stats", "tops")
+
+    def __init__(self):
+        self.keys: List[str] = []  # sorted match keys
+        self.stats: Dict[str, List] = {}  # key -> [shown text, uses, last used]
+        self.tops: Dict[str, List[str]] = {}  # short prefix -> best keys, best first
+
+    def score(self, key: str) -> float:
+        _text, uses, last = self.stats[key]
+        return math.log2(1 + uses) + last / HALF_LIFE
+
+    def best(self, prefix: str, limit: int) -> List[str]:
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + "\U0010ffff")
+        return heapq.nlargest(limit, self.keys[lo:hi], key=self.score)
+
+    def used(self, key: str, text: str, at: int, building: bool = False):
+        st = self.stats.get(key)
+        if st is None:
+            self.stats[key] = [text, 1, at]
+            if not building:  # _build sorts once at the end
+                insort(self.keys, key)
+        else:
+            st[1] += 1
+            st[2] = max(st[2], at)
+        if not building:
+            self._raised(key)
+
+    def touched(self, key: str, at: int):
+        st = self.stats[key]
+        if at > st[2]:
+            st[2] = at
+            self._raised(key)
+
+    def _raised(self, key: str):
+        # The key's score only went up: it can only climb in the lists
+        for n in range(min(len(key), SHORT) + 1):
+            top = self.tops.get(key[:n])
+            if top is None:
+                continue
+            if key not in top:
+                top.append(key)
+            top.sort(key=self.score, reverse=True)
+            del top[TOP_K:]
+
+    def unused(self, key: str):
+        st = self.stats[key]
+        st[1] -= 1
+        if not st[1]:
+            del self.stats[key]
+            del self.keys[bisect_left(self.keys, key)]
+        # Lower score: rebuilt on the next lookup instead of here, which runs
+        # under the storage lock
+        for n in range(min(len(key), SHORT) + 1):
+            self.tops.pop(key[:n], None)
+
+class Suggester:
+    def __init__(self, store):
+        self.store = store
+        self._fields: Dict[str, _Field] = {f: _Field() for f in FIELDS}
+        self._seen: Dict[str, Tuple[List[Tuple[str, str]], int]] = {}  # id -> (values indexed, used at)
+        self._built = False
+        store.subscribe(self._changed)
+
+    def close(self):
+        self.store.unsubscribe(self._changed)
+
+    def _build(self):
+        for e in self.store.all_entries():
+            self._add(e, building=True)
+        for f in self._fields.values():
+            f.keys = sorted(f.stats)
+        self._built = True
+
+    def _add(self, e: Entry, building: bool = False):
+        values, at = _values(e), _used_at(e)
+        self._seen[e.id] = (values, at)
+        for field, text in values:
+            self._fields[field].used(match_key(field, text), text, at, building)
+
+    def _remove(self, entry_id: str):
+        values, _at = self._seen.pop(entry_id, ([], 0))
+        for field, text in values:
+            self._fields[field].unused(match_key(field, text))
+
+    def _changed(self, entry_ids: Iterable[str]):
+        # Runs with the storage lock held
+        if not self._built:
+            return
+        for entry_id in entry_ids:
+            e = self.store.get_entry(entry_id)
+            seen = self._seen.get(entry_id)
+            if e is not None and seen is not None and seen[0] == _values(e):
+                at = _used_at(e)  # e.g. record_access: same values, newer use
+                self._seen[entry_id] = (seen[0], at)
+                for field, text in seen[0]:
+                    self._fields[field].touched(match_key(field, text), at)
+                continue
+            self._remove(entry_id)
+            if e is not None:
+                self._add(e)
+
+    def suggest(self, field: str, prefix: str = "", limit: int = TOP_K) -> List[str]:
+        """Up to `limit` values for `field` starting with `prefix`, best first."""
+        if field not in self._fields:
+            raise ValueError(f"no suggestions for field {field!r}")
+        with self.store._lock:
+            if not self._built:
+                self._build()
+            f = self._fields[field]
+            key = match_key(field, prefix)
+            if len(key) <= SHORT and limit <= TOP_K:
+                top = f.tops.get(key)
+                if top is None:
+                    top = f.tops[key] = f.best(key, TOP_K)
+                keys = top[:limit]
+            else:
+                keys = f.best(key, limit)
+            return [f.stats[k][0] for k in keys]
@@ -0,0 +1,394 @@
+# src/sync.py
+# Offline sync between vaults on different devices through a directory on
+# removable media (a USB stick).
+#
+# Every entry carries a version vector, "vv": {device_id: counter}, bumped by
+# Storage whenever this device edits or deletes it; deletions leave a
+# tombstone with the same kind of vector. Entries and tombstones are hashed
+# into a fixed-depth Merkle tree (4096 leaves keyed by a hash of the id), and
+# a bundle holds the sender's leaf hashes plus only the items in leaves that
+# differ from what each known peer last reported. The receiver merges per
+# entry: a strictly newer vector wins, concurrent edits are resolved the same
+# way on both sides (newest updated_at) and the losing copy is kept in
+# <vault>.sync/conflicts.jsonl.
+#
+#   <usb>/pixievault-sync/<device>.pvsync    one bundle per device, gzip JSON
+#   data/vault.sync/peers.json               leaf hashes last seen from each peer
+import gzip, hashlib, json, os, time
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+import crypto
+from model import Entry
+from storage import Storage, atomic_write
+from views import VaultView
+
+FORMAT = "pixievault-sync"
+BUNDLE_DIR = "pixievault-sync"
+BUNDLE_EXT = ".pvsync"
+LEAF_DIGITS = 3  # 16**3 leaves; a bundle carries at most 4096 leaf hashes
+HEX = "0123456789abcdef"
+# Usage stats change on every reveal; they are merged (max) but not versioned.
+# rev only counts writes to this device's vault file.
+UNVERSIONED = ("access_count", "last_access_at", "rev")
+
+class SyncError(Exception):
+    pass
+
+def state_dir(store: Storage) -> str:
+    return os.path.splitext(store.data_path)[0] + ".sync"
+
+def bundle_path(directory: str, device: str) -> str:
+    return os.path.join(directory, BUNDLE_DIR, device + BUNDLE_EXT)
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _canonical(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+def leaf_of(entry_id: str) -> str:
+    return hashlib.sha1(entry_id.encode("utf-8")).hexdigest()[:LEAF_DIGITS]
+
+def entry_hash(e: Entry | Dict[str, Any]) -> str:
+    if isinstance(e, Entry):
+        e = e.to_dict()
+    return _digest(_canonical({k: v for k, v in e.items() if k not in UNVERSIONED}))
+
+def tombstone_hash(tomb: Dict[str, Any]) -> str:
+    return _digest("tombstone:" + _canonical(tomb.get("vv") or {}))
+
+# --- Version vectors ---
+def compare(a: Dict[str, int], b: Dict[str, int]) -> str:
+    """"equal", "older" (a < b), "newer" (a > b) or "concurrent"."""
+    less = any(a.get(d, 0) < n for d, n in b.items())
+    more = any(n > b.get(d, 0) for d, n in a.items())
+    if less and more:
+        return "concurrent"
+    return "older" if less else "newer" if more else "equal"
+
+def merge_vv(a: Dict[str, int], b: Dict[str, int]) -> Dict[str, int]:
+    out = dict(a)
+    for d, n in b.items():
+        out[d] = max(out.get(d, 0), n)
+    return out
+
+# --- Merkle tree ---
+def internal_nodes(leaves: Dict[str, str]) -> Dict[str, str]:
+    """Hashes of every node (prefix -> hash), root under "", from the leaf level up."""
+    nodes = dict(leaves)
+    level = leaves
+    for depth in range(LEAF_DIGITS - 1, -1, -1):
+        children: Dict[str, List[str]] = {}
+        for prefix in sorted(level):
+            children.setdefault(prefix[:depth], []).append(f"{prefix[-1]}{level[prefix]}")
+        level = {p: _digest("".join(c)) for p, c in children.items()}
+        nodes.update(level)
+    return nodes
+
+def diff(mine: Dict[str, str], theirs: Dict[str, str]) -> List[str]:
+    """Leaf prefixes whose contents differ, descending only into subtrees
+    whose hashes differ."""
+    out: List[str] = []
+    stack = [""]
+    while stack:
+        prefix = stack.pop()
+        if mine.get(prefix) == theirs.get(prefix):
+            continue
+        if len(prefix) == LEAF_DIGITS:
+            out.append(prefix)
+        else:
+            stack.extend(prefix + c for c in HEX if prefix + c in mine or prefix + c in theirs)
+    return out
+
+class MerkleTree:
+    """Leaf hashes over a store's entries and tombstones. Built once, then
+    kept current from Storage change notifications: only leaves holding a
+    changed id are re-hashed."""
+
+    def __init__(self, store: Storage):
+        self.store = store
+        self._members: Dict[str, Set[str]] = {}  # leaf -> ids
+        self._leaves: Dict[str, str] = {}
+        self._dirty: Set[str] | None = None  # None = build from scratch
+        store.subscribe(self._changed)
+
+    def close(self):
+        self.store.unsubscribe(self._changed)
+
+    def _changed(self, entry_ids: Iterable[str]):
+        if self._dirty is None:
+            return
+        for entry_id in entry_ids:
+            leaf = leaf_of(entry_id)
+            self._members.setdefault(leaf, set()).add(entry_id)
+            self._dirty.add(leaf)
+
+    def _hash_leaf(self, leaf: str):
+        tombs = self.store.tombstones()
+        rows = []
+        for entry_id in sorted(self._members.get(leaf, ())):
+            e = self.store.get_entry(entry_id)
+            if e is not None:
+                rows.append(entry_id + ":" + entry_hash(e))
+            elif entry_id in tombs:
+                rows.append(entry_id + ":" + tombstone_hash(tombs[entry_id]))
+        if rows:
+            self._leaves[leaf] = _digest("\n".join(rows))
+        else:
+            self._leaves.pop(leaf, None)
+            self._members.pop(leaf, None)
+
+    def leaves(self) -> Dict[str, str]:
+        return self.state()[0]
+
+    def state(self) -> Tuple[Dict[str, str], VaultView, Dict[str, Dict[str, Any]]]:
+        """(leaf hashes, Storage view, tombstones), all as of the same moment."""
+        with self.store._lock:
+            if self._dirty is None:
+                self._members = {}
+                for entry_id in [e["id"] for e in self.store.all_entries()] + list(self.store.tombstones()):
+                    self._members.setdefault(leaf_of(entry_id), set()).add(entry_id)
+                self._dirty = set(self._members)
+            for leaf in self._dirty:
+                self._hash_leaf(leaf)
+            self._dirty = set()
+            return dict(self._leaves), self.store.view(), dict(self.store.tombstones())
+
+    def items(self, leaves: Iterable[str], view: VaultView | None = None,
+              all_tombs: Dict[str, Dict[str, Any]] | None = None) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """(entries, tombstones) stored under the given leaves, read from
+        `view` and `all_tombs` (see state()) or from the store as it is now."""
+        if view is None:
+            view, all_tombs = self.store.view(), dict(self.store.tombstones())
+        with self.store._lock:
+            ids = [i for leaf in leaves for i in sorted(self._members.get(leaf, ()))]
+        entries: List[Dict[str, Any]] = []
+        tombs: Dict[str, Dict[str, Any]] = {}
+        for entry_id in ids:  # entries from the view: no lock while encoding them
+            e = view.get(entry_id)
+            if e is not None:
+                entries.append(e.to_dict())
+            elif entry_id in all_tombs:
+                tombs[entry_id] = all_tombs[entry_id]
+        return entries, tombs
+
+# --- Peer state ---
+def _load_peers(store: Storage) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(state_dir(store), "peers.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_peers(store: Storage, peers: Dict[str, Any]):
+    atomic_write(os.path.join(state_dir(store), "peers.json"), json.dumps(peers, separators=(",", ":")))
+
+def _record_conflicts(store: Storage, rows: List[Dict[str, Any]]):
+    if not rows:
+        return
+    if store.encrypted:
+        # The losing copy holds a password too; keep it sealed like the vault
+        rows = [dict(r, discarded=crypto.seal(store._key, r["discarded"]))
+                if r["discarded_kind"] == "entry" else r for r in rows]
+    os.makedirs(state_dir(store), exist_ok=True)
+    with open(os.path.join(state_dir(store), "conflicts.jsonl"), "a", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+def _count_conflicts(store: Storage) -> int:
+    try:
+        with open(os.path.join(state_dir(store), "conflicts.jsonl"), "rb") as f:
+            return sum(1 for _ in f)
+    except OSError:
+        return 0
+
+def conflicts(store: Storage) -> List[Dict[str, Any]]:
+    """Every conflict recorded so far, losing copies unsealed."""
+    path = os.path.join(state_dir(store), "conflicts.jsonl")
+    if not os.path.exists(path):
+        return []
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            r = json.loads(line)
+            if crypto.is_sealed(r["discarded"]) and store.encrypted:
+                r["discarded"] = crypto.unseal(store._key, r["discarded"])
+            out.append(r)
+    return out
+
+# --- Bundles ---
+def _write_bundle(path: str, body: Dict[str, Any], passphrase: str | None):
+    raw = gzip.compress(_canonical(body).encode("utf-8"))
+    if passphrase:
+        header, key = crypto.new_header(passphrase)
+        outer = {"format": FORMAT, "device": body["device"], "created_at": body["created_at"],
+                 "crypto": header, "payload": crypto.encrypt_blob(key, raw).decode("ascii")}
+        raw = gzip.compress(_canonical(outer).encode("utf-8"))
+    tmp = path + ".tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # a stick pulled mid-write leaves the previous bundle
+
+def read_bundle(path: str, passphrase: str | None = None) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        body = json.loads(gzip.decompress(f.read()))
+    if body.get("format") != FORMAT:
+        raise SyncError(f"{path} is not a Pixie Vault sync bundle")
+    if "crypto" in body:
+        if not passphrase:
+            raise crypto.VaultLocked(f"{os.path.basename(path)} is encrypted; a sync passphrase is required")
+        key = crypto.unlock(body["crypto"], passphrase)
+        body = json.loads(gzip.decompress(crypto.decrypt_blob(key, body["payload"].encode("ascii"))))
+    return body
+
+def export_bundle(store: Storage, directory: str, passphrase: str | None = None,
+                  full: bool = False, tree: MerkleTree | None = None) -> Dict[str, Any]:
+    """Write this device's bundle into `directory`. Returns a summary."""
+    if store.encrypted and not passphrase:
+        raise SyncError("the vault is encrypted; give a sync passphrase so the bundle is too")
+    own_tree = tree is None
+    tree = tree or MerkleTree(store)
+    try:
+        with store.body_scan():
+            leaves, view, all_tombs = tree.state()  # bundle hashes and contents agree
+        peers = _load_peers(store)
+        if full or not peers:
+            wanted = list(leaves)  # nobody has told us what they hold yet
+        else:
+            mine = internal_nodes(leaves)
+            wanted_set: Set[str] = set()
+            for peer in peers.values():
+                wanted_set.update(diff(mine, internal_nodes(peer["leaves"])))
+            wanted = sorted(wanted_set)
+        with store.body_scan():
+            entries, tombs = tree.items(wanted, view, all_tombs)
+    finally:
+        if own_tree:
+            tree.close()
+    body = {
+        "format": FORMAT,
+        "version": 1,
+        "device": store.device_id,
+        "created_at": time.time(),
+        "leaves": leaves,
+        "entries": entries,
+        "tombstones": tombs,
+    }
+    path = bundle_path(directory, store.device_id)
+    _write_bundle(path, body, passphrase)
+    return {"bundle": path, "leaves_sent": len(wanted), "leaves_total": len(leaves),
+            "entries": len(entries), "tombstones": len(tombs)}
+
+def _winner(local: Tuple[str, Dict[str, Any]], remote: Tuple[str, Dict[str, Any]]) -> str:
+    """Pick between two concurrent versions. Deterministic so both devices
+    agree: a surviving entry beats a deletion, then newest edit, then hash."""
+    def rank(item: Tuple[str, Dict[str, Any]]):
+        kind, obj = item
+        if kind == "tombstone":
+            return (0, obj.get("deleted_at") or 0, tombstone_hash(obj))
+        return (1, obj.get("updated_at") or 0, entry_hash(obj))
+    return "remote" if rank(remote) > rank(local) else "local"
+
+def merge_bundle(store: Storage, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply one peer's bundle to the store. Returns counts."""
+    peer = body["device"]
+    stats = {"device": peer, "received": 0, "applied": 0, "deleted": 0, "conflicts": 0}
+    found: List[Dict[str, Any]] = []
+    now = int(time.time())
+    remote: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    for e in body.get("entries", []):
+        remote[e["id"]] = ("entry", e)
+    for entry_id, tomb in (body.get("tombstones") or {}).items():
+        remote.setdefault(entry_id, ("tombstone", tomb))
+
+    def apply(kind: str, obj: Dict[str, Any], entry_id: str, local_entry: Dict[str, Any] | None):
+        if kind == "tombstone":
+            store._put_tombstone(entry_id, obj)
+            stats["deleted"] += 1
+            return
+        obj = dict(obj)
+        if local_entry is not None:
+            for k in UNVERSIONED:
+                if (local_entry.get(k) or 0) > (obj.get(k) or 0):
+                    obj[k] = local_entry[k]
+        store._put_synced(obj)
+        stats["applied"] += 1
+
+    with store.batch():
+        tombs = store.tombstones()
+        for entry_id, (kind, obj) in remote.items():
+            stats["received"] += 1
+            local_entry = store.get_entry(entry_id)
+            if local_entry is not None:
+                local = ("entry", local_entry)
+            elif entry_id in tombs:
+                local = ("tombstone", tombs[entry_id])
+            else:
+                apply(kind, obj, entry_id, None)
+                continue
+            order = compare(local[1].get("vv") or {}, obj.get("vv") or {})
+            if order == "older":
+                apply(kind, obj, entry_id, local_entry)
+                continue
+            if order == "newer":
+                continue
+            if order == "equal":
+                if local[0] == kind and (kind == "tombstone" or entry_hash(local[1]) == entry_hash(obj)):
+                    if kind == "entry" and any((obj.get(k) or 0) > (local_entry.get(k) or 0) for k in UNVERSIONED):
+                        apply(kind, obj, entry_id, local_entry)  # usage stats only
+                    continue
+            # Concurrent edits (or unversioned edits from before sync existed)
+            winner = _winner(local, (kind, obj))
+            kept, lost = ((kind, obj), local) if winner == "remote" else (local, (kind, obj))
+            merged = dict(kept[1], vv=merge_vv(local[1].get("vv") or {}, obj.get("vv") or {}))
+            apply(kept[0], merged, entry_id, local_entry)
+            found.append({"id": entry_id, "at": now, "peer": peer, "kept": winner,
+                          "discarded_kind": lost[0], "discarded": dict(lost[1])})
+            stats["conflicts"] += 1
+    _record_conflicts(store, found)
+    return stats
+
+def import_bundles(store: Storage, directory: str, passphrase: str | None = None) -> List[Dict[str, Any]]:
+    """Merge every other device's bundle found in `directory`. Bundles already
+    imported are skipped."""
+    folder = os.path.join(directory, BUNDLE_DIR)
+    if not os.path.isdir(folder):
+        raise SyncError(f"no {BUNDLE_DIR}/ folder in {directory}")
+    peers = _load_peers(store)
+    results = []
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith(BUNDLE_EXT) or name[:-len(BUNDLE_EXT)] == store.device_id:
+            continue
+        body = read_bundle(os.path.join(folder, name), passphrase)
+        peer = body["device"]
+        seen = peers.get(peer, {})
+        if seen.get("created_at", 0) >= body["created_at"]:
+            results.append({"device": peer, "skipped": "already imported"})
+            continue
+        results.append(merge_bundle(store, body))
+        peers[peer] = {"leaves": body["leaves"], "created_at": body["created_at"], "imported_at": time.time()}
+        _save_peers(store, peers)
+    store.flush()
+    return results
+
+def status(store: Storage) -> Dict[str, Any]:
+    tree = MerkleTree(store)
+    try:
+        leaves = tree.leaves()
+    finally:
+        tree.close()
+    root = internal_nodes(leaves).get("", "")
+    peers = _load_peers(store)
+    return {
+        "device": store.device_id,
+        "root": root,
+        "entries": len(store.all_entries()),
+        "tombstones": len(store.tombstones()),
+        "peers": {d: {"imported_at": p.get("imported_at"),
+                      "differing_leaves": len(diff(internal_nodes(leaves), internal_nodes(p["leaves"])))}
+                  for d, p in peers.items()},
+        "conflicts": _count_conflicts(store),
+    }
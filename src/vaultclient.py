@@ -0,0 +1,227 @@
+# src/vaultclient.py
+# Thin client for the resident vault daemon (vaultd.py), plus the framing both
+# sides use: every message is a 4-byte big-endian length followed by a UTF-8
+# JSON body.
+#
+#   request:  {"op": "query", "args": {"term": "git", "sort_mode": "Most Used"}}
+#   response: {"ok": true, "result": [...]}   or   {"ok": false, "error": "..."}
+#
+# VaultClient mirrors the Storage API the app and CLI use, so either can be
+# handed a client instead of a Storage.
+import json, os, socket, struct, tempfile, threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Tuple
+
+from model import Entry, to_json
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "config.json")
+MAX_FRAME = 64 * 1024 * 1024
+_HEADER = struct.Struct(">I")
+# Ops that can run well past the call timeout on a Pi: wait as long as they take
+SLOW_OPS = frozenset({"all", "query", "flush", "commit", "refresh", "find_duplicates", "merge_entries",
+                      "attach_file", "export_attachment", "gc_attachments", "take_snapshot",
+                      "restore_snapshot", "prune_snapshots", "sync_export", "sync_import", "sync_status"})
+
+def default_socket_path() -> str:
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"pixievault-{uid}.sock")
+
+class DaemonError(Exception):
+    """The daemon answered with an error."""
+
+def encode_frame(obj: Any) -> bytes:
+    body = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=to_json).encode("utf-8")
+    return _HEADER.pack(len(body)) + body
+
+def send_frame(sock: socket.socket, obj: Any):
+    sock.sendall(encode_frame(obj))
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise EOFError("connection closed")
+        buf += chunk
+    return bytes(buf)
+
+def recv_frame(sock: socket.socket) -> Any:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_FRAME:
+        raise ValueError(f"frame too large ({size} bytes)")
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+class VaultClient:
+    def __init__(self, path: str | None = None, timeout: float = 5.0):
+        """`timeout` applies to quick ops; SLOW_OPS wait for their reply."""
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+        self._sock: socket.socket | None = self._connect()
+        self._lock = threading.Lock()
+        self._batch_depth = 0
+        info = self.call("info")
+        self.config: Dict[str, Any] = info["config"]
+        self.data_path: str = info["data_path"]
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def call(self, op: str, **args) -> Any:
+        with self._lock:
+            if self._sock is None:
+                if self._batch_depth:
+                    raise DaemonError("lost the connection to the daemon inside a batch")
+                self._sock = self._connect()
+            self._sock.settimeout(None if op in SLOW_OPS else self.timeout)
+            try:
+                send_frame(self._sock, {"op": op, "args": args})
+                reply = recv_frame(self._sock)
+            except BaseException:
+                # The reply may still arrive; it must not be read as the
+                # answer to the next call. Start over on a new connection.
+                self._sock.close()
+                self._sock = None
+                raise
+        if not reply.get("ok"):
+            raise DaemonError(reply.get("error", "unknown error"))
+        return reply.get("result")
+
+    # --- Storage-compatible API ---
+    def all_entries(self) -> List[Entry]:
+        return [Entry.from_dict(d) for d in self.call("all")]
+
+    def get_entry(self, entry_id: str) -> Entry | None:
+        d = self.call("get", entry_id=entry_id)
+        return Entry.from_dict(d) if d is not None else None
+
+    def field_labels(self) -> List[str]:
+        return self.call("field_labels")
+
+    def query(self, term: str = "", field: str | None = None, sort_mode: str = "A→Z",
+              limit: int | None = None, facets: Dict[str, str] | None = None) -> List[Entry]:
+        return [Entry.from_dict(d) for d in
+                self.call("query", term=term, field=field, sort_mode=sort_mode, limit=limit, facets=facets)]
+
+    def facet_counts(self, ids: Iterable[str] | None = None, top: int | None = None) -> Dict[str, List[Tuple[str, int]]]:
+        counts = self.call("facet_counts", ids=None if ids is None else list(ids), top=top)
+        return {k: [(v, n) for v, n in pairs] for k, pairs in counts.items()}
+
+    def site_entries(self, url: str, scope: str = "site") -> List[Entry]:
+        return [Entry.from_dict(d) for d in self.call("site_entries", url=url, scope=scope)]
+
+    def suggest(self, field: str, prefix: str = "", limit: int = 8) -> List[str]:
+        return self.call("suggest", field=field, prefix=prefix, limit=limit)
+
+    def find_duplicates(self, threshold: float | None = None) -> List[Dict[str, Any]]:
+        return self.call("find_duplicates", threshold=threshold)
+
+    def merge_entries(self, keep_id: str, other_ids: List[str]) -> bool:
+        return self.call("merge_entries", keep_id=keep_id, other_ids=list(other_ids))
+
+    def add_entry(self, base_fields: Dict[str, Any], custom_fields: Dict[str, Any]) -> str:
+        return self.call("add", base_fields=base_fields, custom_fields=custom_fields)
+
+    def update_entry(self, entry_id: str, base_fields: Dict[str, Any], custom_fields: Dict[str, Any],
+                     expected_rev: int | None = None) -> bool:
+        return self.call("update", entry_id=entry_id, base_fields=base_fields, custom_fields=custom_fields,
+                         expected_rev=expected_rev)
+
+    def delete_entry(self, entry_id: str, expected_rev: int | None = None) -> bool:
+        return self.call("delete", entry_id=entry_id, expected_rev=expected_rev)
+
+    def refresh(self, wait: bool = True) -> int:
+        return self.call("refresh", wait=wait)
+
+    def record_access(self, entry_id: str):
+        self.call("record_access", entry_id=entry_id)
+
+    def entry_history(self, entry_id: str) -> List[Dict[str, Any]]:
+        return self.call("entry_history", entry_id=entry_id)
+
+    # Paths are opened by the daemon, which runs as the same user
+    def attach_file(self, entry_id: str, path: str, name: str | None = None) -> Dict[str, Any] | None:
+        return self.call("attach_file", entry_id=entry_id, path=os.path.abspath(path), name=name)
+
+    def detach_file(self, entry_id: str, attachment_id: str) -> bool:
+        return self.call("detach_file", entry_id=entry_id, attachment_id=attachment_id)
+
+    def export_attachment(self, entry_id: str, attachment_id: str, dest: str) -> str:
+        return self.call("export_attachment", entry_id=entry_id, attachment_id=attachment_id,
+                         dest=os.path.abspath(dest))
+
+    def gc_attachments(self) -> Dict[str, int]:
+        return self.call("gc_attachments")
+
+    def take_snapshot(self, label: str = "", skip_unchanged: bool = False) -> Dict[str, Any] | None:
+        return self.call("take_snapshot", label=label, skip_unchanged=skip_unchanged)
+
+    def restore_snapshot(self, ref: str) -> Dict[str, int]:
+        return self.call("restore_snapshot", ref=ref)
+
+    def prune_snapshots(self, keep_last: int | None = None, keep_daily: int | None = None) -> Dict[str, int]:
+        return self.call("prune_snapshots", keep_last=keep_last, keep_daily=keep_daily)
+
+    def memory_stats(self) -> Dict[str, Any] | None:
+        return self.call("memory_stats")
+
+    @contextmanager
+    def batch(self):
+        """Server-side batch: the daemon collects adds, updates, deletes and
+        access counts and applies them in one commit when the block ends.
+        Reads inside the block don't see them yet; add_entry still returns
+        the new id."""
+        self.call("begin")
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            self.call("commit")
+
+    def flush(self, timeout: float | None = None) -> bool:
+        return self.call("flush", timeout=timeout)
+
+    def close(self):
+        # The daemon owns persistence; make sure our writes landed, then hang up
+        try:
+            self.flush()
+        except (OSError, EOFError, DaemonError):
+            pass
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+def load_config(path: str = CONFIG_PATH) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def daemon_socket(config: Dict[str, Any] | None = None) -> str | None:
+    """Socket path to use, or None if the daemon isn't configured."""
+    if os.environ.get("PIXIE_SOCKET"):
+        return os.environ["PIXIE_SOCKET"]
+    cfg = (config if config is not None else load_config()).get("daemon", {})
+    if not cfg.get("enabled"):
+        return None
+    return cfg.get("socket") or default_socket_path()
+
+def open_store(**storage_kwargs):
+    """Connect to the running daemon if one is configured and reachable,
+    otherwise open the vault in-process."""
+    path = daemon_socket()
+    if path and hasattr(socket, "AF_UNIX") and os.path.exists(path):
+        try:
+            return VaultClient(path)
+        except OSError:
+            pass
+    from storage import Storage
+    return Storage(**storage_kwargs)
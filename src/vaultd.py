@@ -0,0 +1,216 @@
+# src/vaultd.py
+# Resident vault daemon. Loads Storage once and serves it to local clients
+# (the app, the CLI, scripts) over a Unix domain socket, so nobody else has to
+# parse vault.json. Protocol and client live in vaultclient.py.
+#
+#   python3 src/vaultd.py [--socket PATH]
+import argparse, getpass, os, signal, socket, socketserver, sys, threading, uuid
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Tuple
+
+from storage import Storage
+import crypto, sync
+from vaultclient import encode_frame, send_frame, recv_frame, default_socket_path
+
+def _ops(store: Storage) -> Dict[str, Callable[..., Any]]:
+    tree = sync.MerkleTree(store)  # kept current between exports
+    return {
+        "ping": lambda: "pong",
+        "info": lambda: {"config": store.config, "data_path": os.path.abspath(store.data_path),
+                         "entries": len(store.all_entries()), "pid": os.getpid()},
+        "all": store.all_entries,
+        "get": store.get_entry,
+        "field_labels": store.field_labels,
+        "query": store.query,
+        "facet_counts": store.facet_counts,
+        "add": store.add_entry,
+        "update": store.update_entry,
+        "delete": store.delete_entry,
+        "record_access": store.record_access,
+        "site_entries": store.site_entries,
+        "suggest": store.suggest,
+        "find_duplicates": store.find_duplicates,
+        "merge_entries": store.merge_entries,
+        "flush": store.flush,
+        "refresh": store.refresh,
+        "entry_history": store.entry_history,
+        "attach_file": store.attach_file,
+        "detach_file": store.detach_file,
+        "export_attachment": store.export_attachment,
+        "gc_attachments": store.gc_attachments,
+        "take_snapshot": store.take_snapshot,
+        "restore_snapshot": store.restore_snapshot,
+        "prune_snapshots": store.prune_snapshots,
+        "sync_export": lambda directory, passphrase=None, full=False:
+            sync.export_bundle(store, directory, passphrase, full, tree),
+        "sync_import": lambda directory, passphrase=None: sync.import_bundles(store, directory, passphrase),
+        "sync_status": lambda: sync.status(store),
+        "sync_conflicts": lambda: sync.conflicts(store),
+        "memory_stats": store.memory_stats,
+    }
+
+# Mutations a client's batch collects; they are applied together at "commit"
+BATCHED_OPS = frozenset({"add", "update", "delete", "record_access"})
+
+class BatchError(Exception):
+    pass
+
+def _apply_batch(store: Storage, ops: Dict[str, Callable[..., Any]], pending: List[Tuple[str, Dict[str, Any]]]):
+    errors = []
+    with store.batch():
+        for op, args in pending:
+            try:
+                ops[op](**args)
+            except Exception as e:
+                errors.append(f"{op}: {type(e).__name__}: {e}")
+    if errors:
+        raise BatchError(f"{len(errors)} of {len(pending)} batched ops failed: " + "; ".join(errors[:3]))
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        store: Storage = self.server.store
+        ops = self.server.ops
+        # An open batch is only a list of ops until "commit": holding
+        # store.batch() (and with it the storage lock) across client round
+        # trips would let a slow or dead client stall everyone else
+        depth = 0
+        pending: List[Tuple[str, Dict[str, Any]]] = []
+        try:
+            while True:
+                try:
+                    req = recv_frame(self.request)
+                except (EOFError, ConnectionError, OSError):
+                    return  # a batch left open is applied below
+                except ValueError as e:
+                    send_frame(self.request, {"ok": False, "error": str(e)})
+                    return
+                op = req.get("op")
+                args = req.get("args") or {}
+                try:
+                    result = None
+                    if op == "begin":
+                        depth += 1
+                    elif op == "commit":
+                        depth = max(0, depth - 1)
+                        if not depth and pending:
+                            batch, pending = pending, []
+                            _apply_batch(store, ops, batch)
+                    elif depth and op in BATCHED_OPS:
+                        if op == "add":
+                            args["entry_id"] = result = args.get("entry_id") or str(uuid.uuid4())
+                        pending.append((op, args))
+                    elif op in ops:
+                        result = ops[op](**args)
+                    else:
+                        raise KeyError(f"unknown op {op!r}")
+                    reply = {"ok": True, "result": result}
+                except Exception as e:
+                    reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                # Results can be live entries; encode before anyone mutates them.
+                # A list of them reads every body once: keep it out of the cache
+                with store._lock, (store.body_scan() if isinstance(result, list) else nullcontext()):
+                    frame = encode_frame(reply)
+                try:
+                    self.request.sendall(frame)
+                except OSError:
+                    return  # the client gave up waiting (see VaultClient.call)
+        finally:
+            if pending:
+                try:
+                    _apply_batch(store, ops, pending)
+                except BatchError as e:
+                    print(f"vaultd: {e}", file=sys.stderr, flush=True)
+
+class VaultServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, store: Storage):
+        self.store = store
+        self.ops = _ops(store)
+        _remove_stale_socket(path)
+        old_umask = os.umask(0o177)  # socket is owner-only (0600)
+        try:
+            super().__init__(path, _Handler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+def _remove_stale_socket(path: str):
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.remove(path)  # nobody listening: left over from a crash
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"another vault daemon is already listening on {path}")
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Pixie Vault resident daemon")
+    ap.add_argument("--socket", help="socket path (default: daemon.socket in config.json)")
+    ap.add_argument("--vault", help="path to vault.json")
+    ap.add_argument("--config", help="path to config.json")
+    args = ap.parse_args(argv)
+
+    try:
+        store = Storage(data_path=args.vault, config_path=args.config)
+    except crypto.VaultLocked:
+        password = os.environ.get("PIXIE_PASSWORD")
+        if password is None:
+            if not sys.stdin.isatty():
+                print("vaultd: vault is encrypted; set PIXIE_PASSWORD or run from a terminal", file=sys.stderr)
+                return 1
+            password = getpass.getpass("Master password: ")
+        try:
+            store = Storage(data_path=args.vault, config_path=args.config, password=password)
+        except crypto.CryptoError as e:
+            print(f"vaultd: {e}", file=sys.stderr)
+            return 1
+    path = (args.socket or os.environ.get("PIXIE_SOCKET")
+            or store.config.get("daemon", {}).get("socket") or default_socket_path())
+    try:
+        server = VaultServer(path, store)
+    except RuntimeError as e:
+        print(f"vaultd: {e}", file=sys.stderr)
+        return 1
+
+    def stop(*_):
+        # shutdown() blocks until serve_forever returns, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Pick up what other processes (the CLI without --daemon, a second app)
+    # save to the same vault
+    stopped = threading.Event()
+    interval = store.config.get("storage", {}).get("refresh_ms", 2000) / 1000.0
+    def refresh_loop():
+        while not stopped.wait(interval):
+            try:
+                store.refresh(wait=False)
+                store.snapshot_if_due()
+            except Exception as e:
+                print(f"vaultd: refresh failed: {e}", file=sys.stderr, flush=True)
+    if interval > 0:
+        threading.Thread(target=refresh_loop, name="vault-refresh", daemon=True).start()
+
+    print(f"vaultd: serving {len(store.all_entries())} entries on {path}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        stopped.set()
+        server.server_close()
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
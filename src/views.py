@@ -0,0 +1,110 @@
+# src/views.py
+# Read-only versions of the vault for readers that shouldn't hold the storage
+# lock or see half an edit: search, backups, duplicate scans.
+#
+#   version 7:  (bucket 0, bucket 1, ...)
+#                  │          └───────────── shared ─┐
+#   version 8:  (bucket 0', bucket 1, ...)  <────────┘
+#                  └─ copy of bucket 0 with the one changed entry replaced
+#
+# Entries are spread over BUCKETS dicts by a hash of their id. Publishing a new
+# version copies only the buckets holding changed entries, plus those entries;
+# everything else is shared with the previous version, so a version costs
+# what changed, not the size of the vault. A published version is never
+# modified, so any thread can read it without locking.
+import zlib
+from typing import Dict, Iterator, List, Tuple
+
+from model import Entry
+
+BUCKETS = 256
+
+def _bucket(entry_id: str) -> int:
+    return zlib.crc32(entry_id.encode("utf-8")) % BUCKETS
+
+class VaultView:
+    """One version of the vault. Its entries are private copies: treat them as
+    read-only (edit through Storage, which publishes a new version)."""
+    __slots__ = ("version", "_buckets", "_size", "_ordered")
+
+    def __init__(self, version: int, buckets: Tuple[Dict[str, Entry], ...], size: int):
+        self.version = version
+        self._buckets = buckets
+        self._size = size
+        self._ordered: List[Entry] | None = None
+
+    @classmethod
+    def build(cls, entries: Iterator[Entry], version: int = 1) -> "VaultView":
+        buckets: Tuple[Dict[str, Entry], ...] = tuple({} for _ in range(BUCKETS))
+        for e in entries:
+            buckets[_bucket(e.id)][e.id] = e.copy()
+        return cls(version, buckets, sum(len(b) for b in buckets))
+
+    def evolve(self, changes: Dict[str, Entry | None]) -> "VaultView":
+        """The next version: `changes` maps id -> entry as it is now (copied
+        here), or None if it was deleted."""
+        buckets = list(self._buckets)
+        copied = set()
+        size = self._size
+        replaced: Dict[str, Entry | None] = {}  # entries that were in this version
+        added: List[Entry] = []
+        for entry_id, e in changes.items():
+            i = _bucket(entry_id)
+            if i not in copied:
+                buckets[i] = dict(buckets[i])
+                copied.add(i)
+            old = buckets[i].get(entry_id)
+            if e is None:
+                if old is not None:
+                    del buckets[i][entry_id]
+                    replaced[entry_id] = None
+                    size -= 1
+                continue
+            e = buckets[i][entry_id] = e.copy()
+            if old is None:
+                added.append(e)
+                size += 1
+            elif old.created_at == e.created_at:
+                replaced[entry_id] = e
+            else:
+                replaced[entry_id] = None  # moves: re-inserted like a new one
+                added.append(e)
+        view = VaultView(self.version + 1, tuple(buckets), size)
+        view._ordered = self._next_order(replaced, added)
+        return view
+
+    def _next_order(self, replaced: Dict[str, Entry | None], added: List[Entry]) -> List[Entry] | None:
+        # Patch this version's order instead of sorting again: edits keep
+        # their place and new entries are usually the newest
+        if self._ordered is None:
+            return None
+        out = [replaced.get(e.id, e) for e in self._ordered] if replaced else list(self._ordered)
+        if None in replaced.values():
+            out = [e for e in out if e is not None]
+        if added:
+            key = lambda e: (e.created_at or 0, e.id)
+            added.sort(key=key)
+            if out and key(added[0]) < key(out[-1]):
+                return None  # lands in the middle: sorted on first use
+            out.extend(added)
+        return out
+
+    def get(self, entry_id: str) -> Entry | None:
+        return self._buckets[_bucket(entry_id)].get(entry_id)
+
+    def __contains__(self, entry_id: object) -> bool:
+        return isinstance(entry_id, str) and entry_id in self._buckets[_bucket(entry_id)]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Entry]:
+        return iter(self.entries())
+
+    def entries(self) -> List[Entry]:
+        """Every entry, oldest first (the order the vault keeps them in)."""
+        if self._ordered is None:
+            out = [e for b in self._buckets for e in b.values()]
+            out.sort(key=lambda e: (e.created_at or 0, e.id))
+            self._ordered = out  # a benign race: two threads may both build it
+        return self._ordered
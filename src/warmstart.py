@@ -0,0 +1,50 @@
+# src/warmstart.py
+# Boot handshake between the Pixie boot animation and the app.
+#
+# The app can start while mpv is still playing, load the vault and build its
+# window hidden, then show itself once the animation signals that it is done.
+# The signal is a plain file so anything (systemd, a shell script, a test)
+# can drive it:  python3 src/warmstart.py done
+import os, sys, time
+
+READY_FILE = os.environ.get("PIXIE_READY_FILE", "/tmp/pixie-boot.done")
+
+def boot_time() -> float:
+    """Wall-clock time the machine booted, or 0 if it can't be determined.
+    Ready files older than this are left over from a previous boot."""
+    try:
+        with open("/proc/uptime", "r") as f:
+            return time.time() - float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def signal_ready(path: str = READY_FILE):
+    """Mark the boot animation as finished."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(str(time.time()))
+    os.replace(tmp, path)
+
+def clear(path: str = READY_FILE):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def is_ready(path: str = READY_FILE, since: float = 0.0) -> bool:
+    """True once the ready file exists and was written after `since`."""
+    try:
+        return os.path.getmtime(path) >= since
+    except OSError:
+        return False
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "done"
+    if cmd == "done":
+        signal_ready()
+    elif cmd == "clear":
+        clear()
+    else:
+        print("usage: warmstart.py [done|clear]")
+        sys.exit(2)
@@ -0,0 +1,93 @@
+# tests/test_storage.py
+# Two Storage instances on one vault, as the app and the daemon (or two
+# devices on a shared folder) would have it.
+#
+#   python3 -m unittest discover tests
+import errno, json, os, shutil, sys, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import rekey
+from storage import Storage
+
+class TwoWritersTest(unittest.TestCase):
+    def new_vault(self) -> str:
+        folder = tempfile.mkdtemp(prefix="pixie-test-")
+        self.addCleanup(shutil.rmtree, folder, True)
+        return folder
+
+    def open(self, folder: str, layout: str, password: str | None = None) -> Storage:
+        config = os.path.join(folder, "config.json")
+        with open(config, "w", encoding="utf-8") as f:
+            json.dump({"storage": {"layout": layout, "write_behind": False}}, f)
+        store = Storage(os.path.join(folder, "vault.json"), config, password=password)
+        self.addCleanup(store.close)
+        return store
+
+    def test_rotation_merges_other_writers(self):
+        for layout in ("json", "sharded"):
+            with self.subTest(layout=layout):
+                folder = self.new_vault()
+                first = self.open(folder, layout)
+                with first.batch():
+                    ids = [first.add_entry({"name": f"e{i}", "password": f"pw{i}"}, {}) for i in range(50)]
+                second = self.open(folder, layout)
+                added = []
+                install = first._install_key
+
+                def other_writer_saves_first(*args):
+                    added.append(second.add_entry({"name": "late", "password": "late-pw"}, {}))
+                    second.save()
+                    install(*args)
+
+                first._install_key = other_writer_saves_first
+                rotation = rekey.Rotation(first, "new password")
+                rotation.run()
+                self.assertTrue(rotation.finished)
+
+                reopened = self.open(folder, layout, password="new password")
+                self.assertTrue(reopened.encrypted)
+                self.assertEqual(reopened.get_entry(added[0]).password, "late-pw")
+                self.assertEqual({e.id for e in reopened.all_entries()}, set(ids) | set(added))
+
+    def test_history_numbering_across_writers(self):
+        # Each writer edits without refreshing first, so every save also
+        # merges the other's edit into its history
+        folder = self.new_vault()
+        first = self.open(folder, "json")
+        entry_id = first.add_entry({"name": "shared", "password": "v0"}, {})
+        second = self.open(folder, "json")
+        for i in range(1, 21):
+            store = first if i % 2 else second
+            store.update_entry(entry_id, {"password": f"v{i}"}, {})
+            store.save()
+
+        versions = self.open(folder, "json").entry_history(entry_id)
+        self.assertEqual([v["rev"] for v in versions], list(range(1, len(versions) + 1)))
+        for v in versions:
+            self.assertEqual(first.history.version(entry_id, v["rev"]), v["entry"])
+        passwords = [v["entry"]["password"] for v in versions]
+        self.assertTrue(all(a != b for a, b in zip(passwords, passwords[1:])), passwords)
+
+    def test_failed_rotation_keeps_old_key(self):
+        folder = self.new_vault()
+        first = self.open(folder, "json")
+        first.add_entry({"name": "before", "password": "pw"}, {})
+
+        def disk_full(job):
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+        first._write_save = disk_full
+        with self.assertRaises(OSError):
+            rekey.Rotation(first, "new password").run()
+        del first._write_save
+        self.assertFalse(first.encrypted)
+
+        entry_id = first.add_entry({"name": "after", "password": "after-pw"}, {})
+        first.save()
+        second = self.open(folder, "json")
+        self.assertEqual(second.get_entry(entry_id).password, "after-pw")
+        self.assertEqual(len(second.all_entries()), 2)
+
+if __name__ == "__main__":
+    unittest.main()